@@ -7,6 +7,7 @@ Full FastAPI service:
  - /predict (single log -> returns risk, factors)
  - /predict/window (array of points)
  - /predict/live/{session_id} (session-level prediction using saved CSV)
+ - /health, /health/live, /health/ready (liveness vs. model readiness)
  - SQLite persistence of predictions/alerts
  - SHAP explanations for isolation forest
 """
@@ -14,31 +15,42 @@ import os
 import time
 import json
 import math
-from collections import defaultdict, deque
+import threading
+from functools import partial
 
 import joblib
 import asyncio
 import sqlite3  
-import shap
 import numpy as np
 import pandas as pd
-from fastapi import FastAPI, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
 from datetime import datetime, timedelta, timezone
-from shapely.geometry import shape, Point
-from shapely.prepared import prep
 from typing import List, Optional
 from math import radians, sin, cos, asin, sqrt
 
 from feature_engineering import (
     DEFAULT_HOTSPOT_RADIUS,
-    compute_session_features,
+    SessionFeatureState,
+    compute_session_features_batch,
     load_hotspot_index,
 )
+from hotspot_grid import DEFAULT_GRID_SIZE, HotspotGrid, LiveHotspotGrid
+from scoring import CompiledIsolationForest, CoreSampleIndex
+from model_store import BUNDLE_FILE, bundle_is_current, load_model_bundle
+from point_store import PointStore, load_legacy_csv
+from zone_index import DynamicZoneRegistry, ZoneIndex
+from worker_pool import BoundedExecutor, Overloaded, ShardedExecutor
+from explanations import EXPLAIN_MODES, DeferredExplanations, ShapExplanations
+from session_state import make_session_store
+from group_separation import GroupSeparation
+from metrics import RISK_BUCKETS, metrics
+from profiler import ProfilerMiddleware, endpoint_codes, profiler
 
 BASE_DIR = os.path.dirname(__file__)
-DATA_DIR = os.path.join(BASE_DIR, "data")
+# zones.json, the point store, session state and hotspot snapshots live here (benchmarks use a scratch dir)
+DATA_DIR = os.getenv("DETECTOR_DATA_DIR", os.path.join(BASE_DIR, "data"))
 MODEL_DIR = os.path.join(BASE_DIR, "model")
 DB_PATH = os.path.join(BASE_DIR, "predictions.db")  
 os.makedirs(DATA_DIR, exist_ok=True)
@@ -46,24 +58,139 @@ os.makedirs(DATA_DIR, exist_ok=True)
 from dotenv import load_dotenv
 load_dotenv(os.path.join(BASE_DIR, '.env'))
 # Import DB functions
-from database import init_db as db_init, save_prediction_row as db_save_prediction_row, pool
+from database import init_db as db_init, fetch_recent_predictions, ping as db_ping, prediction_writer
 
 
 # Load models + artifacts
+# MODEL_LOADING: eager (load everything at import, as before) | background (start serving
+# at once, load models in a warmup thread; /health/ready turns 200 when done) | lazy (load on
+# the first scoring request). shap is only imported when the first explanation is computed.
+MODEL_LOADING = os.getenv("MODEL_LOADING", "eager").strip().lower()
+if MODEL_LOADING not in ("eager", "background", "lazy"):
+    print(f"[model] Unknown MODEL_LOADING={MODEL_LOADING!r}, using 'eager'")
+    MODEL_LOADING = "eager"
+# compiled, memory-mapped artifacts written by train_model.py / model_store.py; empty disables
+MODEL_BUNDLE_PATH = os.getenv("MODEL_BUNDLE_PATH", os.path.join(MODEL_DIR, BUNDLE_FILE))
 
-scaler = joblib.load(os.path.join(MODEL_DIR, "scaler.pkl"))
-iso = joblib.load(os.path.join(MODEL_DIR, "isolation_forest.pkl"))
-dbs = joblib.load(os.path.join(MODEL_DIR, "dbscan.pkl"))
-feature_cols = joblib.load(os.path.join(MODEL_DIR, "feature_cols.pkl"))  # this contains 'session_id' too in our train script
+scaler = None
+iso = None  # sklearn IsolationForest; unpickled only for SHAP or when the bundle is missing
+dbs = None
+feature_cols = None  # this contains 'session_id' too in our train script
+compiled_iso = None
+core_index = None
+_models_ready = threading.Event()
+_models_lock = threading.Lock()
+_models_info = {"source": None, "seconds": None, "error": None}
 
-# create SHAP explainer
+# KD-tree over DBSCAN core samples; persisted by train_model.py next to dbscan.pkl
+DBSCAN_INDEX_PATH = os.path.join(MODEL_DIR, "dbscan_index.pkl")
+
+def _load_models_from_pickles():
+    global scaler, iso, dbs, feature_cols, compiled_iso, core_index
+    scaler = joblib.load(os.path.join(MODEL_DIR, "scaler.pkl"))
+    iso = joblib.load(os.path.join(MODEL_DIR, "isolation_forest.pkl"))
+    dbs = joblib.load(os.path.join(MODEL_DIR, "dbscan.pkl"))
+    feature_cols = joblib.load(os.path.join(MODEL_DIR, "feature_cols.pkl"))
+
+    # compile the forest once into flat node arrays for single-pass scoring
+    try:
+        compiled_iso = CompiledIsolationForest.from_sklearn(iso)
+    except Exception as e:
+        print(f"[model] Falling back to sklearn IsolationForest scoring: {e}")
+        compiled_iso = None
+
+    core_index = None
+    try:
+        if os.path.exists(DBSCAN_INDEX_PATH):
+            core_index = joblib.load(DBSCAN_INDEX_PATH)
+            core = getattr(dbs, "components_", None)
+            if core is None or core_index.n_core != len(core) or core_index.eps != float(dbs.eps):
+                core_index = None  # stale index from an older training run
+        if core_index is None:
+            core_index = CoreSampleIndex.from_dbscan(dbs)
+    except Exception as e:
+        print(f"[model] DBSCAN core index unavailable: {e}")
+        core_index = None
+
+def _load_models_from_bundle():
+    """True when a current bundle was loaded; stale or unreadable bundles fall back to the pickles."""
+    global scaler, feature_cols, compiled_iso, core_index
+    if not MODEL_BUNDLE_PATH or not os.path.exists(MODEL_BUNDLE_PATH):
+        return False
+    try:
+        bundle = load_model_bundle(MODEL_BUNDLE_PATH)
+        if not bundle_is_current(bundle.header, MODEL_DIR):
+            print(f"[model] {MODEL_BUNDLE_PATH} is older than the pickles, ignoring it")
+            return False
+    except Exception as e:
+        print(f"[model] Model bundle unreadable, loading pickles: {e}")
+        return False
+    scaler, compiled_iso, core_index, feature_cols = bundle.scaler, bundle.compiled_iso, bundle.core_index, bundle.feature_cols
+    return True
+
+def _load_models():
+    """Load the scoring artifacts once (thread-safe); later calls return immediately."""
+    if _models_ready.is_set():
+        return
+    with _models_lock:
+        if _models_ready.is_set():
+            return
+        started = time.perf_counter()
+        try:
+            source = "bundle" if _load_models_from_bundle() else "pickles"
+            if source == "pickles":
+                _load_models_from_pickles()
+        except Exception as e:
+            _models_info["error"] = str(e)
+            raise
+        shap_explanations.feature_names = [c for c in feature_cols if c != 'session_id']
+        _models_info.update(source=source, seconds=round(time.perf_counter() - started, 4), error=None)
+        _models_ready.set()
+
+def _ensure_models():
+    if not _models_ready.is_set():
+        _load_models()
+
+def _sklearn_iso():
+    """The fitted sklearn IsolationForest (SHAP and the no-compiled-forest fallback need it)."""
+    global iso
+    if iso is None:
+        with _models_lock:
+            if iso is None:
+                iso = joblib.load(os.path.join(MODEL_DIR, "isolation_forest.pkl"))
+    return iso
+
+def _build_explainer():
+    import shap  # ~2s to import; deferred until the first explanation
+    return shap.TreeExplainer(_sklearn_iso())
+
+HOTSPOT_INDEX_PATH = os.path.join(MODEL_DIR, "hotspot_index.json")
+HOTSPOT_GRID_PATH = os.path.join(MODEL_DIR, "hotspot_index.bin")
+# snapshots of the live grid (training grid + incidents reported since)
+HOTSPOT_LIVE_PATH = os.getenv("HOTSPOT_LIVE_PATH", os.path.join(DATA_DIR, "hotspot_index.live.bin"))
 try:
-    explainer = shap.TreeExplainer(iso)
+    HOTSPOT_HALF_LIFE_HOURS = max(0.0, float(os.getenv("HOTSPOT_HALF_LIFE_HOURS", "0")))
+    HOTSPOT_SNAPSHOT_SECONDS = max(1.0, float(os.getenv("HOTSPOT_SNAPSHOT_SECONDS", "300")))
 except Exception:
-    explainer = None  # fallback later
+    HOTSPOT_HALF_LIFE_HOURS, HOTSPOT_SNAPSHOT_SECONDS = 0.0, 300.0
 
-HOTSPOT_INDEX_PATH = os.path.join(MODEL_DIR, "hotspot_index.json")
-hotspot_index = load_hotspot_index(HOTSPOT_INDEX_PATH)
+def _load_hotspot_grid():
+    # newest of: live snapshot, memory-mapped binary grid, JSON (no per-cell parsing for the .bin files)
+    candidates = [p for p in (HOTSPOT_LIVE_PATH, HOTSPOT_GRID_PATH, HOTSPOT_INDEX_PATH) if os.path.exists(p)]
+    for path in sorted(candidates, key=os.path.getmtime, reverse=True):
+        try:
+            return load_hotspot_index(path)
+        except Exception as e:
+            print(f"[hotspots] Could not load {path}: {e}")
+    return None
+
+_hotspot_base = _load_hotspot_grid()
+# incidents reported at runtime are folded into the live grid (POST /hotspots/incidents);
+# without a trained grid the live one starts empty and scoring is unchanged until reports arrive
+hotspot_index = LiveHotspotGrid(
+    _hotspot_base if _hotspot_base is not None else HotspotGrid.from_points([], [], [], DEFAULT_GRID_SIZE),
+    half_life_seconds=HOTSPOT_HALF_LIFE_HOURS * 3600.0,
+)
 try:
     HOTSPOT_RADIUS = max(0, int(os.getenv("HOTSPOT_RADIUS_CELLS", str(DEFAULT_HOTSPOT_RADIUS))))
 except Exception:
@@ -72,74 +199,192 @@ except Exception:
 # In-memory & persisted zones
 ZONES_FILE = os.path.join(DATA_DIR, "zones.json")
 static_zones = []
-static_zone_shapes = []
-dynamic_zones = {}
+dynamic_zones = DynamicZoneRegistry()  # parsed + prepared at creation, heap-ordered expiry
+# STRtree index over static + dynamic zones; rebuilt whenever either set changes
+zone_index = ZoneIndex()
 
 def _load_static_zones():
-    global static_zones, static_zone_shapes
+    global static_zones
     static_zones = []
-    static_zone_shapes = []
     if os.path.exists(ZONES_FILE):
         try:
             static_zones = json.load(open(ZONES_FILE, "r"))
         except Exception as e:
             print(f"[zones] Failed to load zones.json: {e}")
             static_zones = []
-    # build prepared shapes for faster lookup & tolerant validation
-    for z in static_zones:
-        try:
-            geom = shape(z['geojson'])
-            static_zone_shapes.append((z, prep(geom)))
-        except Exception as e:
-            print(f"[zones] Skipping invalid zone {z.get('zone_id')}: {e}")
+    zone_index.set_static(static_zones)
+
+_dynamic_index_lock = threading.Lock()
+
+def _refresh_dynamic_zone_index():
+    # snapshot and install together, so a slower refresh never installs an older snapshot
+    with _dynamic_index_lock:
+        zone_index.set_dynamic(dynamic_zones.items())
 
 _load_static_zones()
 
-# Initialize MySQL DB
-db_init()
+# Initialize MySQL DB (background/lazy loading does this in the warmup thread)
+if MODEL_LOADING == "eager":
+    db_init()
 
 # -------------------------
 # Utilities
 # -------------------------
-def haversine_km(lat1, lon1, lat2, lon2):
-    R = 6371.0
-    dlat = radians(lat2 - lat1)
-    dlon = radians(lon2 - lon1)
-    a = sin(dlat/2)**2 + cos(radians(lat1))*cos(radians(lat2))*sin(dlon/2)**2
-    c = 2 * asin(math.sqrt(a))
-    return R * c
-
-# Use MySQL save_prediction_row
-
-def load_sessions_from_csv():
-    # look for gps_logs.csv and gps_data.csv
-    logs_file = os.path.join(DATA_DIR, "gps_logs.csv")
-    data_file = os.path.join(DATA_DIR, "gps_data.csv")
-    dfs = []
-    if os.path.exists(logs_file):
-        df1 = pd.read_csv(logs_file)
-        df1['timestamp'] = pd.to_datetime(df1['timestamp']).dt.strftime("%Y-%m-%dT%H:%M:%S")
-        dfs.append(df1)
-    if os.path.exists(data_file):
-        df2 = pd.read_csv(data_file, header=None)
-        if df2.shape[1] == 4:
-            df2.columns = ['session_id','lat','lon','timestamp']
-            df2['timestamp'] = pd.to_datetime(df2['timestamp']).dt.strftime("%Y-%m-%dT%H:%M:%S")
-            dfs.append(df2)
-    if dfs:
-        return pd.concat(dfs, ignore_index=True)
-    return pd.DataFrame(columns=['session_id','lat','lon','timestamp'])
+# GPS points are ingested into a day-partitioned, session-sharded binary store;
+# the legacy CSVs stay readable as seed history.
+POINTS_DIR = os.path.join(DATA_DIR, "points")
+LEGACY_GPS_FILES = [os.path.join(DATA_DIR, "gps_logs.csv"), os.path.join(DATA_DIR, "gps_data.csv")]
+try:
+    POINT_STORE_SHARDS = max(1, int(os.getenv("POINT_STORE_SHARDS", "16")))
+    POINT_STORE_FLUSH_ROWS = max(1, int(os.getenv("POINT_STORE_FLUSH_ROWS", "1000")))
+    POINT_STORE_FLUSH_SECONDS = max(0.05, float(os.getenv("POINT_STORE_FLUSH_MS", "1000")) / 1000.0)
+except Exception:
+    POINT_STORE_SHARDS, POINT_STORE_FLUSH_ROWS, POINT_STORE_FLUSH_SECONDS = 16, 1000, 1.0
+# the per-session index is snapshotted on shutdown so a restart only scans new data; it holds at
+# most POINT_INDEX_MAX_SESSIONS sessions (0 = unbounded), older ones are rebuilt from disk when read
+POINT_INDEX_FILE = os.getenv("POINT_INDEX_FILE", os.path.join(POINTS_DIR, "session_index.pkl"))
+try:
+    POINT_INDEX_MAX_SESSIONS = max(0, int(os.getenv("POINT_INDEX_MAX_SESSIONS", "100000")))
+except Exception:
+    POINT_INDEX_MAX_SESSIONS = 100000
+point_store = PointStore(
+    POINTS_DIR,
+    n_shards=POINT_STORE_SHARDS,
+    flush_rows=POINT_STORE_FLUSH_ROWS,
+    flush_seconds=POINT_STORE_FLUSH_SECONDS,
+    index_path=POINT_INDEX_FILE or None,
+    max_indexed_sessions=POINT_INDEX_MAX_SESSIONS or None,
+)
+_legacy_points_cache = {"key": None, "df": None, "index": {}}
+
+def _legacy_points():
+    """Legacy CSV history and its session_id -> row positions index, re-read only when a file changes."""
+    key = tuple(os.path.getmtime(f) if os.path.exists(f) else None for f in LEGACY_GPS_FILES)
+    if _legacy_points_cache["key"] != key:
+        frames = [load_legacy_csv(f) for f in LEGACY_GPS_FILES]
+        df = pd.concat(frames, ignore_index=True)
+        _legacy_points_cache["df"] = df
+        _legacy_points_cache["index"] = df.groupby("session_id", sort=False).indices if not df.empty else {}
+        _legacy_points_cache["key"] = key
+    return _legacy_points_cache["df"], _legacy_points_cache["index"]
+
+def load_session_points(session_id):
+    """All known points of one session (legacy CSVs + point store), oldest first."""
+    stored = point_store.read_session(session_id)
+    legacy_df, legacy_index = _legacy_points()
+    rows = legacy_index.get(session_id)
+    if rows is None or not len(rows):
+        return stored
+    legacy = legacy_df.iloc[rows]
+    df = pd.concat([legacy, stored], ignore_index=True) if not stored.empty else legacy
+    return df.sort_values("timestamp", kind="mergesort").reset_index(drop=True)
 
 # -------------------------
 # App state trackers
 # -------------------------
-last_seen = {}  # session_id -> datetime
-group_members = {}  # group_id -> { user_id: (lat, lon, timestamp) }
 try:
     SESSION_HISTORY_SIZE = max(10, int(os.getenv("SESSION_HISTORY_SIZE", "120")))
 except Exception:
     SESSION_HISTORY_SIZE = 120
-session_history = defaultdict(lambda: deque(maxlen=SESSION_HISTORY_SIZE))
+
+def _new_session_state():
+    return SessionFeatureState(
+        maxlen=SESSION_HISTORY_SIZE,
+        hotspot_index=hotspot_index,
+        hotspot_radius=HOTSPOT_RADIUS,
+    )
+
+# Session windows + last-seen times, group member locations and dynamic zones.
+# "memory" keeps them in this process; "sqlite" shares them between workers
+# (run several uvicorn workers / processes behind router.py for session affinity).
+SESSION_STATE_BACKEND = os.getenv("SESSION_STATE_BACKEND", "memory")
+SESSION_STATE_PATH = os.getenv("SESSION_STATE_PATH", os.path.join(DATA_DIR, "session_state.db"))
+# sessions/groups idle for SESSION_TTL_SECONDS are evicted; SESSION_MAX caps the count (LRU)
+try:
+    SESSION_TTL_SECONDS = max(0.0, float(os.getenv("SESSION_TTL_SECONDS", "21600")))
+    SESSION_MAX = max(0, int(os.getenv("SESSION_MAX", "200000")))
+except Exception:
+    SESSION_TTL_SECONDS, SESSION_MAX = 21600.0, 200000
+# group rule: any two members more than GROUP_DISTANCE_KM apart; members silent for
+# GROUP_MEMBER_STALE_SECONDS (by point timestamps, 0 = never) stop counting
+try:
+    GROUP_DISTANCE_KM = float(os.getenv("GROUP_DISTANCE_KM", "10"))
+    GROUP_MEMBER_STALE_SECONDS = max(0.0, float(os.getenv("GROUP_MEMBER_STALE_SECONDS", "1800")))
+except Exception:
+    GROUP_DISTANCE_KM, GROUP_MEMBER_STALE_SECONDS = 10.0, 1800.0
+# shared backends poll the zones version this often (on the IO pool, off the event loop)
+try:
+    ZONE_SYNC_SECONDS = max(0.1, float(os.getenv("ZONE_SYNC_SECONDS", "1.0")))
+except Exception:
+    ZONE_SYNC_SECONDS = 1.0
+session_store = make_session_store(
+    SESSION_STATE_BACKEND,
+    _new_session_state,
+    path=SESSION_STATE_PATH,
+    hotspot_index=hotspot_index,
+    ttl_seconds=SESSION_TTL_SECONDS or None,
+    max_sessions=SESSION_MAX or None,
+    group_factory=partial(GroupSeparation, GROUP_DISTANCE_KM, GROUP_MEMBER_STALE_SECONDS or None),
+)
+# the shared zones version last synced, and the version of every shared zone this worker holds
+_dynamic_zones_seen = {"version": session_store.zones_version(), "zones": {}}
+
+def _sync_dynamic_zones():
+    """Pick up dynamic zones published, replaced or dropped by other workers (shared backends only).
+
+    Only (zone_id, version) pairs are read to diff against the zones already
+    held; payloads are fetched and parsed for new or changed zones alone.
+    """
+    version = session_store.zones_version()
+    if version == _dynamic_zones_seen["version"]:
+        return
+    seen = _dynamic_zones_seen["zones"]
+    shared = session_store.zone_versions()
+    changed = [zone_id for zone_id, v in shared.items() if seen.get(zone_id) != v]
+    # a zone published after ``version`` was read may be missing from ``shared``: keep it
+    dropped = [zone_id for zone_id, v in list(seen.items()) if v <= version and zone_id not in shared]
+    now = datetime.now(timezone.utc)
+    for zone_id, payload in session_store.zone_payloads(changed) if changed else []:
+        seen[zone_id] = shared[zone_id]
+        expires_at = datetime.fromisoformat(payload["expires_at"])
+        if expires_at <= now:
+            continue
+        try:
+            dynamic_zones.add(
+                zone_id, payload["geojson"], expires_at,
+                name=payload.get("name"), risk_level=payload.get("risk_level"),
+            )
+        except ValueError as e:
+            print(f"[zones] Skipping shared dynamic zone {zone_id}: {e}")
+    for zone_id in dropped:
+        seen.pop(zone_id, None)
+        dynamic_zones.remove(zone_id)
+    expired = dynamic_zones.pop_expired(now)
+    if changed or dropped or expired:
+        _refresh_dynamic_zone_index()
+    _dynamic_zones_seen["version"] = version
+
+# -------------------------
+# Execution model
+# -------------------------
+# Scoring runs on session-sharded lanes: a session always maps to the same
+# single-threaded lane, so its points are featurised in arrival order while
+# other sessions are scored in parallel. Blocking DB calls use a separate
+# bounded pool. Both pools reject work with 429 once their backlog is full.
+try:
+    SCORING_WORKERS = max(1, int(os.getenv("SCORING_WORKERS", str(min(8, os.cpu_count() or 1)))))
+    SCORING_MAX_PENDING = max(1, int(os.getenv("SCORING_MAX_PENDING", "256")))
+    DB_WORKERS = max(1, int(os.getenv("DB_WORKERS", "4")))
+    DB_MAX_PENDING = max(1, int(os.getenv("DB_MAX_PENDING", "128")))
+except Exception:
+    SCORING_WORKERS, SCORING_MAX_PENDING, DB_WORKERS, DB_MAX_PENDING = 4, 256, 4, 128
+scoring_lanes = ShardedExecutor(SCORING_WORKERS, SCORING_MAX_PENDING, name="scoring")
+io_pool = BoundedExecutor(DB_WORKERS, DB_MAX_PENDING, name="io")
+# while a profiling run is active, pool tasks carry the submitting request's endpoint/session tag
+scoring_lanes.task_hook = io_pool.task_hook = profiler.bind
+
+def _overloaded(exc):
+    return HTTPException(status_code=429, detail=str(exc), headers={"Retry-After": "1"})
 
 # -------------------------
 # API models
@@ -155,6 +400,15 @@ class GPSLog(BaseModel):
 class BatchIngest(BaseModel):
     points: List[GPSLog]
 
+class IncidentReport(BaseModel):
+    lat: float
+    lon: float
+    severity_score: float
+    timestamp: Optional[str] = None  # ISO; defaults to now
+
+class IncidentBatch(BaseModel):
+    incidents: List[IncidentReport]
+
 class ZonePayload(BaseModel):
     zones: List[dict]
 
@@ -174,49 +428,25 @@ app = FastAPI(
     redoc_url=None,     # disable ReDoc UI
     openapi_url=None    # disable OpenAPI schema endpoint
 )
+app.add_middleware(ProfilerMiddleware, profiler=profiler, routes_source=app.router)
 
 # -------------------------
 # Helpers for zones
 # -------------------------
 def point_in_any_zone(lat, lon):
     """Return zone metadata if point lies inside or on boundary of any zone.
-    Uses prepared geometries for performance and also treats boundary (intersects) as inside.
+    Dynamic zones take precedence; boundary points count as inside.
     """
-    p = Point(lon, lat)
-    # dynamic zones first
-    for zid, zd in dynamic_zones.items():
-        try:
-            poly = shape(zd['geojson'])
-            if poly.contains(p) or poly.intersects(p):
-                return {"zone_id": zid, "name": zd.get('name'), "risk_level": zd.get('risk_level'), "dynamic": True}
-        except Exception:
-            continue
-    # static prepared
-    for z, prepped in static_zone_shapes:
-        try:
-            if prepped.contains(p) or prepped.intersects(p):
-                return {"zone_id": z.get('zone_id'), "name": z.get('name'), "risk_level": z.get('risk_level'), "dynamic": False}
-        except Exception:
-            continue
-    return None
+    return zone_index.lookup(lat, lon)
+
+def points_in_any_zone(lats, lons):
+    """Vectorised point_in_any_zone: one STRtree query for all points."""
+    return zone_index.lookup_many(lats, lons)
 
 def min_distance_km_to_static_zones(lat, lon):
-    """Compute approximate min distance in KM from point to any static zone polygon exterior vertices.
+    """Distance in KM from point to the nearest static zone boundary edge.
     If no zones, returns large number."""
-    if not static_zones:
-        return 9999.0
-    min_km = 9999.0
-    for z in static_zones:
-        try:
-            coords_rings = z['geojson']['coordinates']
-            for ring in coords_rings:
-                for (x, y) in ring:  # (lon, lat)
-                    d = haversine_km(lat, lon, y, x)
-                    if d < min_km:
-                        min_km = d
-        except Exception:
-            continue
-    return min_km
+    return zone_index.static_edges.distance_km(lat, lon)
 
 def detect_open_water(lat, lon, zone_present):
     """Heuristic open-water detection.
@@ -227,16 +457,18 @@ def detect_open_water(lat, lon, zone_present):
     """
     if zone_present:
         return 0
-    try:
-        threshold_km = float(os.getenv('OPEN_WATER_DISTANCE_KM', '20'))
-    except Exception:
-        threshold_km = 20.0
-    dmin = min_distance_km_to_static_zones(lat, lon)
     # Optional simple India bounding box example (customize per deployment)
     # If coordinate roughly inside India main bounds but far from any zone, still may not be water; keep conservative.
     india_bounds = (6.0, 38.0, 68.0, 98.0)  # (lat_min, lat_max, lon_min, lon_max)
     in_india_box = (india_bounds[0] <= lat <= india_bounds[1] and india_bounds[2] <= lon <= india_bounds[3])
-    if dmin > threshold_km and not in_india_box:
+    if in_india_box:
+        return 0
+    try:
+        threshold_km = float(os.getenv('OPEN_WATER_DISTANCE_KM', '20'))
+    except Exception:
+        threshold_km = 20.0
+    # edge index only inspects segments inside the threshold window (early exit)
+    if zone_index.static_edges.nearest_within(lat, lon, threshold_km) is None:
         return 1
     return 0
 
@@ -244,46 +476,145 @@ def detect_open_water(lat, lon, zone_present):
 # Background cleanup for dynamic zones
 # -------------------------
 async def cleanup_dynamic_zones():
+    # lookups already ignore expired zones; this only reclaims them from the index
     while True:
         now = datetime.now(timezone.utc)
-        remove = []
-        for zid, zd in list(dynamic_zones.items()):
-            if zd['expires_at'] <= now:
-                remove.append(zid)
-        for zid in remove:
-            del dynamic_zones[zid]
-        await asyncio.sleep(30)
+        if dynamic_zones.pop_expired(now):
+            _refresh_dynamic_zone_index()
+        delay = 30.0
+        nxt = dynamic_zones.next_expiry()
+        if nxt is not None:
+            delay = min(delay, max(0.5, nxt - now.timestamp()))
+        await asyncio.sleep(delay)
+
+async def sync_shared_zones():
+    # zones published by other workers; the version query is a database read, so never on the loop
+    while True:
+        await asyncio.sleep(ZONE_SYNC_SECONDS)
+        try:
+            await io_pool.run(_sync_dynamic_zones)
+        except Overloaded:
+            pass  # retried on the next tick
+        except Exception as e:
+            print(f"[zones] Shared zone sync failed: {e}")
+
+async def evict_idle_sessions():
+    interval = min(60.0, max(1.0, SESSION_TTL_SECONDS / 4)) if SESSION_TTL_SECONDS else 60.0
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await io_pool.run(session_store.evict_idle)
+        except Overloaded:
+            pass  # retried on the next tick
+        except Exception as e:
+            print(f"[sessions] Idle eviction failed: {e}")
+
+async def snapshot_hotspots():
+    # compaction and the file write run on the IO pool; scoring keeps reading the previous grid
+    while True:
+        await asyncio.sleep(HOTSPOT_SNAPSHOT_SECONDS)
+        if hotspot_index.version == hotspot_index.saved_version:
+            continue
+        try:
+            await io_pool.run(hotspot_index.snapshot, HOTSPOT_LIVE_PATH)
+        except Overloaded:
+            pass  # retried on the next tick
+        except Exception as e:
+            print(f"[hotspots] Snapshot failed: {e}")
+
+async def flush_point_store():
+    # the shard writes and index update run on the IO pool, never on the loop
+    while True:
+        await asyncio.sleep(max(0.05, point_store.flush_seconds / 2))
+        try:
+            await io_pool.run(point_store.flush_if_due)
+        except Overloaded:
+            pass  # retried on the next tick
+        except Exception as e:
+            print(f"[points] Point store flush failed: {e}")
+
+def _final_point_flush():
+    point_store.flush()
+    point_store.save_index()
 
 @app.on_event("startup")
 async def startup_event():
-    asyncio.create_task(cleanup_dynamic_zones())
+    if MODEL_LOADING != "eager":
+        threading.Thread(target=_warmup, name="model-warmup", daemon=True).start()
+    prediction_writer.start()
+    if EXPLAIN_MODE == "deferred":
+        deferred_explanations.start()
+    loops = [cleanup_dynamic_zones(), flush_point_store(), evict_idle_sessions(), snapshot_hotspots()]
+    if session_store.kind != "memory":
+        loops.append(sync_shared_zones())
+    _background_tasks.extend(asyncio.create_task(loop) for loop in loops)
+
+_background_tasks = []
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # stop the periodic loops so they submit nothing to the pools being drained
+    for task in _background_tasks:
+        task.cancel()
+    # drain in-flight work, then flush buffered GPS points and prediction rows; requests (and
+    # their point appends) have finished by now, so the final flush is the IO pool's last task
+    scoring_lanes.shutdown(wait=True)
+    try:
+        await io_pool.run(_final_point_flush, force=True)
+    except Exception as e:
+        print(f"[points] Final point store flush failed: {e}")
+    io_pool.shutdown(wait=True)
+    deferred_explanations.stop()
+    prediction_writer.stop()
+    session_store.close()
+    try:
+        hotspot_index.snapshot(HOTSPOT_LIVE_PATH)
+    except Exception as e:
+        print(f"[hotspots] Snapshot failed: {e}")
 
 # -------------------------
 # XAI: explain instance (SHAP)
 # -------------------------
-def explain_features(X_raw_2d):
-    """X_raw_2d: 2D array of raw features in the same order used for train (excluding session_id)"""
+# EXPLAIN_MODE: off | always (every point, the default) | sampled (only points whose final risk reaches
+# EXPLAIN_RISK_THRESHOLD) | deferred (computed in the background and stored with the prediction)
+EXPLAIN_MODE = os.getenv("EXPLAIN_MODE", "always").strip().lower()
+if EXPLAIN_MODE not in EXPLAIN_MODES:
+    print(f"[explain] Unknown EXPLAIN_MODE={EXPLAIN_MODE!r}, using 'always'")
+    EXPLAIN_MODE = "always"
+try:
+    EXPLAIN_RISK_THRESHOLD = float(os.getenv("EXPLAIN_RISK_THRESHOLD", "0.5"))
+    EXPLAIN_CACHE_SIZE = max(0, int(os.getenv("EXPLAIN_CACHE_SIZE", "4096")))
+    EXPLAIN_CACHE_QUANTUM = float(os.getenv("EXPLAIN_CACHE_QUANTUM", "0.001"))
+except Exception:
+    EXPLAIN_RISK_THRESHOLD, EXPLAIN_CACHE_SIZE, EXPLAIN_CACHE_QUANTUM = 0.5, 4096, 0.001
+shap_explanations = ShapExplanations(
+    None,
+    [],  # filled in by _load_models
+    cache_size=EXPLAIN_CACHE_SIZE,
+    quantum=EXPLAIN_CACHE_QUANTUM,
+    explainer_factory=_build_explainer,
+)
+deferred_explanations = DeferredExplanations(shap_explanations, prediction_writer.submit_many)
+
+if MODEL_LOADING == "eager":
+    _load_models()
+
+def _warmup():
+    """Background/lazy startup: connect the DB and (background mode) load models off the request path."""
     try:
-        if explainer is None or scaler is None:
-            return []
-        # Note: our scaler transforms features; SHAP expects model input - use scaled features
-        Xs = scaler.transform(X_raw_2d)
-        vals = explainer.shap_values(Xs)
-        sv = vals[0] if isinstance(vals, list) else vals
-        feature_names = [c for c in feature_cols if c != 'session_id']
-        per_sample = sv[0] if getattr(sv, 'ndim', 1) == 2 else sv
-        # ensure lengths match
-        try:
-            vals_list = per_sample.tolist()
-        except Exception:
-            vals_list = list(per_sample)
-        pairs = list(zip(feature_names, vals_list))
-        pairs.sort(key=lambda x: abs(x[1]) if x[1] is not None else 0, reverse=True)
-        total_abs = sum(abs(v) for _, v in pairs) or 1.0
-        formatted = [{"name": name, "shap_value": float(val), "weight": float(abs(val)/total_abs)} for name, val in pairs[:6]]
-        return formatted
-    except Exception:
-        return []
+        db_init()
+    except Exception as e:
+        print(f"[startup] Database init failed: {e}")
+    if MODEL_LOADING != "background":
+        return
+    try:
+        _load_models()
+    except Exception as e:
+        print(f"[model] Background model load failed: {e}")
+        return
+    print(f"[model] Models ready ({_models_info['source']}, {_models_info['seconds']}s)")
+    if EXPLAIN_MODE != "off":
+        shap_explanations.ensure_explainer()
 
 # -------------------------
 # Endpoints
@@ -293,23 +624,40 @@ def explain_features(X_raw_2d):
 def root():
     return {"status": "ok", "message": "Smart Anomaly Detector running. Use /docs for UI."}
 
+def _store_points(points):
+    try:
+        point_store.append(
+            [p.session_id for p in points],
+            [p.lat for p in points],
+            [p.lon for p in points],
+            [p.timestamp for p in points],
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+async def _run_io(fn, *args):
+    try:
+        return await io_pool.run(fn, *args)
+    except Overloaded as exc:
+        raise _overloaded(exc)
+
 @app.post("/ingest")
-def ingest_point(p: GPSLog):
-    # append to data/gps_logs.csv
-    filepath = os.path.join(DATA_DIR, "gps_logs.csv")
+async def ingest_point(p: GPSLog):
+    # buffered append to the binary point store (data/points); a flush may hit disk
     row = {"session_id": p.session_id, "lat": p.lat, "lon": p.lon, "timestamp": p.timestamp}
-    df = pd.DataFrame([row])
-    header = not os.path.exists(filepath)
-    df.to_csv(filepath, mode='a', header=header, index=False)
+    profiler.note_sessions([p.session_id])
+    await _run_io(_store_points, [p])
     return {"status": "ok", "ingested": row}
 
 @app.post("/ingest/batch")
-def ingest_batch(b: BatchIngest):
-    filepath = os.path.join(DATA_DIR, "gps_logs.csv")
+async def ingest_batch(b: BatchIngest, score: bool = False):
     rows = [dict(session_id=p.session_id, lat=p.lat, lon=p.lon, timestamp=p.timestamp) for p in b.points]
-    df = pd.DataFrame(rows)
-    header = not os.path.exists(filepath)
-    df.to_csv(filepath, mode='a', header=header, index=False)
+    profiler.note_sessions(p.session_id for p in b.points)
+    await _run_io(_store_points, b.points)
+    if score:
+        # optional: score the batch through the same single-pass pipeline as /predict/window
+        results = await _predict_dispatch(b.points)
+        return JSONResponse(content={"status": "ok", "ingested": len(rows), "results": results})
     return {"status": "ok", "ingested": len(rows)}
 
 @app.post("/zones")
@@ -318,20 +666,74 @@ def upload_zones(payload: ZonePayload):
     static_zones = payload.zones
     with open(ZONES_FILE, "w") as f:
         json.dump(static_zones, f, indent=2)
+    zone_index.set_static(static_zones)
     return {"status": "ok", "zones": len(static_zones)}
 
 @app.post("/zones/dynamic")
 def create_dynamic_zone(payload: DynamicZonePayload):
-    expires_at = datetime.now(timezone.utc) + timedelta(seconds=payload.ttl_seconds)
-    dynamic_zones[payload.zone_id] = {
-        "zone_id": payload.zone_id,
-        "name": payload.name or payload.zone_id,
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=payload.ttl_seconds)
+    dynamic_zones.pop_expired(now)  # opportunistic O(log n) reclaim before the rebuild
+    try:
+        dynamic_zones.add(
+            payload.zone_id,
+            payload.geojson,
+            expires_at,
+            name=payload.name,
+            risk_level=payload.risk_level,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    _refresh_dynamic_zone_index()
+    # shared backends hand the zone to the other workers
+    version = session_store.publish_zone(payload.zone_id, {
         "geojson": payload.geojson,
+        "name": payload.name,
         "risk_level": payload.risk_level,
-        "expires_at": expires_at
-    }
+        "expires_at": expires_at.isoformat(),
+    })
+    if session_store.kind != "memory":
+        _dynamic_zones_seen["zones"][payload.zone_id] = version  # already held: the sync skips it
     return {"status":"ok","zone_id": payload.zone_id, "expires_at": expires_at.isoformat()}
 
+def _add_incidents(incidents):
+    stamps = None
+    if any(i.timestamp for i in incidents):
+        now = time.time()
+        stamps = [
+            _parse_timestamp(i.timestamp).replace(tzinfo=timezone.utc).timestamp() if i.timestamp else now
+            for i in incidents
+        ]
+    try:
+        return hotspot_index.add(
+            [i.lat for i in incidents],
+            [i.lon for i in incidents],
+            [i.severity_score for i in incidents],
+            stamps,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.post("/hotspots/incidents")
+async def add_incidents(payload: IncidentBatch):
+    """Fold new incident reports into the live hotspot grid (affects crime_rate_local right away)."""
+    added = await _run_io(_add_incidents, payload.incidents)
+    return {"status": "ok", "added": added, "hotspots": hotspot_index.info()}
+
+@app.get("/hotspots")
+def hotspot_info():
+    return hotspot_index.info()
+
+@app.get("/hotspots/tiles/{z}/{x}/{y}")
+async def hotspot_tile(z: int, x: int, y: int, size: int = 64):
+    """Heatmap tile (web-mercator z/x/y): report count and average severity per bin."""
+    if not 0 <= z <= 22 or not (0 <= x < (1 << z) and 0 <= y < (1 << z)):
+        raise HTTPException(status_code=400, detail="tile out of range")
+    if not 1 <= size <= 256:
+        raise HTTPException(status_code=400, detail="size must be between 1 and 256")
+    # served from the grid's pyramid of aggregates, never from the raw reports
+    return await _run_io(hotspot_index.tile, z, x, y, size)
+
 @app.get("/model/metadata")
 def model_metadata():
     meta_file = os.path.join(MODEL_DIR, "model_metadata.json")
@@ -339,100 +741,126 @@ def model_metadata():
         return json.load(open(meta_file))
     return {"error": "metadata not found"}
 
-@app.post("/predict")
-def predict_point(p: GPSLog):
+# -------------------------
+# Scoring pipeline
+# -------------------------
+# predict_point, predict_window and ingest_batch share these stages so a batch
+# of points is featurised in order (each point sees the history before it) and
+# then scored with one scaler/IsolationForest/DBSCAN pass over the stacked matrix.
+W_ML = 0.5
+W_GEO = 0.2
+W_RULES = 0.15
+W_OCEAN = 0.05
+W_HOTSPOT = 0.1
+
+def _parse_timestamp(value):
     try:
-        ts = pd.to_datetime(p.timestamp, utc=True)
+        ts = pd.to_datetime(value, utc=True)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid timestamp format")
     if pd.isna(ts):
         raise HTTPException(status_code=400, detail="Timestamp could not be parsed")
-    ts_local = ts.to_pydatetime().replace(tzinfo=None)
+    return ts.to_pydatetime().replace(tzinfo=None)
 
-    buf = session_history[p.session_id]
-    buf.append({
-        "lat": float(p.lat),
-        "lon": float(p.lon),
-        "timestamp": ts_local.isoformat(),
-    })
+def _zone_risk(zone):
+    """(geo_flag, geo_risk_weight) for the zone a point falls in."""
+    if not zone:
+        return 0, 0.0
+    rl = (zone.get("risk_level") or "").lower()
+    if rl == "high":
+        return 1, 1.0
+    if rl == "medium":
+        return 1, 0.6
+    if rl == "low":
+        return 0, 0.2
+    return 0, 0.0
+
+def _prepare_point(p: GPSLog, ts_local, zone):
+    """Update session/group state for one point and compute everything except model scores."""
+    with metrics.stage("features"), session_store.session(p.session_id) as sess:
+        buf = sess.features
+        prev_ts = buf.last_timestamp
+        buf.append(p.lat, p.lon, ts_local)
+
+        # incremental O(1) update; matches compute_session_features on the same window
+        features = buf.features(session_id=p.session_id)
+        buffer_size = len(buf)
+
+        inact_flag = 0
+        last = sess.last_seen
+        if last:
+            gap_minutes = (ts_local - last).total_seconds() / 60.0
+            if gap_minutes > 10:
+                inact_flag = 1
+        sess.last_seen = ts_local
 
-    features = compute_session_features(
-        list(buf),
-        session_id=p.session_id,
-        hotspot_index=hotspot_index,
-        hotspot_radius=HOTSPOT_RADIUS,
-    )
     features["hour"] = int(ts_local.hour)
     features["day_of_week"] = int(ts_local.weekday())
-    if len(buf) >= 2:
-        prev_ts = pd.to_datetime(buf[-2]["timestamp"], utc=True)
-        prev_ts = prev_ts.to_pydatetime().replace(tzinfo=None)
+    if prev_ts is not None and buffer_size >= 2:
         delta_minutes = max(0.0, (ts_local - prev_ts).total_seconds() / 60.0)
     else:
         delta_minutes = 0.0
     features["time_since_last"] = float(delta_minutes)
 
+    geo_flag, geo_risk_weight = _zone_risk(zone)
+    with metrics.stage("open_water"):
+        open_water_flag = detect_open_water(p.lat, p.lon, zone is not None)
+
+    group_flag = 0
+    if p.group_id is not None:
+        # incremental far-pair count over a grid of member positions (group_separation.py)
+        ts_epoch = ts_local.replace(tzinfo=timezone.utc).timestamp()
+        with metrics.stage("group"):
+            group_flag = int(session_store.update_group(p.group_id, p.user_id, p.lat, p.lon, ts_epoch))
+
     fcols = [c for c in feature_cols if c != "session_id"]
-    X_raw = np.array([[float(features.get(c, 0.0)) for c in fcols]])
-    Xs = scaler.transform(X_raw)
+    return {
+        "point": p,
+        "features": features,
+        "x_raw": [float(features.get(c, 0.0)) for c in fcols],
+        "buffer_size": buffer_size,
+        "zone": zone,
+        "geo_flag": geo_flag,
+        "geo_risk_weight": geo_risk_weight,
+        "open_water_flag": open_water_flag,
+        "inact_flag": inact_flag,
+        "group_flag": group_flag,
+    }
+
+def _score_matrix(Xs):
+    """Run IsolationForest and the DBSCAN core-distance check once for all scaled rows.
+
+    Returns (decision_scores, anomaly_flags, cluster_distances, cluster_flags).
+    """
 
-    decision_score = float(iso.decision_function(Xs)[0])
-    anomaly_flag = 1 if iso.predict(Xs)[0] == -1 else 0
+    if compiled_iso is not None:
+        decision_scores, anomaly_flags = compiled_iso.score(Xs)
+    else:
+        # iso.predict is just decision_function < 0; avoid walking the trees twice
+        decision_scores = _sklearn_iso().decision_function(Xs)
+        anomaly_flags = (decision_scores < 0).astype(int)
 
-    cluster_flag = 0
-    cluster_distance = None
+    cluster_distances = [None] * len(Xs)
+    cluster_flags = anomaly_flags.copy()
     try:
-        core = getattr(dbs, "components_", None)
-        eps = getattr(dbs, "eps", None)
-        if core is not None and eps is not None and len(core):
-            distances = np.linalg.norm(core - Xs[0], axis=1)
-            cluster_distance = float(np.min(distances)) if len(distances) else None
-            if cluster_distance is not None:
-                cluster_flag = 1 if cluster_distance > float(eps) else 0
-            else:
-                cluster_flag = anomaly_flag
-        else:
-            cluster_flag = anomaly_flag
+        if core_index is not None:
+            mins, cluster_flags = core_index.score(Xs)
+            cluster_distances = [float(d) for d in mins]
     except Exception:
-        cluster_flag = anomaly_flag
-
-    zone = point_in_any_zone(p.lat, p.lon)
-    geo_flag = 0
-    geo_risk_weight = 0.0
-    if zone:
-        rl = (zone.get("risk_level") or "").lower()
-        if rl == "high":
-            geo_flag = 1
-            geo_risk_weight = 1.0
-        elif rl == "medium":
-            geo_flag = 1
-            geo_risk_weight = 0.6
-        elif rl == "low":
-            geo_risk_weight = 0.2
-
-    open_water_flag = detect_open_water(p.lat, p.lon, zone is not None)
-
-    inact_flag = 0
-    last = last_seen.get(p.session_id)
-    if last:
-        gap_minutes = (ts_local - last).total_seconds() / 60.0
-        if gap_minutes > 10:
-            inact_flag = 1
-    last_seen[p.session_id] = ts_local
+        cluster_flags = anomaly_flags.copy()
+    return decision_scores, anomaly_flags, cluster_distances, cluster_flags
 
-    group_flag = 0
-    if p.group_id is not None:
-        if p.group_id not in group_members:
-            group_members[p.group_id] = {}
-        group_members[p.group_id][p.user_id] = (p.lat, p.lon, ts_local)
-        locs = list(group_members[p.group_id].values())
-        for i in range(len(locs)):
-            for j in range(i + 1, len(locs)):
-                if haversine_km(locs[i][0], locs[i][1], locs[j][0], locs[j][1]) > 10.0:
-                    group_flag = 1
-                    break
-            if group_flag:
-                break
+def _assemble_prediction(ctx, decision_score, anomaly_flag, cluster_distance, cluster_flag, factors):
+    """Combine model scores and rule flags into the API payload and the DB row."""
+    p = ctx["point"]
+    features = ctx["features"]
+    zone = ctx["zone"]
+    geo_flag = ctx["geo_flag"]
+    open_water_flag = ctx["open_water_flag"]
+    inact_flag = ctx["inact_flag"]
+    group_flag = ctx["group_flag"]
+    decision_score = float(decision_score)
+    anomaly_flag = int(anomaly_flag)
 
     anomaly_raw = -decision_score
     anomaly_score = float(1 / (1 + math.exp(-anomaly_raw)))
@@ -447,23 +875,16 @@ def predict_point(p: GPSLog):
         hotspot_threshold = 0.6
     hotspot_flag = 1 if hotspot_score >= hotspot_threshold else 0
 
-    w_ml = 0.5
-    w_geo = 0.2
-    w_rules = 0.15
-    w_ocean = 0.05
-    w_hotspot = 0.1
     rules_score = float(inact_flag or group_flag)
     final_risk = (
-        w_ml * anomaly_score
-        + w_geo * geo_risk_weight
-        + w_rules * rules_score
-        + w_ocean * (1.0 if open_water_flag else 0.0)
-        + w_hotspot * hotspot_score
+        W_ML * anomaly_score
+        + W_GEO * ctx["geo_risk_weight"]
+        + W_RULES * rules_score
+        + W_OCEAN * (1.0 if open_water_flag else 0.0)
+        + W_HOTSPOT * hotspot_score
     )
     final_risk = round(min(1.0, final_risk), 3)
 
-    factors = explain_features(X_raw) if explainer else []
-
     reasons = []
     if anomaly_flag:
         reasons.append("ml_anomaly")
@@ -484,9 +905,10 @@ def predict_point(p: GPSLog):
     if density_component >= math.log1p(8):
         reasons.append("event_density_high")
 
+    fcols = [c for c in feature_cols if c != "session_id"]
     feature_snapshot = {c: float(features.get(c, 0.0)) for c in fcols}
     feature_snapshot["session_id"] = int(p.session_id)
-    feature_snapshot["buffer_size"] = len(buf)
+    feature_snapshot["buffer_size"] = ctx["buffer_size"]
 
     out = {
         "session_id": p.session_id,
@@ -515,10 +937,10 @@ def predict_point(p: GPSLog):
             "threshold": hotspot_threshold,
         },
         "feature_snapshot": feature_snapshot,
-        "history_points": len(buf),
+        "history_points": ctx["buffer_size"],
     }
 
-    db_save_prediction_row({
+    row = {
         "session_id": p.session_id,
         "user_id": p.user_id,
         "group_id": p.group_id,
@@ -531,9 +953,139 @@ def predict_point(p: GPSLog):
         "inactivity_flag": int(inact_flag),
         "group_flag": int(group_flag),
         "reasons": reasons,
-    })
+    }
+    return out, row
 
-    return JSONResponse(content=out)
+# -------------------------
+# Metrics (METRICS_ENABLED=1; scraped from /metrics)
+# -------------------------
+_FLAG_KEYS = ("anomaly", "cluster", "geo", "open_water", "inactivity", "group", "hotspot")
+metrics.describe_counter("detector_points_scored_total", "Points scored by the detector")
+metrics.describe_counter("detector_flags_total", "Flags raised on scored points")
+metrics.describe_histogram("detector_final_risk", "Final risk score of scored points", RISK_BUCKETS)
+# running counts: stats() also sizes every session window, far too slow for each scrape
+metrics.gauge("detector_sessions", "Sessions with live state", lambda: session_store.counts()["sessions"])
+metrics.gauge("detector_groups", "Groups with tracked members", lambda: session_store.counts()["groups"])
+metrics.gauge("detector_pool_pending", "Queued plus running tasks per executor", lambda: {
+    (("pool", "scoring"),): scoring_lanes.stats()["pending"], (("pool", "io"),): io_pool.stats()["pending"],
+})
+metrics.gauge("detector_pool_rejected", "Tasks rejected with 429 since start, per executor", lambda: {
+    (("pool", "scoring"),): scoring_lanes.stats()["rejected"], (("pool", "io"),): io_pool.stats()["rejected"],
+})
+metrics.gauge("detector_prediction_queue_depth", "Prediction rows waiting for the DB writer",
+              lambda: prediction_writer.stats()["queue_depth"])
+metrics.gauge("detector_predictions_failed", "Prediction rows dropped after repeated DB errors",
+              lambda: prediction_writer.stats()["failed"])
+metrics.gauge("detector_shap_cache_entries", "Cached SHAP explanations",
+              lambda: shap_explanations.stats()["cache_entries"])
+
+def _record_outcomes(results):
+    metrics.inc("detector_points_scored_total", len(results))
+    for key in _FLAG_KEYS:
+        raised = sum(1 for out in results if out[f"{key}_flag"])
+        if raised:
+            metrics.inc("detector_flags_total", raised, flag=key)
+    metrics.observe_many("detector_final_risk", [out["final_risk_score"] for out in results])
+
+def _score_contexts(ctxs):
+    """Score prepared contexts in one model pass, persist the rows and return the payloads."""
+    _ensure_models()
+    with metrics.stage("model"):
+        X_raw = np.array([ctx["x_raw"] for ctx in ctxs])
+        Xs = scaler.transform(X_raw)
+        decision_scores, anomaly_flags, cluster_distances, cluster_flags = _score_matrix(Xs)
+
+    results = []
+    rows = []
+    for i, ctx in enumerate(ctxs):
+        out, row = _assemble_prediction(
+            ctx, decision_scores[i], anomaly_flags[i], cluster_distances[i], cluster_flags[i], []
+        )
+        results.append(out)
+        rows.append(row)
+    if metrics.enabled:
+        _record_outcomes(results)
+
+    mode = EXPLAIN_MODE if shap_explanations.available else "off"
+    if mode == "deferred":
+        # factors are attached to the stored rows once the background batch is explained
+        for out in results:
+            out["explanation"] = "deferred"
+        with metrics.stage("db"):
+            deferred_explanations.submit_many(Xs, rows)
+        return results
+    if mode == "always":
+        picked = list(range(len(results)))
+    elif mode == "sampled":
+        picked = [i for i, out in enumerate(results) if out["final_risk_score"] >= EXPLAIN_RISK_THRESHOLD]
+    else:
+        picked = []
+    for out in results:
+        out["explanation"] = "off" if mode == "off" else "skipped"
+    if picked:
+        # one SHAP call for every picked row that is not already cached
+        with metrics.stage("shap"):
+            explained = shap_explanations.explain(Xs[picked])
+        for i, factors in zip(picked, explained):
+            results[i]["factors"] = factors
+            results[i]["explanation"] = "inline"
+            rows[i]["factors"] = factors
+    # write-behind: rows are buffered and flushed in bulk by a background thread
+    with metrics.stage("db"):
+        prediction_writer.submit_many(rows)
+    return results
+
+def _prepare_points(points, stamps):
+    _ensure_models()
+    with metrics.stage("zones"):
+        zones = points_in_any_zone([p.lat for p in points], [p.lon for p in points])
+    return [_prepare_point(p, ts, zone) for p, ts, zone in zip(points, stamps, zones)]
+
+def _predict_many(points, stamps=None):
+    """Score a list of GPSLog points in arrival order; returns the list of payloads."""
+    if not points:
+        return []
+    if stamps is None:
+        # validate every timestamp before touching session state
+        with metrics.stage("parse"):
+            stamps = [_parse_timestamp(p.timestamp) for p in points]
+    return _score_contexts(_prepare_points(points, stamps))
+
+async def _predict_dispatch(points):
+    """Run :func:`_predict_many` on the scoring lanes, keeping per-session order.
+
+    Points are featurised on their session's lane; a batch spanning several
+    lanes is prepared on each lane in parallel and then scored in one pass.
+    """
+    if not points:
+        return []
+    profiler.note_sessions(p.session_id for p in points)
+    with metrics.stage("parse"):
+        stamps = [_parse_timestamp(p.timestamp) for p in points]
+    by_lane = {}
+    for i, p in enumerate(points):
+        by_lane.setdefault(scoring_lanes.lane_of(p.session_id), []).append(i)
+    try:
+        if len(by_lane) == 1:
+            return await scoring_lanes.run(_predict_many, points, stamps, key=points[0].session_id)
+        groups = list(by_lane.values())
+        futures = scoring_lanes.submit_many([
+            (_prepare_points, ([points[i] for i in idx], [stamps[i] for i in idx]), points[idx[0]].session_id)
+            for idx in groups
+        ])
+    except Overloaded as exc:
+        raise _overloaded(exc)
+    parts = await asyncio.gather(*(asyncio.wrap_future(f) for f in futures))
+    ctxs = [None] * len(points)
+    for idx, part in zip(groups, parts):
+        for i, ctx in zip(idx, part):
+            ctxs[i] = ctx
+    # session state is already updated, so the scoring step must not be rejected
+    return await scoring_lanes.run(_score_contexts, ctxs, key=points[0].session_id, force=True)
+
+@app.post("/predict")
+async def predict_point(p: GPSLog):
+    return JSONResponse(content=(await _predict_dispatch([p]))[0])
 
 @app.post('/zones/reload')
 def reload_zones():
@@ -542,35 +1094,36 @@ def reload_zones():
     return {"status":"ok","zones": len(static_zones)}
 
 @app.post("/predict/window")
-def predict_window(points: List[GPSLog]):
-    # convenience: score each point and return list of JSON objects
-    results = []
-    for p in points:
-        resp = predict_point(p)
-        # predict_point returns a JSONResponse
-        if isinstance(resp, JSONResponse):
-            try:
-                # JSONResponse.content may not be directly accessible; use body if present
-                body = resp.body
-                content = json.loads(body.decode() if isinstance(body, (bytes, bytearray)) else body)
-            except Exception:
-                # fallback: try resp.rendered if available
-                try:
-                    rendered = resp.render()
-                    content = json.loads(rendered.decode())
-                except Exception:
-                    content = {}
-        else:
-            content = resp
-        results.append(content)
-    return JSONResponse(content={"results": results})
+async def predict_window(points: List[GPSLog]):
+    # score the whole window with one model pass; per-session order is preserved
+    return JSONResponse(content={"results": await _predict_dispatch(points)})
+
+
+@app.get('/health/live')
+def health_live():
+    """Liveness: the process is up and serving requests (models may still be loading)."""
+    return {"live": True}
 
+def _models_status():
+    return {"loading": MODEL_LOADING, "loaded": _models_ready.is_set(), **_models_info}
+
+def _is_ready():
+    # lazy mode loads on the first request, so gating traffic on the load would never finish it
+    return _models_ready.is_set() or (MODEL_LOADING == "lazy" and not _models_info["error"])
+
+@app.get('/health/ready')
+def health_ready():
+    """Readiness: 200 once the models are loaded (or can be, in lazy mode), 503 while loading."""
+    ready = _is_ready()
+    body = {"ready": ready, "models": _models_status()}
+    return JSONResponse(content=body, status_code=200 if ready else 503)
 
 @app.get('/health')
-def health():
+async def health():
     """Health endpoint: checks model artifacts and DB connectivity."""
-    ok = True
-    details = {}
+    ready = _is_ready()
+    ok = ready
+    details = {"live": True, "ready": ready, "models": _models_status()}
     # models
     try:
         for f in ['scaler.pkl', 'isolation_forest.pkl', 'dbscan.pkl', 'feature_cols.pkl']:
@@ -584,54 +1137,122 @@ def health():
 
     # DB
     try:
-        conn = pool.getconn()
-        cur = conn.cursor()
-        cur.execute('SELECT 1')
-        cur.close()
-        pool.putconn(conn)
+        await io_pool.run(db_ping)
         details['db'] = True
     except Exception as e:
         details['db'] = False
         details['db_error'] = str(e)
         ok = False
+    details['prediction_writer'] = prediction_writer.stats()
+    details['scoring_pool'] = scoring_lanes.stats()
+    details['io_pool'] = io_pool.stats()
+    details['session_state'] = session_store.stats()
+    details['hotspots'] = hotspot_index.info()
+    details['explanations'] = {"mode": EXPLAIN_MODE, **shap_explanations.stats(), "deferred": deferred_explanations.stats()}
 
     return {"ok": ok, "details": details}
 
+@app.get("/metrics")
+def metrics_endpoint():
+    """Prometheus text format: stage timings, flag counters, risk histogram and state gauges."""
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail="metrics are disabled (set METRICS_ENABLED=1)")
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
+# -------------------------
+# Admin: on-demand sampling profiler
+# -------------------------
+# ADMIN_TOKEN, when set, must be sent as the X-Admin-Token header on /admin/* calls
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN") or None
+
+def _require_admin(token):
+    if ADMIN_TOKEN is not None and token != ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="admin token required")
+
+@app.post("/admin/profile/start")
+def profile_start(
+    seconds: float = 10.0,
+    session_id: Optional[int] = None,
+    interval_ms: float = 5.0,
+    include_idle: bool = False,
+    x_admin_token: Optional[str] = Header(None),
+):
+    """Sample every thread's stack for ``seconds`` (optionally only work for one session)."""
+    _require_admin(x_admin_token)
+    if not 0 < seconds <= 600:
+        raise HTTPException(status_code=400, detail="seconds must be in (0, 600]")
+    if not 1 <= interval_ms <= 1000:
+        raise HTTPException(status_code=400, detail="interval_ms must be between 1 and 1000")
+    profiler.set_endpoints(endpoint_codes(app))
+    try:
+        return profiler.start(seconds, interval_ms / 1000.0, session_id=session_id, include_idle=include_idle)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+@app.post("/admin/profile/stop")
+def profile_stop(x_admin_token: Optional[str] = Header(None)):
+    _require_admin(x_admin_token)
+    return profiler.stop()
+
+@app.get("/admin/profile")
+def profile_status(x_admin_token: Optional[str] = Header(None)):
+    """State of the current/last run with samples per endpoint and the hottest frames."""
+    _require_admin(x_admin_token)
+    return profiler.status()
+
+@app.get("/admin/profile/folded")
+def profile_folded(x_admin_token: Optional[str] = Header(None)):
+    """Folded stacks of the current/last run, for flamegraph.pl, inferno or speedscope."""
+    _require_admin(x_admin_token)
+    return PlainTextResponse(profiler.folded())
+
 @app.get("/predict/live/{session_id}")
-def predict_live(session_id: int):
-    # compute session-level features by aggregating CSV points for session
-    df = load_sessions_from_csv()
-    sess = df[df['session_id'] == session_id]
+async def predict_live(session_id: int):
+    profiler.note_sessions([session_id])
+    try:
+        result = await scoring_lanes.run(_predict_live, session_id, key=session_id)
+    except Overloaded as exc:
+        raise _overloaded(exc)
+    return JSONResponse(content=result)
+
+def _predict_live(session_id):
+    _ensure_models()
+    # compute session-level features by aggregating stored points for session
+    # only this session's points are read, via the point-store and legacy indexes
+    sess = load_session_points(session_id)
     if sess.empty:
         raise HTTPException(status_code=404, detail="No data for session")
-    points = sess.sort_values('timestamp').to_dict(orient='records')
-    # compute session-level features similar to train script
-    # we will reuse extract_features logic from train if needed. For brevity compute a few
-    # build a fake GPSLog using last point values and call predict_point
-    last = points[-1]
+    # features over the whole stored trajectory, exactly as at training time
+    feats = compute_session_features_batch(sess, hotspot_index=hotspot_index, hotspot_radius=HOTSPOT_RADIUS)
+    if feats.empty:
+        raise HTTPException(status_code=404, detail="No data for session")
+    features = feats.iloc[0].to_dict()
+
+    last = sess.iloc[-1]
+    lat, lon = float(last['lat']), float(last['lon'])
     # choose user_id=0 if not available
-    plog = GPSLog(session_id=int(last['session_id']), user_id=0, group_id=None, lat=float(last['lat']), lon=float(last['lon']), timestamp=last['timestamp'])
-    return predict_point(plog)
+    plog = GPSLog(
+        session_id=int(session_id), user_id=0, group_id=None, lat=lat, lon=lon,
+        timestamp=last['timestamp'].strftime("%Y-%m-%dT%H:%M:%S"),
+    )
+    zone = point_in_any_zone(lat, lon)
+    geo_flag, geo_risk_weight = _zone_risk(zone)
+    fcols = [c for c in feature_cols if c != "session_id"]
+    # read-only: the live streaming state in session_store is left untouched
+    ctx = {
+        "point": plog,
+        "features": features,
+        "x_raw": [float(features.get(c, 0.0)) for c in fcols],
+        "buffer_size": int(len(sess)),
+        "zone": zone,
+        "geo_flag": geo_flag,
+        "geo_risk_weight": geo_risk_weight,
+        "open_water_flag": detect_open_water(lat, lon, zone is not None),
+        "inact_flag": int(float(features.get("time_since_last", 0.0)) > 10),
+        "group_flag": 0,
+    }
+    return _score_contexts([ctx])[0]
 
 @app.get("/alerts")
-def fetch_alerts(limit: int = 50):
-    conn = pool.getconn()
-    cur = conn.cursor()
-    cur.execute(
-        "SELECT id, session_id, user_id, group_id, lat, lon, timestamp, risk_score, reasons, created_at"
-        " FROM predictions ORDER BY id DESC LIMIT %s",
-        (limit,)
-    )
-    rows = cur.fetchall()
-    cur.close()
-    pool.putconn(conn)
-    keys = ["id", "session_id", "user_id", "group_id", "lat", "lon", "timestamp", "risk_score", "reasons", "created_at"]
-    out = [dict(zip(keys, r)) for r in rows]
-    for o in out:
-        o['reasons'] = json.loads(o['reasons']) if o.get('reasons') else []
-    return {"alerts": out}
-
-if __name__ == "__main__":
-    import uvicorn
-    # Start the FastAPI application when running this script directly
-    uvicorn.run(app, host="127.0.0.1", port=8001)
+async def fetch_alerts(limit: int = 50):
+    return {"alerts": await _run_io(fetch_recent_predictions, limit)}
@@ -0,0 +1,75 @@
+"""Single-file container of named NumPy arrays that loads by memory-mapping.
+
+Layout: an 8-byte magic, the header length as little-endian u64, a JSON
+header (caller fields plus an ``arrays`` table of offset/dtype/shape), then
+every array little-endian at a 64-byte aligned offset. Loading parses only the
+header; the arrays are read-only views over one mapping of the file, so the
+cost does not grow with the array sizes and pages are shared between worker
+processes. Used for the hotspot grid and the compiled model bundle.
+"""
+from __future__ import annotations
+
+import json
+import os
+from typing import Dict, Tuple
+
+import numpy as np
+
+ALIGN = 64
+
+
+def _data_start(magic: bytes, header_len: int) -> int:
+    return -(-(len(magic) + 8 + header_len) // ALIGN) * ALIGN
+
+
+def write_arrays(path: str, magic: bytes, header: Dict[str, object], arrays: Dict[str, np.ndarray]) -> None:
+    """Write ``header`` and ``arrays`` atomically (temp file + rename)."""
+    arrays = {name: np.ascontiguousarray(a, dtype=a.dtype.newbyteorder("<")) for name, a in arrays.items()}
+    layout = {}
+    offset = 0
+    for name, a in arrays.items():
+        layout[name] = {"offset": offset, "dtype": a.dtype.str, "shape": list(a.shape)}
+        offset += -(-a.nbytes // ALIGN) * ALIGN
+    blob = json.dumps(dict(header, arrays=layout)).encode("utf-8")
+    data_start = _data_start(magic, len(blob))
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as fh:
+        fh.write(magic)
+        fh.write(np.array([len(blob)], dtype="<u8").tobytes())
+        fh.write(blob)
+        for name, a in arrays.items():
+            fh.seek(data_start + layout[name]["offset"])
+            fh.write(a.tobytes())
+    os.replace(tmp, path)
+
+
+def read_arrays(
+    path: str, magic: bytes, mmap: bool = True, kind: str = "array"
+) -> Tuple[Dict[str, object], Dict[str, np.ndarray]]:
+    """(header, arrays); arrays are memory-mapped read-only unless ``mmap`` is false."""
+    with open(path, "rb") as fh:
+        if fh.read(len(magic)) != magic:
+            raise ValueError(f"{path} is not a {kind} file")
+        header_len = int(np.frombuffer(fh.read(8), dtype="<u8")[0])
+        header = json.loads(fh.read(header_len).decode("utf-8"))
+    data_start = _data_start(magic, header_len)
+    # one mapping of the whole file; each array is a plain ndarray view into it
+    # (memmap's subclass hooks slow down scalar reads)
+    mapping = np.asarray(np.memmap(path, dtype=np.uint8, mode="r")) if mmap else None
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        dtype = np.dtype(spec["dtype"])
+        if int(np.prod(shape)) == 0:
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        elif mmap:
+            start = data_start + spec["offset"]
+            arrays[name] = mapping[start : start + int(np.prod(shape)) * dtype.itemsize].view(dtype).reshape(shape)
+        else:
+            with open(path, "rb") as fh:
+                fh.seek(data_start + spec["offset"])
+                arrays[name] = np.fromfile(fh, dtype=dtype, count=int(np.prod(shape))).reshape(shape)
+    return header, arrays
+
+
+__all__ = ["ALIGN", "read_arrays", "write_arrays"]
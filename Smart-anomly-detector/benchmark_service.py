@@ -0,0 +1,333 @@
+"""
+End-to-end latency/throughput benchmark for the detector service.
+
+Drives /predict, /predict/window, /ingest, /ingest/batch and /predict/live
+in-process through FastAPI's TestClient, with synthetic trips from
+generate_data.generate_trip, a scratch data directory and a local sqlite
+database standing in for Postgres (DB_BACKEND=sqlite). Every scenario reports
+p50/p95/p99 request latency and points/sec; the whole run is written as JSON
+so results can be compared across commits:
+
+    python benchmark_service.py --out bench.json
+    python benchmark_service.py --quick --only predict,predict_window
+
+Sweeps: window sizes (/predict/window), ingest batch sizes (/ingest/batch,
+with and without scoring), static zone counts, hotspot densities (incident
+reports folded into the live grid) and group sizes.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+import generate_data
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCENARIOS = (
+    "predict", "predict_window", "ingest", "ingest_batch", "predict_live", "zones", "hotspots", "groups",
+)
+
+
+def _ints(value):
+    return [int(v) for v in value.split(",") if v.strip()]
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    ap.add_argument("--only", default=",".join(SCENARIOS), help="comma-separated scenarios to run")
+    ap.add_argument("--sessions", type=int, default=20, help="trips (30 points each) per run")
+    ap.add_argument("--window-sizes", type=_ints, default=[1, 10, 50, 200])
+    ap.add_argument("--batch-sizes", type=_ints, default=[10, 100, 1000])
+    ap.add_argument("--zone-counts", type=_ints, default=[0, 10, 100, 1000, 10000])
+    ap.add_argument("--hotspot-densities", type=_ints, default=[0, 1000, 10000, 50000],
+                    help="incident reports added around the trips (cumulative)")
+    ap.add_argument("--group-sizes", type=_ints, default=[2, 10, 50, 200])
+    ap.add_argument("--sweep-window", type=int, default=50, help="window size for the zone/hotspot/group sweeps")
+    ap.add_argument("--warmup", type=int, default=20, help="unmeasured /predict calls before the run")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--quick", action="store_true", help="small sizes, for a smoke run")
+    args = ap.parse_args(argv)
+    if args.quick:
+        args.sessions = min(args.sessions, 4)
+        args.window_sizes = [w for w in args.window_sizes if w <= 50]
+        args.batch_sizes = [b for b in args.batch_sizes if b <= 100]
+        args.zone_counts = [z for z in args.zone_counts if z <= 100]
+        args.hotspot_densities = [d for d in args.hotspot_densities if d <= 1000]
+        args.group_sizes = [g for g in args.group_sizes if g <= 10]
+        args.warmup = min(args.warmup, 5)
+    args.only = [s.strip() for s in args.only.split(",") if s.strip()]
+    unknown = set(args.only) - set(SCENARIOS)
+    if unknown:
+        ap.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    return args
+
+
+def _log(msg):
+    print(f"[bench] {msg}", file=sys.stderr, flush=True)
+
+
+def git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "HEAD"], cwd=BASE_DIR, capture_output=True, text=True, timeout=10,
+        )
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def use_scratch_environment():
+    """Point the service at a scratch data dir and a sqlite database; call before importing app."""
+    scratch = tempfile.mkdtemp(prefix="detector-bench-")
+    os.environ.setdefault("DETECTOR_DATA_DIR", os.path.join(scratch, "data"))
+    os.environ.setdefault("DB_BACKEND", "sqlite")
+    os.environ.setdefault("SQLITE_DB_PATH", os.path.join(scratch, "predictions.db"))
+    os.environ.setdefault("HOTSPOT_SNAPSHOT_SECONDS", "86400")
+    return scratch
+
+
+def summarize(latencies, points, wall_seconds, errors=0):
+    """Latency percentiles (ms) and throughput for one scenario."""
+    lat = np.asarray(latencies, dtype=float) * 1000.0
+    out = {"requests": int(len(lat)), "points": int(points), "errors": int(errors),
+           "wall_seconds": round(wall_seconds, 6)}
+    if len(lat):
+        p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+        out.update({
+            "p50_ms": round(float(p50), 3),
+            "p95_ms": round(float(p95), 3),
+            "p99_ms": round(float(p99), 3),
+            "mean_ms": round(float(lat.mean()), 3),
+            "max_ms": round(float(lat.max()), 3),
+        })
+    out["points_per_sec"] = round(points / wall_seconds, 2) if wall_seconds > 0 else None
+    out["requests_per_sec"] = round(len(lat) / wall_seconds, 2) if wall_seconds > 0 else None
+    return out
+
+
+class Traces:
+    """Synthetic trips from generate_data.generate_trip with fresh session ids."""
+
+    def __init__(self, seed, first_session=9_000_000):
+        random.seed(seed)
+        np.random.seed(seed)
+        self.rng = np.random.default_rng(seed)
+        self.next_session = first_session
+
+    def trips(self, n, group_id=None, spread_deg=0.0):
+        """``n`` trips as lists of /predict payloads; every fifth trip is anomalous."""
+        trips = []
+        for k in range(n):
+            sid = self.next_session
+            self.next_session += 1
+            dlat, dlon = self.rng.uniform(-spread_deg, spread_deg, 2) if spread_deg else (0.0, 0.0)
+            trips.append([
+                {
+                    "session_id": sid, "user_id": sid, "group_id": group_id,
+                    "lat": float(lat) + dlat, "lon": float(lon) + dlon, "timestamp": ts,
+                }
+                for _sid, lat, lon, ts in generate_data.generate_trip(sid, normal=(k % 5 != 4))
+            ])
+        return trips
+
+    @staticmethod
+    def stream(trips):
+        """All points merged in timestamp order (stable, so each trip stays in order)."""
+        return sorted((p for trip in trips for p in trip), key=lambda p: p["timestamp"])
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in range(0, len(items), size)]
+
+
+def _timed(calls):
+    """Run ``(fn, n_points)`` pairs sequentially; returns the scenario summary."""
+    latencies, points, errors = [], 0, 0
+    started = time.perf_counter()
+    for fn, n_points in calls:
+        t0 = time.perf_counter()
+        r = fn()
+        latencies.append(time.perf_counter() - t0)
+        if r.status_code == 200:
+            points += n_points
+        else:
+            errors += 1
+    return summarize(latencies, points, time.perf_counter() - started, errors)
+
+
+def bench_predict(client, traces, args):
+    stream = Traces.stream(traces.trips(args.sessions))
+    return _timed((lambda p=p: client.post("/predict", json=p), 1) for p in stream)
+
+
+def bench_window(client, points, size):
+    return _timed(
+        (lambda w=w: client.post("/predict/window", json=w), len(w)) for w in _chunks(points, size)
+    )
+
+
+def bench_predict_window(client, traces, args):
+    return {
+        str(size): bench_window(client, Traces.stream(traces.trips(args.sessions)), size)
+        for size in args.window_sizes
+    }
+
+
+def bench_ingest(client, traces, args):
+    trips = traces.trips(args.sessions)
+    result = _timed((lambda p=p: client.post("/ingest", json=p), 1) for p in Traces.stream(trips))
+    # /predict/live reads these sessions back from the point store
+    args._ingested_sessions = [trip[0]["session_id"] for trip in trips]
+    return result
+
+
+def bench_ingest_batch(client, traces, args):
+    out = {}
+    for size in args.batch_sizes:
+        for score in (False, True):
+            n_trips = max(args.sessions, -(-3 * size // 30))  # at least three full batches
+            batches = _chunks(Traces.stream(traces.trips(n_trips)), size)
+            out[f"{size}{'_scored' if score else ''}"] = _timed(
+                (lambda b=b: client.post("/ingest/batch", json={"points": b}, params={"score": score}), len(b))
+                for b in batches
+            )
+    return out
+
+
+def bench_predict_live(client, traces, args):
+    sessions = getattr(args, "_ingested_sessions", None)
+    if not sessions:
+        trips = traces.trips(args.sessions)
+        client.post("/ingest/batch", json={"points": Traces.stream(trips)})
+        sessions = [trip[0]["session_id"] for trip in trips]
+    # each call re-featurises the session's whole stored trajectory (30 points here)
+    return _timed((lambda s=s: client.get(f"/predict/live/{s}"), 1) for s in sessions)
+
+
+def _square_zones(n, rng, half_deg=0.001, spread_deg=0.05):
+    centres = rng.uniform(-spread_deg, spread_deg, (n, 2)) + (generate_data.BASE_LAT, generate_data.BASE_LON)
+    zones = []
+    for k, (lat, lon) in enumerate(centres):
+        ring = [
+            [lon - half_deg, lat - half_deg], [lon + half_deg, lat - half_deg],
+            [lon + half_deg, lat + half_deg], [lon - half_deg, lat + half_deg], [lon - half_deg, lat - half_deg],
+        ]
+        zones.append({
+            "zone_id": f"bench-{k}", "name": f"bench zone {k}", "risk_level": ("high", "medium", "low")[k % 3],
+            "geojson": {"type": "Polygon", "coordinates": [ring]},
+        })
+    return zones
+
+
+def bench_zones(client, traces, args):
+    out = {}
+    for n in args.zone_counts:
+        r = client.post("/zones", json={"zones": _square_zones(n, traces.rng)})
+        r.raise_for_status()
+        out[str(n)] = bench_window(client, Traces.stream(traces.trips(args.sessions)), args.sweep_window)
+    client.post("/zones", json={"zones": []})
+    return out
+
+
+def bench_hotspots(client, traces, args):
+    out = {}
+    added = 0
+    for density in sorted(args.hotspot_densities):
+        while added < density:
+            n = min(5000, density - added)
+            lat = generate_data.BASE_LAT + traces.rng.normal(0, 0.03, n)
+            lon = generate_data.BASE_LON + traces.rng.normal(0, 0.03, n)
+            sev = traces.rng.uniform(0, 1, n)
+            incidents = [
+                {"lat": float(a), "lon": float(o), "severity_score": float(s)} for a, o, s in zip(lat, lon, sev)
+            ]
+            client.post("/hotspots/incidents", json={"incidents": incidents}).raise_for_status()
+            added += n
+        result = bench_window(client, Traces.stream(traces.trips(args.sessions)), args.sweep_window)
+        result["hotspot_cells"] = client.get("/hotspots").json().get("cells")
+        out[str(density)] = result
+    return out
+
+
+def bench_groups(client, traces, args):
+    out = {}
+    for k, size in enumerate(args.group_sizes):
+        # members start up to ~11 km apart so the far-pair tracking has work to do
+        trips = traces.trips(size, group_id=8_000_000 + k, spread_deg=0.05)
+        out[str(size)] = bench_window(client, Traces.stream(trips), args.sweep_window)
+    return out
+
+
+BENCHMARKS = {
+    "predict": bench_predict,
+    "predict_window": bench_predict_window,
+    "ingest": bench_ingest,
+    "ingest_batch": bench_ingest_batch,
+    "predict_live": bench_predict_live,
+    "zones": bench_zones,
+    "hotspots": bench_hotspots,
+    "groups": bench_groups,
+}
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # isolate the service before it is imported: scratch data dir, sqlite instead of Postgres
+    use_scratch_environment()
+
+    from fastapi.testclient import TestClient
+
+    t0 = time.perf_counter()
+    import app as service
+    import_seconds = time.perf_counter() - t0
+
+    traces = Traces(args.seed)
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db_backend": os.environ["DB_BACKEND"],
+            "explain_mode": service.EXPLAIN_MODE,
+            "scoring_workers": service.SCORING_WORKERS,
+            "import_seconds": round(import_seconds, 3),
+            "params": {k: v for k, v in vars(args).items() if not k.startswith("_") and k != "out"},
+        },
+        "scenarios": {},
+    }
+    with TestClient(service.app) as client:
+        for p in Traces.stream(traces.trips(max(1, -(-args.warmup // 30))))[:args.warmup]:
+            client.post("/predict", json=p)
+        for name in SCENARIOS:
+            if name not in args.only:
+                continue
+            _log(f"{name} ...")
+            started = time.perf_counter()
+            report["scenarios"][name] = BENCHMARKS[name](client, traces, args)
+            _log(f"{name} done in {time.perf_counter() - started:.1f}s")
+        service.prediction_writer.flush(timeout=30)
+        report["meta"]["prediction_writer"] = service.prediction_writer.stats()
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        _log(f"wrote {args.out}")
+    else:
+        print(text)
+    return report
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,357 @@
+"""
+Stage-level micro-benchmarks for the scoring pipeline.
+
+Times each stage /predict chains together in isolation, over a parameter
+sweep, so it is clear which one dominates and how it scales:
+
+    timestamp_parse      app._parse_timestamp                     batch of timestamps
+    features             compute_session_features (full recompute) history length
+    features_incremental SessionFeatureState.append + features     history length (window)
+    scaler               scaler.transform                          rows
+    iforest              compiled IsolationForest scoring          rows
+    iforest_sklearn      IsolationForest.decision_function         rows
+    dbscan               CoreSampleIndex.score (core distance)     rows
+    zones                point_in_any_zone                         static zones
+    open_water           detect_open_water (offshore points)       static zones
+    group                GroupSeparation.update                    group size
+    shap                 ShapExplanations.explain (no cache)       rows
+    db_insert            database.save_prediction_rows             rows
+
+Uses the trained artifacts in model/, a scratch data dir and (by default) the
+sqlite database stand-in. Results are JSON; ``--plot`` also draws the scaling
+curves when matplotlib is installed:
+
+    python benchmark_stages.py --out stages.json --plot stages.png
+    python benchmark_stages.py --quick --stages features,features_incremental
+"""
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+
+from benchmark_service import Traces, git_commit, use_scratch_environment
+
+HISTORY = [1, 10, 30, 100, 300, 1000]
+ROWS = [1, 10, 100, 1000]
+ZONES = [10, 100, 1000, 10000]
+GROUPS = [2, 10, 50, 100, 500]
+OFFSHORE = (15.0, 65.0)  # Arabian Sea, outside the India box detect_open_water skips
+
+
+def _log(msg):
+    print(f"[stages] {msg}", file=sys.stderr, flush=True)
+
+
+def measure(fn, items=1, min_seconds=0.2, min_calls=5, max_calls=100000):
+    """Call ``fn`` until ``min_seconds`` and ``min_calls`` are reached; per-call and per-item times."""
+    times = []
+    started = time.perf_counter()
+    while len(times) < max_calls:
+        t0 = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - t0)
+        if len(times) >= min_calls and time.perf_counter() - started >= min_seconds:
+            break
+    us = np.asarray(times) * 1e6
+    median = float(np.median(us))
+    return {
+        "calls": len(times),
+        "items": int(items),
+        "median_us": round(median, 3),
+        "p95_us": round(float(np.percentile(us, 95)), 3),
+        "min_us": round(float(us.min()), 3),
+        "per_item_us": round(median / max(1, items), 3),
+    }
+
+
+def square_zones(n, centre, rng, half_deg=0.001, spread_deg=0.5):
+    lats = centre[0] + rng.uniform(-spread_deg, spread_deg, n)
+    lons = centre[1] + rng.uniform(-spread_deg, spread_deg, n)
+    zones = []
+    for k, (lat, lon) in enumerate(zip(lats, lons)):
+        ring = [
+            [lon - half_deg, lat - half_deg], [lon + half_deg, lat - half_deg],
+            [lon + half_deg, lat + half_deg], [lon - half_deg, lat + half_deg], [lon - half_deg, lat - half_deg],
+        ]
+        zones.append({
+            "zone_id": f"stage-{k}", "risk_level": ("high", "medium", "low")[k % 3],
+            "geojson": {"type": "Polygon", "coordinates": [ring]},
+        })
+    return zones
+
+
+class Fixtures:
+    """Inputs shared by the stages: a long synthetic history and real feature rows."""
+
+    def __init__(self, service, seed, max_history, max_rows):
+        self.service = service
+        self.rng = np.random.default_rng(seed)
+        traces = Traces(seed)
+        # chain trips into one long trajectory so histories up to max_history are realistic
+        points, t = [], datetime(2025, 9, 4, 10, 0, 0)
+        while len(points) < max_history:
+            for p in traces.trips(1)[0]:
+                t += timedelta(seconds=int(self.rng.integers(60, 300)))
+                points.append({"lat": p["lat"], "lon": p["lon"], "timestamp": t})
+        self.history = points[:max_history]
+        self.iso_stamps = [p["timestamp"].isoformat() for p in self.history]
+
+        fcols = [c for c in service.feature_cols if c != "session_id"]
+        rows = []
+        for trip in traces.trips(max(1, -(-max_rows // 30))):
+            state = service._new_session_state()
+            for p in trip:
+                state.append(p["lat"], p["lon"], datetime.fromisoformat(p["timestamp"]))
+                feats = state.features()
+                rows.append([float(feats.get(c, 0.0)) for c in fcols])
+        self.X_raw = np.asarray(rows[:max_rows], dtype=float)
+        self.Xs = service.scaler.transform(self.X_raw)
+
+
+def stage_timestamp_parse(fx, n):
+    stamps = fx.iso_stamps[:n]
+    parse = fx.service._parse_timestamp
+    return (lambda: [parse(s) for s in stamps]), len(stamps)
+
+
+def stage_features(fx, n):
+    from feature_engineering import compute_session_features
+    pts = fx.history[:n]
+    svc = fx.service
+    return (lambda: compute_session_features(pts, hotspot_index=svc.hotspot_index,
+                                             hotspot_radius=svc.HOTSPOT_RADIUS)), 1
+
+
+def stage_features_incremental(fx, n):
+    from feature_engineering import SessionFeatureState
+    svc = fx.service
+    state = SessionFeatureState(maxlen=n, hotspot_index=svc.hotspot_index, hotspot_radius=svc.HOTSPOT_RADIUS)
+    for p in fx.history[:n]:
+        state.append(p["lat"], p["lon"], p["timestamp"])
+    # steady state: every call appends one point (evicting the oldest) and reads the features
+    feed = itertools.cycle(fx.history)
+    ts = [fx.history[n - 1]["timestamp"]]
+
+    def step():
+        p = next(feed)
+        ts[0] += timedelta(seconds=120)
+        state.append(p["lat"], p["lon"], ts[0])
+        return state.features()
+    return step, 1
+
+
+def _rows(fx, n):
+    reps = -(-n // len(fx.Xs))
+    return np.tile(fx.X_raw, (reps, 1))[:n], np.tile(fx.Xs, (reps, 1))[:n]
+
+
+def stage_scaler(fx, n):
+    X_raw, _ = _rows(fx, n)
+    return (lambda: fx.service.scaler.transform(X_raw)), n
+
+
+def stage_iforest(fx, n):
+    _, Xs = _rows(fx, n)
+    if fx.service.compiled_iso is None:
+        return None
+    return (lambda: fx.service.compiled_iso.score(Xs)), n
+
+
+def stage_iforest_sklearn(fx, n):
+    _, Xs = _rows(fx, n)
+    iso = fx.service._sklearn_iso()
+    return (lambda: iso.decision_function(Xs)), n
+
+
+def stage_dbscan(fx, n):
+    _, Xs = _rows(fx, n)
+    if fx.service.core_index is None:
+        return None
+    return (lambda: fx.service.core_index.score(Xs)), n
+
+
+def _probe_cycle(fx, centre, spread_deg=0.5):
+    lats = centre[0] + fx.rng.uniform(-spread_deg, spread_deg, 1024)
+    lons = centre[1] + fx.rng.uniform(-spread_deg, spread_deg, 1024)
+    return itertools.cycle(list(zip(lats.tolist(), lons.tolist())))
+
+
+def stage_zones(fx, n):
+    import generate_data
+    centre = (generate_data.BASE_LAT, generate_data.BASE_LON)
+    fx.service.zone_index.set_static(square_zones(n, centre, fx.rng))
+    probes = _probe_cycle(fx, centre)
+    return (lambda: fx.service.point_in_any_zone(*next(probes))), 1
+
+
+def stage_open_water(fx, n):
+    fx.service.zone_index.set_static(square_zones(n, OFFSHORE, fx.rng))
+    probes = _probe_cycle(fx, OFFSHORE)
+    return (lambda: fx.service.detect_open_water(*next(probes), False)), 1
+
+
+def stage_group(fx, n):
+    from group_separation import GroupSeparation
+    import generate_data
+    svc = fx.service
+    group = GroupSeparation(svc.GROUP_DISTANCE_KM, svc.GROUP_MEMBER_STALE_SECONDS or None)
+    lats = generate_data.BASE_LAT + fx.rng.uniform(-0.05, 0.05, n)
+    lons = generate_data.BASE_LON + fx.rng.uniform(-0.05, 0.05, n)
+    clock = [0.0]
+    for uid in range(n):
+        clock[0] += 1.0
+        group.update(uid, lats[uid], lons[uid], clock[0])
+    moves = itertools.cycle(fx.rng.integers(0, n, 4096).tolist())
+
+    def step():
+        uid = next(moves)
+        clock[0] += 1.0
+        lats[uid] += fx.rng.uniform(-0.002, 0.002)
+        return group.update(uid, lats[uid], lons[uid], clock[0])
+    return step, 1
+
+
+def stage_shap(fx, n):
+    from explanations import ShapExplanations
+    explainer = fx.service.shap_explanations.ensure_explainer()
+    if explainer is None:
+        return None
+    _, Xs = _rows(fx, n)
+    uncached = ShapExplanations(explainer, fx.service.shap_explanations.feature_names, cache_size=0)
+    return (lambda: uncached.explain(Xs)), n
+
+
+def stage_db_insert(fx, n):
+    import database
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+    rows = [{
+        "session_id": 1, "user_id": 1, "group_id": None, "lat": p["lat"], "lon": p["lon"],
+        "timestamp": now, "risk_score": 0.25, "anomaly_flag": 0, "geo_flag": 0, "inactivity_flag": 0,
+        "group_flag": 0, "reasons": ["iforest_anomaly"], "factors": [],
+    } for p in (fx.history * (n // len(fx.history) + 1))[:n]]
+    return (lambda: database.save_prediction_rows(rows)), n
+
+
+STAGES = {
+    "timestamp_parse": ("batch", ROWS, stage_timestamp_parse),
+    "features": ("history", HISTORY, stage_features),
+    "features_incremental": ("history", HISTORY, stage_features_incremental),
+    "scaler": ("rows", ROWS, stage_scaler),
+    "iforest": ("rows", ROWS, stage_iforest),
+    "iforest_sklearn": ("rows", ROWS, stage_iforest_sklearn),
+    "dbscan": ("rows", ROWS, stage_dbscan),
+    "zones": ("zones", ZONES, stage_zones),
+    "open_water": ("zones", ZONES, stage_open_water),
+    "group": ("group_size", GROUPS, stage_group),
+    "shap": ("rows", [1, 10, 100], stage_shap),
+    "db_insert": ("rows", ROWS, stage_db_insert),
+}
+
+
+def plot(report, path):
+    """Log-log scaling curve (median time per call) for every stage."""
+    try:
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+    except ImportError:
+        _log("matplotlib is not installed; skipping the plot")
+        return False
+    stages = [(name, s) for name, s in report["stages"].items() if s["results"]]
+    cols = 3
+    rows = -(-len(stages) // cols)
+    fig, axes = plt.subplots(rows, cols, figsize=(4.2 * cols, 3.2 * rows), squeeze=False)
+    for ax, (name, s) in zip(axes.flat, stages):
+        xs = [int(k) for k in s["results"]]
+        ax.loglog(xs, [r["median_us"] for r in s["results"].values()], "o-", label="median")
+        ax.loglog(xs, [r["p95_us"] for r in s["results"].values()], "x--", alpha=0.6, label="p95")
+        ax.set_title(name)
+        ax.set_xlabel(s["param"])
+        ax.set_ylabel("µs per call")
+        ax.grid(True, which="both", alpha=0.3)
+        ax.legend(fontsize="small")
+    for ax in list(axes.flat)[len(stages):]:
+        ax.axis("off")
+    fig.suptitle(f"scoring stages @ {(report['meta']['commit'] or 'unknown')[:10]}")
+    fig.tight_layout()
+    fig.savefig(path, dpi=110)
+    return True
+
+
+def parse_args(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    ap.add_argument("--out", help="write the JSON report here (default: stdout)")
+    ap.add_argument("--plot", help="also save scaling curves to this image (needs matplotlib)")
+    ap.add_argument("--stages", default=",".join(STAGES), help="comma-separated stages to run")
+    ap.add_argument("--min-seconds", type=float, default=0.2, help="minimum sampling time per point")
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--quick", action="store_true", help="small sweeps and short sampling, for a smoke run")
+    args = ap.parse_args(argv)
+    args.stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(args.stages) - set(STAGES)
+    if unknown:
+        ap.error(f"unknown stages: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    use_scratch_environment()
+    import app as service
+    service._load_models()  # no-op unless MODEL_LOADING defers it
+
+    cap = 100 if args.quick else None
+    sweeps = {
+        name: [v for v in STAGES[name][1] if cap is None or v <= cap] for name in args.stages
+    }
+    max_history = max([v for name in ("features", "features_incremental") for v in sweeps.get(name, [])] + [30])
+    fx = Fixtures(service, args.seed, max_history=max(max_history, 1000), max_rows=1000)
+    min_seconds = min(args.min_seconds, 0.05) if args.quick else args.min_seconds
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "db_backend": os.environ.get("DB_BACKEND"),
+            "min_seconds": min_seconds,
+        },
+        "stages": {},
+    }
+    for name in args.stages:
+        param, _values, setup = STAGES[name]
+        results = {}
+        for value in sweeps[name]:
+            bench = setup(fx, value)
+            if bench is None:
+                _log(f"{name}: not available in this build, skipped")
+                break
+            fn, items = bench
+            fn()  # warm caches and lazy initialisation outside the measurement
+            results[str(value)] = measure(fn, items, min_seconds=min_seconds)
+            _log(f"{name} {param}={value}: {results[str(value)]['median_us']:.1f} µs/call")
+        report["stages"][name] = {"param": param, "results": results}
+    service.zone_index.set_static([])
+
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text + "\n")
+        _log(f"wrote {args.out}")
+    else:
+        print(text)
+    if args.plot and plot(report, args.plot):
+        _log(f"wrote {args.plot}")
+    return report
+
+
+if __name__ == "__main__":
+    main()
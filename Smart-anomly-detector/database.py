@@ -3,11 +3,19 @@ MySQL database connection for Smart Anomaly Detector
 """
 import os
 import json
+import atexit
+import queue
+import sqlite3
+import threading
+import time
 from datetime import datetime, timezone
 from dotenv import load_dotenv
 import psycopg2
 from psycopg2 import sql
-from psycopg2.pool import SimpleConnectionPool
+from psycopg2.extras import execute_values
+from psycopg2.pool import ThreadedConnectionPool
+
+from metrics import metrics
 
 # Load .env
 BASE_DIR = os.path.dirname(__file__)
@@ -23,12 +31,100 @@ DB_CONFIG = {
     'port': int(os.getenv('DB_PORT', 5432)),
 }
 
-# Connection pool for Postgres
-pool = SimpleConnectionPool(minconn=1, maxconn=5, **DB_CONFIG)
+# "postgres" (default) or "sqlite": a local file database with the same table, used by
+# benchmarks and local runs without a Postgres server
+DB_BACKEND = os.getenv('DB_BACKEND', 'postgres').strip().lower()
+SQLITE_DB_PATH = os.getenv('SQLITE_DB_PATH', os.path.join(BASE_DIR, 'predictions.db'))
+
+
+class SqlitePool:
+    """Pool-shaped wrapper handing out one sqlite connection per thread (WAL mode)."""
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def getconn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0, check_same_thread=False)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def putconn(self, conn):
+        pass
+
+
+# Connection pool (thread-safe: shared by request threads and the background writer).
+# Opened on first use, so importing this module never waits on the database.
+pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    global pool
+    if pool is None:
+        with _pool_lock:
+            if pool is None:
+                if DB_BACKEND == 'sqlite':
+                    pool = SqlitePool(SQLITE_DB_PATH)
+                else:
+                    pool = ThreadedConnectionPool(minconn=1, maxconn=5, **DB_CONFIG)
+    return pool
+
+
+metrics.describe_histogram(
+    "detector_db_pool_wait_seconds", "Time spent obtaining a database connection from the pool",
+    (0.00001, 0.0001, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0),
+)
+
+
+def _getconn():
+    if not metrics.enabled:
+        return _get_pool().getconn()
+    started = time.perf_counter()
+    conn = _get_pool().getconn()
+    metrics.observe("detector_db_pool_wait_seconds", time.perf_counter() - started)
+    return conn
+
+
+def _init_sqlite():
+    conn = _getconn()
+    conn.execute(
+        """
+        CREATE TABLE IF NOT EXISTS predictions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER,
+            user_id INTEGER,
+            group_id INTEGER,
+            lat REAL,
+            lon REAL,
+            timestamp TEXT,
+            risk_score REAL,
+            anomaly_flag INTEGER,
+            geo_flag INTEGER,
+            inactivity_flag INTEGER,
+            group_flag INTEGER,
+            reasons TEXT,
+            created_at TEXT,
+            factors TEXT
+        )
+        """
+    )
+    columns = {r[1] for r in conn.execute('PRAGMA table_info(predictions)')}
+    if 'factors' not in columns:
+        conn.execute('ALTER TABLE predictions ADD COLUMN factors TEXT')
+    conn.commit()
+
 
 def init_db():
     """Initialize the predictions table in the Postgres database"""
-    conn = pool.getconn()
+    if DB_BACKEND == 'sqlite':
+        _init_sqlite()
+        return
+    conn = _getconn()
     cursor = conn.cursor()
     cursor.execute(
         """
@@ -46,35 +142,274 @@ def init_db():
             inactivity_flag SMALLINT,
             group_flag SMALLINT,
             reasons TEXT,
-            created_at TIMESTAMP
+            created_at TIMESTAMP,
+            factors TEXT
         )
         """
     )
+    # SHAP factors are stored with the prediction (possibly filled in later by a deferred explainer)
+    cursor.execute("ALTER TABLE predictions ADD COLUMN IF NOT EXISTS factors TEXT")
     conn.commit()
     cursor.close()
-    pool.putconn(conn)
+    _get_pool().putconn(conn)
+
+
+_INSERT_COLUMNS = (
+    "session_id", "user_id", "group_id", "lat", "lon", "timestamp", "risk_score",
+    "anomaly_flag", "geo_flag", "inactivity_flag", "group_flag", "reasons", "created_at", "factors",
+)
+
+
+def _row_values(row, created_at):
+    if DB_BACKEND == 'sqlite':
+        ts = row.get('timestamp')
+        row = dict(row, timestamp=ts.isoformat(sep=' ') if isinstance(ts, datetime) else ts)
+        created_at = created_at.isoformat(sep=' ')
+    return (
+        row.get('session_id'), row.get('user_id'), row.get('group_id'),
+        row.get('lat'), row.get('lon'), row.get('timestamp'), row.get('risk_score'),
+        row.get('anomaly_flag'), row.get('geo_flag'), row.get('inactivity_flag'),
+        row.get('group_flag'), json.dumps(row.get('reasons')), created_at,
+        json.dumps(row['factors']) if row.get('factors') else None,
+    )
 
 
 def save_prediction_row(row):
     """Save a prediction record to the Postgres database"""
-    conn = pool.getconn()
+    save_prediction_rows([row])
+
+
+def save_prediction_rows(rows):
+    """Save many prediction records with a single multi-row INSERT and one commit"""
+    if not rows:
+        return
+    created_at = datetime.now(timezone.utc)
+    conn = _getconn()
+    if DB_BACKEND == 'sqlite':
+        conn.executemany(
+            "INSERT INTO predictions ({}) VALUES ({})".format(
+                ", ".join(_INSERT_COLUMNS), ", ".join("?" for _ in _INSERT_COLUMNS)
+            ),
+            [_row_values(row, created_at) for row in rows],
+        )
+        conn.commit()
+        return
     cursor = conn.cursor()
-    cursor.execute(
-        sql.SQL(
-        """
-        INSERT INTO predictions
-        (session_id, user_id, group_id, lat, lon, timestamp, risk_score,
-         anomaly_flag, geo_flag, inactivity_flag, group_flag, reasons, created_at)
-        VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-        """
-        ),
-        (
-            row.get('session_id'), row.get('user_id'), row.get('group_id'),
-            row.get('lat'), row.get('lon'), row.get('timestamp'), row.get('risk_score'),
-            row.get('anomaly_flag'), row.get('geo_flag'), row.get('inactivity_flag'),
-            row.get('group_flag'), json.dumps(row.get('reasons')), datetime.now(timezone.utc)
+    try:
+        execute_values(
+            cursor,
+            sql.SQL("INSERT INTO predictions ({}) VALUES %s").format(
+                sql.SQL(", ").join(sql.Identifier(c) for c in _INSERT_COLUMNS)
+            ),
+            [_row_values(row, created_at) for row in rows],
         )
-    )
-    conn.commit()
-    cursor.close()
-    pool.putconn(conn)
+        conn.commit()
+    finally:
+        cursor.close()
+        _get_pool().putconn(conn)
+
+
+ALERT_COLUMNS = (
+    "id", "session_id", "user_id", "group_id", "lat", "lon", "timestamp", "risk_score", "reasons", "created_at",
+    "factors",
+)
+
+
+def fetch_recent_predictions(limit=50):
+    """Most recent prediction rows (newest first) as dicts with decoded reasons"""
+    conn = _getconn()
+    if DB_BACKEND == 'sqlite':
+        rows = conn.execute(
+            "SELECT {} FROM predictions ORDER BY id DESC LIMIT ?".format(", ".join(ALERT_COLUMNS)), (limit,)
+        ).fetchall()
+        return _decode_alerts(rows)
+    cursor = conn.cursor()
+    try:
+        cursor.execute(
+            sql.SQL("SELECT {} FROM predictions ORDER BY id DESC LIMIT %s").format(
+                sql.SQL(", ").join(sql.Identifier(c) for c in ALERT_COLUMNS)
+            ),
+            (limit,),
+        )
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+        _get_pool().putconn(conn)
+    return _decode_alerts(rows)
+
+
+def _decode_alerts(rows):
+    out = [dict(zip(ALERT_COLUMNS, r)) for r in rows]
+    for o in out:
+        o['reasons'] = json.loads(o['reasons']) if o.get('reasons') else []
+        o['factors'] = json.loads(o['factors']) if o.get('factors') else []
+    return out
+
+
+def ping():
+    """Round-trip a trivial query; raises on connection problems"""
+    conn = _getconn()
+    if DB_BACKEND == 'sqlite':
+        conn.execute('SELECT 1')
+        return
+    cursor = conn.cursor()
+    try:
+        cursor.execute('SELECT 1')
+    finally:
+        cursor.close()
+        _get_pool().putconn(conn)
+
+
+class PredictionWriter:
+    """Write-behind buffer that persists prediction rows off the request path.
+
+    Rows are placed on a bounded queue and a daemon thread flushes them with
+    multi-row INSERTs whenever ``batch_size`` rows are waiting or
+    ``flush_interval`` seconds have passed since the first buffered row. When
+    the queue is full, ``submit``/``submit_many`` block for up to ``put_timeout``
+    seconds per call (backpressure) and then write the rows that did not fit
+    synchronously rather than dropping them. ``stop`` drains everything still queued.
+    """
+
+    def __init__(self, max_queue=10000, batch_size=500, flush_interval=0.5, put_timeout=1.0, writer=None):
+        self.batch_size = max(1, int(batch_size))
+        self.flush_interval = max(0.01, float(flush_interval))
+        self.put_timeout = float(put_timeout)
+        self._write = writer or save_prediction_rows
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._lock = threading.Lock()
+        self._stopping = threading.Event()
+        self._thread = None
+        self._atexit_registered = False
+        self._enqueued = 0
+        self._written = 0
+        self._failed = 0
+        self._sync_fallbacks = 0
+        self._flushes = 0
+        self._flush_seconds_total = 0.0
+        self._flush_seconds_max = 0.0
+        self._last_flush_seconds = 0.0
+
+    def start(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stopping.clear()
+            self._thread = threading.Thread(target=self._run, name="prediction-writer", daemon=True)
+            self._thread.start()
+            if not self._atexit_registered:
+                atexit.register(self.stop)
+                self._atexit_registered = True
+
+    def submit(self, row):
+        self.submit_many([row])
+
+    def submit_many(self, rows):
+        """Enqueue rows for persistence; returns once they are buffered."""
+        if not rows:
+            return
+        self.start()
+        # one put_timeout for the whole batch: once the queue stays full that long,
+        # the remaining rows go straight to the synchronous fallback
+        deadline = time.monotonic() + self.put_timeout
+        overflow = []
+        for i, row in enumerate(rows):
+            try:
+                self._queue.put(row, timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Full:
+                overflow = list(rows[i:])
+                break
+        with self._lock:
+            self._enqueued += len(rows) - len(overflow)
+        if overflow:
+            with self._lock:
+                self._sync_fallbacks += len(overflow)
+            self._flush(overflow)
+
+    def _run(self):
+        while True:
+            try:
+                first = self._queue.get(timeout=self.flush_interval)
+            except queue.Empty:
+                if self._stopping.is_set():
+                    return
+                continue
+            batch = [first]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    if remaining > 0:
+                        batch.append(self._queue.get(timeout=remaining))
+                    elif self._stopping.is_set():
+                        batch.append(self._queue.get_nowait())  # draining on shutdown
+                    else:
+                        break
+                except queue.Empty:
+                    break
+            self._flush(batch)
+            for _ in batch:
+                self._queue.task_done()
+
+    def _flush(self, batch, attempts=3):
+        started = time.perf_counter()
+        for attempt in range(attempts):
+            try:
+                self._write(batch)
+                break
+            except Exception as e:
+                if attempt == attempts - 1:
+                    print(f"[db] Dropping {len(batch)} prediction rows after {attempts} attempts: {e}")
+                    with self._lock:
+                        self._failed += len(batch)
+                    return
+                time.sleep(0.1 * (2 ** attempt))
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._written += len(batch)
+            self._flushes += 1
+            self._last_flush_seconds = elapsed
+            self._flush_seconds_total += elapsed
+            self._flush_seconds_max = max(self._flush_seconds_max, elapsed)
+        metrics.observe("detector_stage_seconds", elapsed, stage="db_flush")
+
+    def flush(self, timeout=None):
+        """Block until every row enqueued so far has been written (or failed)."""
+        if self._thread is None:
+            return True
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def stop(self, timeout=10.0):
+        """Flush remaining rows and stop the background thread."""
+        self._stopping.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+
+    def stats(self):
+        with self._lock:
+            flushes = self._flushes
+            return {
+                "queue_depth": self._queue.qsize(),
+                "queue_capacity": self._queue.maxsize,
+                "enqueued": self._enqueued,
+                "written": self._written,
+                "failed": self._failed,
+                "sync_fallbacks": self._sync_fallbacks,
+                "flushes": flushes,
+                "last_flush_ms": round(self._last_flush_seconds * 1000.0, 3),
+                "avg_flush_ms": round(self._flush_seconds_total * 1000.0 / flushes, 3) if flushes else 0.0,
+                "max_flush_ms": round(self._flush_seconds_max * 1000.0, 3),
+            }
+
+
+prediction_writer = PredictionWriter(
+    max_queue=int(os.getenv('PREDICTION_QUEUE_SIZE', 10000)),
+    batch_size=int(os.getenv('PREDICTION_FLUSH_ROWS', 500)),
+    flush_interval=float(os.getenv('PREDICTION_FLUSH_MS', 500)) / 1000.0,
+)
@@ -0,0 +1,248 @@
+"""SHAP explanations for the Smart Anomaly Detector, batched, cached and deferrable.
+
+``TreeExplainer.shap_values`` over the 300-tree IsolationForest costs far
+more than scoring the point, so the service decides per row whether (and
+when) to pay for it:
+
+* :class:`ShapExplanations` explains a matrix of *scaled* feature rows with a
+  single SHAP call for the rows it has not seen before. Results are kept in
+  an LRU cache keyed on the row quantised to ``quantum`` (in scaled units), so
+  a stationary tourist producing the same state over and over is explained
+  once.
+  The explainer can be given as a factory, built on the first explanation,
+  so ``shap`` (slow to import) is never imported by a service that does not
+  explain anything.
+* :class:`DeferredExplanations` computes explanations on a background thread
+  in batches and only then hands the prediction rows (now carrying their
+  factors) to the persistence sink, so the request never waits for SHAP.
+"""
+from __future__ import annotations
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+EXPLAIN_MODES = ("off", "always", "sampled", "deferred")
+
+
+def format_factors(values: Sequence[float], feature_names: Sequence[str], top_k: int = 6) -> List[Dict[str, float]]:
+    """Top ``top_k`` features by absolute SHAP value with their share of the total."""
+    try:
+        vals_list = values.tolist()
+    except Exception:
+        vals_list = list(values)
+    pairs = list(zip(feature_names, vals_list))
+    pairs.sort(key=lambda x: abs(x[1]) if x[1] is not None else 0, reverse=True)
+    total_abs = sum(abs(v) for _, v in pairs) or 1.0
+    return [{"name": name, "shap_value": float(val), "weight": float(abs(val) / total_abs)} for name, val in pairs[:top_k]]
+
+
+class ShapExplanations:
+    """Batched SHAP factors for scaled feature rows with a quantised LRU cache."""
+
+    def __init__(
+        self,
+        explainer,
+        feature_names: Sequence[str],
+        cache_size: int = 4096,
+        quantum: float = 1e-3,
+        top_k: int = 6,
+        explainer_factory: Optional[Callable[[], object]] = None,
+    ) -> None:
+        self.explainer = explainer
+        self._factory = explainer_factory if explainer is None else None
+        self._build_lock = threading.Lock()
+        self.feature_names = list(feature_names)
+        self.cache_size = max(0, int(cache_size))
+        self.quantum = float(quantum) if quantum and quantum > 0 else None
+        self.top_k = int(top_k)
+        self._cache: "OrderedDict[bytes, List[Dict[str, float]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.computed_rows = 0
+        self.compute_seconds = 0.0
+
+    @property
+    def available(self) -> bool:
+        return self.explainer is not None or self._factory is not None
+
+    def ensure_explainer(self):
+        """Build the explainer from the factory if not done yet; None when it cannot be built."""
+        if self.explainer is None and self._factory is not None:
+            with self._build_lock:
+                if self.explainer is None and self._factory is not None:
+                    try:
+                        self.explainer = self._factory()
+                    except Exception as e:
+                        print(f"[explain] SHAP explainer unavailable: {e}")
+                    self._factory = None
+        return self.explainer
+
+    def _key(self, row: np.ndarray) -> bytes:
+        if self.quantum is None:
+            return np.asarray(row, dtype=np.float64).tobytes()
+        return np.rint(np.asarray(row, dtype=np.float64) / self.quantum).astype(np.int64).tobytes()
+
+    def explain(self, Xs: np.ndarray) -> List[List[Dict[str, float]]]:
+        """Factors for every row of the scaled matrix ``Xs`` (one SHAP call for all misses)."""
+        Xs = np.atleast_2d(np.asarray(Xs, dtype=float))
+        out: List[Optional[List[Dict[str, float]]]] = [None] * len(Xs)
+        if not len(Xs) or self.ensure_explainer() is None:
+            return [[] for _ in range(len(Xs))]
+
+        keys = [self._key(row) for row in Xs]
+        todo: Dict[bytes, List[int]] = {}
+        with self._lock:
+            for i, key in enumerate(keys):
+                hit = self._cache.get(key) if self.cache_size else None
+                if hit is not None:
+                    self._cache.move_to_end(key)
+                    out[i] = hit
+                    self.hits += 1
+                else:
+                    todo.setdefault(key, []).append(i)
+                    self.misses += 1
+        if todo:
+            # one representative row per distinct quantised state
+            firsts = [idx[0] for idx in todo.values()]
+            t0 = time.perf_counter()
+            try:
+                vals = self.explainer.shap_values(Xs[firsts])
+                sv = np.atleast_2d(vals[0] if isinstance(vals, list) else vals)
+                computed = [format_factors(row, self.feature_names, self.top_k) for row in sv]
+            except Exception:
+                computed = [[] for _ in firsts]
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.computed_rows += len(firsts)
+                self.compute_seconds += elapsed
+                for (key, idx), factors in zip(todo.items(), computed):
+                    for i in idx:
+                        out[i] = factors
+                    if self.cache_size and factors:
+                        self._cache[key] = factors
+                        if len(self._cache) > self.cache_size:
+                            self._cache.popitem(last=False)
+        return out
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "cache_entries": len(self._cache),
+                "cache_size": self.cache_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "computed_rows": self.computed_rows,
+                "compute_seconds": round(self.compute_seconds, 6),
+            }
+
+
+class DeferredExplanations:
+    """Background thread that explains prediction rows in batches, then persists them.
+
+    ``submit`` never blocks: when the queue is full the row is passed to the
+    sink straight away without factors, so persistence is never lost to a
+    SHAP backlog. Likewise a batch whose explanation fails is persisted
+    without factors.
+    """
+
+    def __init__(
+        self,
+        explanations: ShapExplanations,
+        sink: Callable[[List[dict]], object],
+        max_queue: int = 10000,
+        batch_size: int = 64,
+    ) -> None:
+        self.explanations = explanations
+        self.sink = sink
+        self.batch_size = max(1, int(batch_size))
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.explained = 0
+        self.overflowed = 0
+        self.failed = 0
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="deferred-shap", daemon=True)
+            self._thread.start()
+
+    def submit_many(self, Xs: np.ndarray, rows: List[dict]) -> None:
+        overflow = []
+        for x, row in zip(np.atleast_2d(Xs), rows):
+            try:
+                self._queue.put_nowait((x, row))
+            except queue.Full:
+                overflow.append(row)
+        if overflow:
+            with self._lock:
+                self.overflowed += len(overflow)
+            self.sink(overflow)
+
+    def _drain(self, block: bool) -> List[tuple]:
+        items = []
+        try:
+            items.append(self._queue.get(timeout=0.2) if block else self._queue.get_nowait())
+            while len(items) < self.batch_size:
+                items.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        return items
+
+    def _process(self, items: List[tuple]) -> None:
+        if not items:
+            return
+        Xs = np.vstack([x for x, _ in items])
+        rows = [row for _, row in items]
+        try:
+            explained = self.explanations.explain(Xs)
+        except Exception as e:
+            print(f"[explain] Deferred explanation batch failed, storing rows without factors: {e}")
+            with self._lock:
+                self.failed += len(rows)
+        else:
+            for row, factors in zip(rows, explained):
+                row["factors"] = factors
+            with self._lock:
+                self.explained += len(rows)
+        self.sink(rows)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                self._process(self._drain(block=True))
+            except Exception as e:
+                print(f"[explain] Deferred explanation rows could not be stored: {e}")
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Stop the thread and explain/persist whatever is still queued."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+        while True:
+            items = self._drain(block=False)
+            if not items:
+                break
+            self._process(items)
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "queued": self._queue.qsize(),
+                "explained": self.explained,
+                "overflowed": self.overflowed,
+                "failed": self.failed,
+            }
+
+
+__all__ = ["DeferredExplanations", "EXPLAIN_MODES", "ShapExplanations", "format_factors"]
@@ -10,13 +10,17 @@ from __future__ import annotations
 import json
 import math
 import os
-from collections import Counter
+import sys
+from array import array
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
 from typing import Dict, Iterable, List, Optional, Sequence, Tuple
 
 import numpy as np
 import pandas as pd
 
-DEFAULT_GRID_SIZE = 0.02  # ~2.2km at the equator
+from hotspot_grid import DEFAULT_GRID_SIZE, HotspotGrid, LiveHotspotGrid
+
 DEFAULT_HOTSPOT_RADIUS = 1  # look at the centre cell plus immediate neighbours
 
 
@@ -32,137 +36,90 @@ def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
     return r * c
 
 
-def _grid_scale(grid_size: float) -> int:
-    return max(1, int(round(1.0 / max(grid_size, 1e-6))))
-
-
-def _cell_key(lat_idx: int, lon_idx: int) -> str:
-    return f"{lat_idx}|{lon_idx}"
-
-
-def _cell_indices(lat: float, lon: float, grid_size: float) -> Tuple[int, int]:
-    scale = _grid_scale(grid_size)
-    lat_idx = int(round(lat * scale))
-    lon_idx = int(round(lon * scale))
-    return lat_idx, lon_idx
+def as_hotspot_grid(hotspot_index) -> Optional[HotspotGrid]:
+    """Accept a (live) :class:`HotspotGrid` or the legacy dict form (``None`` stays ``None``)."""
+    if hotspot_index is None or isinstance(hotspot_index, (HotspotGrid, LiveHotspotGrid)):
+        return hotspot_index
+    if not hotspot_index:
+        return None
+    return HotspotGrid.from_index(hotspot_index)
 
 
 def build_hotspot_index(
     reviews_df: pd.DataFrame,
     grid_size: float = DEFAULT_GRID_SIZE,
-) -> Dict[str, object]:
+) -> HotspotGrid:
     """Aggregate incident/review severities into a grid for fast lookup."""
     if reviews_df is None or reviews_df.empty:
-        return {
-            "grid_size": float(grid_size),
-            "scale": _grid_scale(grid_size),
-            "cells": {},
-        }
+        return HotspotGrid.from_points([], [], [], grid_size=grid_size)
 
-    cells: Dict[str, Dict[str, float]] = {}
     required = {"lat", "lon", "severity_score"}
     if not required.issubset(reviews_df.columns):
         raise ValueError("reviews dataframe missing required columns")
 
-    scale = _grid_scale(grid_size)
-    for row in reviews_df.itertuples(index=False):
-        lat = float(getattr(row, "lat"))
-        lon = float(getattr(row, "lon"))
-        sev = float(getattr(row, "severity_score"))
-        lat_idx, lon_idx = _cell_indices(lat, lon, grid_size)
-        key = _cell_key(lat_idx, lon_idx)
-        cell = cells.setdefault(
-            key,
-            {
-                "lat_idx": lat_idx,
-                "lon_idx": lon_idx,
-                "count": 0,
-                "severity_sum": 0.0,
-                "max_severity": 0.0,
-            },
-        )
-        cell["count"] += 1
-        cell["severity_sum"] += sev
-        if sev > cell["max_severity"]:
-            cell["max_severity"] = sev
-
-    return {
-        "grid_size": float(grid_size),
-        "scale": scale,
-        "cells": cells,
-    }
+    return HotspotGrid.from_points(
+        reviews_df["lat"].astype(float).to_numpy(),
+        reviews_df["lon"].astype(float).to_numpy(),
+        reviews_df["severity_score"].astype(float).to_numpy(),
+        grid_size=grid_size,
+    )
 
 
-def save_hotspot_index(index: Dict[str, object], path: str) -> None:
-    """Persist the hotspot index as JSON."""
-    serialisable = {
-        "grid_size": float(index.get("grid_size", DEFAULT_GRID_SIZE)),
-        "scale": int(index.get("scale", _grid_scale(DEFAULT_GRID_SIZE))),
-        "cells": {},
-    }
-    cells = index.get("cells", {}) or {}
-    for key, cell in cells.items():
-        serialisable["cells"][str(key)] = {
-            "lat_idx": int(cell.get("lat_idx", 0)),
-            "lon_idx": int(cell.get("lon_idx", 0)),
-            "count": int(cell.get("count", 0)),
-            "severity_sum": float(cell.get("severity_sum", 0.0)),
-            "max_severity": float(cell.get("max_severity", 0.0)),
-        }
+def update_hotspot_index(index: LiveHotspotGrid, reports_df: pd.DataFrame) -> int:
+    """Fold new incident reports (``lat``, ``lon``, ``severity_score``, optional
+    ``timestamp``) into a live hotspot grid; returns the number of reports added."""
+    if reports_df is None or reports_df.empty:
+        return 0
+    required = {"lat", "lon", "severity_score"}
+    if not required.issubset(reports_df.columns):
+        raise ValueError("reports dataframe missing required columns")
+    timestamps = None
+    if "timestamp" in reports_df.columns:
+        ts = pd.to_datetime(reports_df["timestamp"], errors="coerce", utc=True)
+        if ts.notna().all():
+            timestamps = (ts - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+    return index.add(
+        reports_df["lat"].astype(float).to_numpy(),
+        reports_df["lon"].astype(float).to_numpy(),
+        reports_df["severity_score"].astype(float).to_numpy(),
+        timestamps,
+    )
+
+
+def save_hotspot_index(index, path: str) -> None:
+    """Persist the hotspot index: binary grid for ``.bin`` paths, JSON otherwise."""
+    grid = as_hotspot_grid(index) or HotspotGrid.from_points([], [], [])
+    if isinstance(grid, LiveHotspotGrid):
+        grid = grid.compact()
+    if path.endswith(".bin"):
+        grid.save(path)
+        return
     with open(path, "w", encoding="utf-8") as fh:
-        json.dump(serialisable, fh, indent=2)
+        json.dump(grid.to_index(), fh, indent=2)
 
 
-def load_hotspot_index(path: str) -> Optional[Dict[str, object]]:
+def load_hotspot_index(path: str) -> Optional[HotspotGrid]:
+    """Load a hotspot index; ``.bin`` files are memory-mapped, anything else is parsed as JSON."""
     if not path or not os.path.exists(path):
         return None
+    if path.endswith(".bin"):
+        return HotspotGrid.load(path)
     with open(path, "r", encoding="utf-8") as fh:
         raw = json.load(fh)
-    scale = int(raw.get("scale", _grid_scale(raw.get("grid_size", DEFAULT_GRID_SIZE))))
-    grid_size = float(raw.get("grid_size", DEFAULT_GRID_SIZE))
-    cells = {}
-    for key, cell in (raw.get("cells") or {}).items():
-        cells[str(key)] = {
-            "lat_idx": int(cell.get("lat_idx", 0)),
-            "lon_idx": int(cell.get("lon_idx", 0)),
-            "count": int(cell.get("count", 0)),
-            "severity_sum": float(cell.get("severity_sum", 0.0)),
-            "max_severity": float(cell.get("max_severity", 0.0)),
-        }
-    return {"grid_size": grid_size, "scale": scale, "cells": cells}
+    return HotspotGrid.from_index(raw)
 
 
 def _compute_hotspot_stats(
     lat: float,
     lon: float,
-    hotspot_index: Optional[Dict[str, object]],
+    hotspot_index: Optional[HotspotGrid],
     radius_cells: int = DEFAULT_HOTSPOT_RADIUS,
 ) -> Tuple[float, int]:
     """Return (avg_severity, total_count) for neighbouring hotspot cells."""
-    if not hotspot_index:
+    grid = as_hotspot_grid(hotspot_index)
+    if grid is None:
         return 0.0, 0
-    cells = hotspot_index.get("cells") or {}
-    grid_size = float(hotspot_index.get("grid_size", DEFAULT_GRID_SIZE))
-    scale = int(hotspot_index.get("scale", _grid_scale(grid_size)))
-    lat_idx, lon_idx = _cell_indices(lat, lon, grid_size)
-
-    total_count = 0
-    total_severity = 0.0
-    for dlat in range(-radius_cells, radius_cells + 1):
-        for dlon in range(-radius_cells, radius_cells + 1):
-            key = _cell_key(lat_idx + dlat, lon_idx + dlon)
-            cell = cells.get(key)
-            if not cell:
-                continue
-            c = int(cell.get("count", 0))
-            if c <= 0:
-                continue
-            total_count += c
-            total_severity += float(cell.get("severity_sum", 0.0))
-
-    if total_count <= 0:
-        return 0.0, 0
-    return total_severity / total_count, total_count
+    return grid.stats(lat, lon, radius_cells)
 
 
 def detect_stops(
@@ -206,10 +163,11 @@ def _default_feature_row(session_id: Optional[int] = None) -> Dict[str, object]:
 def compute_session_features(
     points: Iterable[Dict[str, object]],
     session_id: Optional[int] = None,
-    hotspot_index: Optional[Dict[str, object]] = None,
+    hotspot_index: Optional[HotspotGrid] = None,
     hotspot_radius: int = DEFAULT_HOTSPOT_RADIUS,
 ) -> Dict[str, object]:
     """Compute the engineered feature vector for a sequence of GPS points."""
+    hotspot_index = as_hotspot_grid(hotspot_index)
     pts = list(points)
     feats = _default_feature_row(session_id=session_id)
     if not pts:
@@ -231,7 +189,7 @@ def compute_session_features(
     if df.empty:
         return feats
 
-    df = df.sort_values("timestamp")
+    df = df.sort_values("timestamp", kind="mergesort")
     timestamps = [pd.Timestamp(ts).to_pydatetime().replace(tzinfo=None) for ts in df["timestamp"]]
     coords = list(zip(df["lat"].tolist(), df["lon"].tolist()))
     if not timestamps:
@@ -301,6 +259,465 @@ def compute_session_features(
     return feats
 
 
+def haversine_km_array(lat1, lon1, lat2, lon2) -> np.ndarray:
+    """Vectorised :func:`haversine_km` over NumPy arrays."""
+    lat1 = np.radians(lat1)
+    lat2 = np.radians(lat2)
+    dlat = lat2 - lat1
+    dlon = np.radians(np.asarray(lon2) - np.asarray(lon1))
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+    return 6371.0 * c
+
+
+def _hotspot_stats_array(
+    lats: np.ndarray,
+    lons: np.ndarray,
+    hotspot_index: HotspotGrid,
+    radius_cells: int = DEFAULT_HOTSPOT_RADIUS,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Vectorised :func:`_compute_hotspot_stats` returning (avg_severity, count)."""
+    return as_hotspot_grid(hotspot_index).stats_array(lats, lons, radius_cells)
+
+
+def compute_session_features_batch(
+    df: pd.DataFrame,
+    hotspot_index: Optional[HotspotGrid] = None,
+    hotspot_radius: int = DEFAULT_HOTSPOT_RADIUS,
+) -> pd.DataFrame:
+    """Vectorised :func:`compute_session_features` for many sessions at once.
+
+    ``df`` holds one GPS point per row (``session_id``, ``lat``, ``lon``,
+    ``timestamp``). All sessions are sorted into contiguous blocks and every
+    feature is computed with array haversine, diff-based speeds and grouped
+    reductions, so the cost is a handful of passes over the arrays instead of
+    one Python loop per session. Returns one row per session with the columns
+    of :func:`_default_feature_row`.
+    """
+    columns = list(_default_feature_row().keys())
+    required = {"session_id", "lat", "lon", "timestamp"}
+    if df is None or df.empty or not required.issubset(df.columns):
+        return pd.DataFrame(columns=columns)
+
+    work = df[["session_id", "lat", "lon", "timestamp"]].dropna()
+    ts = pd.to_datetime(work["timestamp"], errors="coerce", utc=True)
+    keep = ts.notna().to_numpy()
+    if not keep.any():
+        return pd.DataFrame(columns=columns)
+    sid = work["session_id"].to_numpy()[keep].astype(np.int64)
+    lat = work["lat"].to_numpy()[keep].astype(float)
+    lon = work["lon"].to_numpy()[keep].astype(float)
+    ts = ts[keep]
+    epoch = (ts - pd.Timestamp(0, tz="UTC")).dt.total_seconds().to_numpy()
+
+    order = np.lexsort((epoch, sid))  # stable: ties keep input order
+    sid, lat, lon, epoch = sid[order], lat[order], lon[order], epoch[order]
+    hours = ts.dt.hour.to_numpy()[order]
+    weekdays = ts.dt.dayofweek.to_numpy()[order]
+
+    session_ids, starts, sizes = np.unique(sid, return_index=True, return_counts=True)
+    n_sessions = len(session_ids)
+    ends = starts + sizes - 1
+    group = np.repeat(np.arange(n_sessions), sizes)
+
+    out: Dict[str, np.ndarray] = {
+        "session_id": session_ids,
+        "hour": hours[ends].astype(np.int64),
+        "day_of_week": weekdays[ends].astype(np.int64),
+    }
+
+    # pairwise segments never cross a session boundary
+    same = sid[1:] == sid[:-1]
+    pair_group = group[:-1][same]
+    dist = haversine_km_array(lat[:-1], lon[:-1], lat[1:], lon[1:])[same]
+    dt_seconds = np.diff(epoch)[same]
+    moving = dt_seconds > 0
+    speed_group = pair_group[moving]
+    speeds = dist[moving] / (dt_seconds[moving] / 3600.0)
+
+    n_speeds = np.bincount(speed_group, minlength=n_sessions)
+    has_speed = n_speeds > 0
+    avg_speed = np.divide(
+        np.bincount(speed_group, weights=speeds, minlength=n_sessions),
+        n_speeds,
+        out=np.zeros(n_sessions),
+        where=has_speed,
+    )
+    sq_dev = (speeds - avg_speed[speed_group]) ** 2
+    var_speed = np.divide(
+        np.bincount(speed_group, weights=sq_dev, minlength=n_sessions),
+        n_speeds,
+        out=np.zeros(n_sessions),
+        where=has_speed,
+    )
+    max_speed = np.full(n_sessions, -np.inf)
+    np.maximum.at(max_speed, speed_group, speeds)
+    out["avg_speed"] = avg_speed
+    out["max_speed"] = np.where(has_speed, max_speed, 0.0)
+    out["std_speed"] = np.sqrt(var_speed)
+
+    total_distance = np.bincount(pair_group, weights=dist, minlength=n_sessions)
+    straight = haversine_km_array(lat[starts], lon[starts], lat[ends], lon[ends])
+    out["total_distance"] = total_distance
+    out["route_deviation_ratio"] = np.where(sizes >= 2, total_distance / (straight + 1e-6), 0.0)
+
+    is_stop = (dist < 0.2) & (dt_seconds > 300)
+    out["isolated_stops"] = np.bincount(pair_group, weights=is_stop, minlength=n_sessions).astype(np.int64)
+
+    night = (hours < 6) | (hours > 22)
+    out["night_fraction"] = np.bincount(group, weights=night, minlength=n_sessions) / sizes
+
+    cells = np.column_stack((group, np.round(lat, 3), np.round(lon, 3)))
+    uniq, cell_counts = np.unique(cells, axis=0, return_counts=True)
+    cell_group = uniq[:, 0].astype(np.int64)
+    p = cell_counts / sizes[cell_group]
+    out["location_entropy"] = np.bincount(cell_group, weights=-p * np.log(p), minlength=n_sessions)
+
+    last_gap = np.full(n_sessions, -1, dtype=np.int64)
+    np.maximum.at(last_gap, speed_group, np.flatnonzero(moving))
+    gaps = dt_seconds / 60.0
+    out["time_since_last"] = np.where(last_gap >= 0, gaps[np.maximum(last_gap, 0)], 0.0)
+
+    if hotspot_index:
+        recent = (ends[group] - np.arange(len(group))) < 10
+        sev, count = _hotspot_stats_array(lat[recent], lon[recent], hotspot_index, hotspot_radius)
+        recent_group = group[recent]
+        n_recent = np.bincount(recent_group, minlength=n_sessions)
+        out["crime_rate_local"] = np.bincount(recent_group, weights=sev, minlength=n_sessions) / n_recent
+        out["event_density_local"] = (
+            np.bincount(recent_group, weights=np.log1p(count), minlength=n_sessions) / n_recent
+        )
+    else:
+        out["crime_rate_local"] = np.zeros(n_sessions)
+        out["event_density_local"] = np.zeros(n_sessions)
+
+    return pd.DataFrame({c: out[c] for c in columns})
+
+
+_EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+# per-point flag bits in SessionFeatureState._flags
+_NIGHT = 1
+_DISORDERED = 2
+_STOP = 4  # the pair ending at this point is a stop
+
+
+def _to_us(ts: datetime) -> int:
+    if ts.tzinfo is not None:
+        ts = ts.astimezone(timezone.utc).replace(tzinfo=None)
+    return (ts - _EPOCH) // _US
+
+
+def _from_us(us: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=us)
+
+
+def _location_cell(lat: float, lon: float) -> int:
+    """``(round(lat, 3), round(lon, 3))`` packed into one small int (same equality)."""
+    return (round(round(lat, 3) * 1000) + 90_000) * 360_001 + round(round(lon, 3) * 1000) + 180_000
+
+
+class SessionFeatureState:
+    """Rolling accumulator producing :func:`compute_session_features` output.
+
+    The inference service appends one point per request; recomputing the full
+    window each time costs O(window) plus pandas overhead. This state keeps
+    running sums for every engineered feature so that appending a point (and
+    evicting the one leaving the window) is O(1). Points are expected in
+    timestamp order; while an out-of-order point is inside the window the
+    state falls back to the batch implementation so both paths stay identical.
+
+    The window lives in typed ring buffers (``array``) indexed by the point's
+    absolute position modulo ``maxlen``: coordinates, epoch microseconds,
+    flag bits and, for every point after the first, the distance/gap/speed of
+    the pair ending at it. That is ~49 bytes per point instead of a tuple of
+    Python objects, and the buffers only grow as far as the session's length.
+    Timestamps are naive UTC (aware ones are converted). Hotspot stats are
+    looked up when features are computed, for the last ``HOTSPOT_WINDOW``
+    points only, so new incidents and decay in a live grid reach points that
+    are already in the window.
+    """
+
+    __slots__ = (
+        "maxlen",
+        "hotspot_index",
+        "hotspot_radius",
+        "_lat",
+        "_lon",
+        "_us",
+        "_dist",
+        "_gap",
+        "_speed",
+        "_flags",
+        "_total",
+        "_n",
+        "_evictions",
+        "_disorder",
+        "_dist_sum",
+        "_speed_n",
+        "_speed_mean",
+        "_speed_m2",
+        "_speed_max",
+        "_last_gap",
+        "_stops",
+        "_night",
+        "_cells",
+        "_cell_clogc",
+    )
+
+    HOTSPOT_WINDOW = 10
+
+    def __init__(
+        self,
+        maxlen: int = 120,
+        hotspot_index: Optional[HotspotGrid] = None,
+        hotspot_radius: int = DEFAULT_HOTSPOT_RADIUS,
+    ) -> None:
+        self.maxlen = max(1, int(maxlen))
+        self.hotspot_index = as_hotspot_grid(hotspot_index)
+        self.hotspot_radius = int(hotspot_radius)
+        self._lat = array("d")
+        self._lon = array("d")
+        self._us = array("q")
+        # pair ending at the point: distance, gap minutes and speed (NaN = undefined)
+        self._dist = array("d")
+        self._gap = array("d")
+        self._speed = array("d")
+        self._flags = bytearray()
+        self._total = 0  # points ever appended; absolute index of the next point
+        self._n = 0  # points in the window
+        self._evictions = 0
+        self._disorder = 0
+        self._dist_sum = 0.0
+        self._speed_n = 0
+        self._speed_mean = 0.0
+        self._speed_m2 = 0.0  # Welford sum of squared deviations
+        self._speed_max: deque = deque()  # (seq, speed), speeds decreasing
+        self._last_gap: Optional[Tuple[int, float]] = None
+        self._stops = 0
+        self._night = 0
+        self._cells: Counter = Counter()
+        self._cell_clogc = 0.0  # sum of c * ln(c) over location cells
+
+    def __len__(self) -> int:
+        return self._n
+
+    def __getstate__(self) -> Dict[str, object]:
+        # the shared hotspot index is not part of a session's state; owners re-attach it
+        return {k: getattr(self, k) for k in self.__slots__ if k != "hotspot_index"}
+
+    def __setstate__(self, state: Dict[str, object]) -> None:
+        self.hotspot_index = None
+        for k, v in state.items():
+            if k in self.__slots__:  # states pickled by older versions carry cached hotspot stats
+                setattr(self, k, v)
+
+    def nbytes(self) -> int:
+        """Approximate memory held by the window, in bytes."""
+        arrays = (self._lat, self._lon, self._us, self._dist, self._gap, self._speed)
+        size = sum(a.buffer_info()[1] * a.itemsize for a in arrays) + len(self._flags)
+        # Counter entries: dict slot + packed int cell key
+        size += sys.getsizeof(self._cells) + len(self._cells) * 32
+        size += sys.getsizeof(self._speed_max) + len(self._speed_max) * 80
+        return size
+
+    def _window(self) -> range:
+        """Ring slots of the points in the window, oldest first."""
+        return range(self._total - self._n, self._total)
+
+    @property
+    def last_timestamp(self) -> Optional[datetime]:
+        """Timestamp of the most recently appended point (arrival order)."""
+        if not self._n:
+            return None
+        return _from_us(self._us[(self._total - 1) % self.maxlen])
+
+    def append(self, lat: float, lon: float, ts: datetime) -> None:
+        """Add a point, evicting the oldest one once the window is full."""
+        lat = float(lat)
+        lon = float(lon)
+        if self._n >= self.maxlen:
+            self._evict()
+
+        us = _to_us(ts)
+        flags = 0
+        dist, gap, speed = 0.0, math.nan, math.nan
+        if self._n:
+            prev = (self._total - 1) % self.maxlen
+            if us < self._us[prev]:
+                flags |= _DISORDERED
+                self._disorder += 1
+            dist, gap, speed, is_stop = self._add_pair(prev, lat, lon, us)
+            if is_stop:
+                flags |= _STOP
+
+        if ts.hour < 6 or ts.hour > 22:
+            flags |= _NIGHT
+            self._night += 1
+        self._bump_cell(_location_cell(lat, lon), 1)
+
+        slot = self._total % self.maxlen
+        row = (lat, lon, us, dist, gap, speed)
+        buffers = (self._lat, self._lon, self._us, self._dist, self._gap, self._speed)
+        if slot == len(self._flags):  # still growing towards maxlen
+            for buf, value in zip(buffers, row):
+                buf.append(value)
+            self._flags.append(flags)
+        else:
+            for buf, value in zip(buffers, row):
+                buf[slot] = value
+            self._flags[slot] = flags
+        self._total += 1
+        self._n += 1
+
+    def _add_pair(self, prev: int, lat: float, lon: float, us: int) -> Tuple[float, float, float, bool]:
+        dist = haversine_km(self._lat[prev], self._lon[prev], lat, lon)
+        dt_seconds = (us - self._us[prev]) / 10**6
+        seq = self._total  # a pair is identified by the absolute index of its second point
+        gap = speed = math.nan
+        if dt_seconds > 0:
+            speed = dist / (dt_seconds / 3600.0)
+            gap = dt_seconds / 60.0
+            self._speed_n += 1
+            delta = speed - self._speed_mean
+            self._speed_mean += delta / self._speed_n
+            self._speed_m2 += delta * (speed - self._speed_mean)
+            while self._speed_max and self._speed_max[-1][1] <= speed:
+                self._speed_max.pop()
+            self._speed_max.append((seq, speed))
+            self._last_gap = (seq, gap)
+        is_stop = dist < 0.2 and dt_seconds > 300
+        if is_stop:
+            self._stops += 1
+        self._dist_sum += dist
+        return dist, gap, speed, is_stop
+
+    def _evict(self) -> None:
+        first = self._total - self._n
+        slot = first % self.maxlen
+        flags = self._flags[slot]
+        if flags & _NIGHT:
+            self._night -= 1
+        self._bump_cell(_location_cell(self._lat[slot], self._lon[slot]), -1)
+        if flags & _DISORDERED:
+            self._disorder -= 1
+        self._n -= 1
+
+        if self._n:
+            # the pair (first, first + 1) leaves the window; it is stored at first + 1
+            seq = first + 1
+            nxt = seq % self.maxlen
+            nflags = self._flags[nxt]
+            if nflags & _DISORDERED:
+                # the new first point no longer has a predecessor to be out of order with
+                self._flags[nxt] = nflags & ~_DISORDERED
+                self._disorder -= 1
+            self._dist_sum -= self._dist[nxt]
+            if nflags & _STOP:
+                self._stops -= 1
+            speed = self._speed[nxt]
+            if speed == speed:  # not NaN
+                if self._speed_max and self._speed_max[0][0] == seq:
+                    self._speed_max.popleft()
+                self._speed_n -= 1
+                if self._speed_n == 0:
+                    self._speed_mean = 0.0
+                    self._speed_m2 = 0.0
+                elif self._speed_n == 1:
+                    # the surviving speed is necessarily the window maximum
+                    self._speed_mean = self._speed_max[0][1]
+                    self._speed_m2 = 0.0
+                else:
+                    delta = speed - self._speed_mean
+                    self._speed_mean -= delta / self._speed_n
+                    self._speed_m2 -= delta * (speed - self._speed_mean)
+            if self._last_gap is not None and self._last_gap[0] == seq:
+                self._last_gap = None
+
+        self._evictions += 1
+        if self._evictions % self.maxlen == 0:
+            self._resync()
+
+    def _bump_cell(self, cell: int, delta: int) -> None:
+        c = self._cells[cell]
+        if c > 0:
+            self._cell_clogc -= c * math.log(c)
+        c += delta
+        if c > 0:
+            self._cell_clogc += c * math.log(c)
+            self._cells[cell] = c
+        else:
+            del self._cells[cell]
+
+    def _resync(self) -> None:
+        """Recompute running float sums exactly to stop rounding drift."""
+        pair_slots = [a % self.maxlen for a in self._window()][1:]
+        speeds = [self._speed[s] for s in pair_slots if self._speed[s] == self._speed[s]]
+        self._dist_sum = math.fsum(self._dist[s] for s in pair_slots)
+        self._speed_n = len(speeds)
+        self._speed_mean = math.fsum(speeds) / len(speeds) if speeds else 0.0
+        self._speed_m2 = math.fsum((s - self._speed_mean) ** 2 for s in speeds)
+        self._cell_clogc = math.fsum(c * math.log(c) for c in self._cells.values())
+
+    def points(self) -> List[Dict[str, object]]:
+        """Return the window as point dicts accepted by compute_session_features."""
+        out = []
+        for a in self._window():
+            s = a % self.maxlen
+            out.append({"lat": self._lat[s], "lon": self._lon[s], "timestamp": _from_us(self._us[s])})
+        return out
+
+    def features(self, session_id: Optional[int] = None) -> Dict[str, object]:
+        """Return the feature row for the current window."""
+        if self._disorder > 0:
+            return compute_session_features(
+                self.points(),
+                session_id=session_id,
+                hotspot_index=self.hotspot_index,
+                hotspot_radius=self.hotspot_radius,
+            )
+
+        feats = _default_feature_row(session_id=session_id)
+        n = self._n
+        if n == 0:
+            return feats
+
+        first = (self._total - n) % self.maxlen
+        last = (self._total - 1) % self.maxlen
+        last_ts = _from_us(self._us[last])
+        feats["hour"] = int(last_ts.hour)
+        feats["day_of_week"] = int(last_ts.weekday())
+
+        if self._speed_n > 0:
+            var = max(0.0, self._speed_m2 / self._speed_n)
+            feats["avg_speed"] = float(self._speed_mean)
+            feats["max_speed"] = float(self._speed_max[0][1])
+            feats["std_speed"] = float(math.sqrt(var))
+        total_distance = max(0.0, self._dist_sum) if n >= 2 else 0.0
+        feats["total_distance"] = float(total_distance)
+        if n >= 2:
+            straight = haversine_km(self._lat[first], self._lon[first], self._lat[last], self._lon[last])
+            feats["route_deviation_ratio"] = float(total_distance / (straight + 1e-6))
+
+        feats["isolated_stops"] = int(self._stops)
+        feats["night_fraction"] = float(self._night / n)
+        feats["location_entropy"] = float(max(0.0, math.log(n) - self._cell_clogc / n))
+        feats["time_since_last"] = float(self._last_gap[1]) if self._last_gap else 0.0
+
+        if self.hotspot_index:
+            k = min(self.HOTSPOT_WINDOW, n)
+            sev_sum = log_count_sum = 0.0
+            for a in range(self._total - k, self._total):
+                s = a % self.maxlen
+                sev, count = self.hotspot_index.stats(self._lat[s], self._lon[s], self.hotspot_radius)
+                sev_sum += sev
+                log_count_sum += math.log1p(count)
+            feats["crime_rate_local"] = float(sev_sum / k)
+            feats["event_density_local"] = float(log_count_sum / k)
+
+        return feats
+
+
 def load_points_from_dataframe(df: pd.DataFrame) -> Dict[int, List[Dict[str, object]]]:
     required = {"session_id", "lat", "lon", "timestamp"}
     if not required.issubset(df.columns):
@@ -316,10 +733,16 @@ def load_points_from_dataframe(df: pd.DataFrame) -> Dict[int, List[Dict[str, obj
 __all__ = [
     "DEFAULT_GRID_SIZE",
     "DEFAULT_HOTSPOT_RADIUS",
+    "HotspotGrid",
+    "as_hotspot_grid",
     "build_hotspot_index",
+    "update_hotspot_index",
     "save_hotspot_index",
     "load_hotspot_index",
     "compute_session_features",
+    "compute_session_features_batch",
+    "SessionFeatureState",
     "load_points_from_dataframe",
     "haversine_km",
+    "haversine_km_array",
 ]
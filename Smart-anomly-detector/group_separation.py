@@ -0,0 +1,133 @@
+"""Incremental "is any pair of group members too far apart" tracking.
+
+The group rule flags a point when any two members of its group are more than
+``threshold_km`` apart. Comparing every pair on every update is O(n^2); here
+each group keeps its members' last positions bucketed in a lat/lon grid and
+maintains the number of far pairs incrementally. When a member moves, only
+the pairs involving that member change: for every occupied cell the distance
+from the member to the cell centre, plus or minus the cell radius (triangle
+inequality), proves that the whole cell is far or near, and only the members
+of cells straddling the threshold are measured individually. A tight group
+occupies one or two cells, so an update costs a handful of distance
+computations regardless of group size.
+
+Members that have not reported for ``stale_seconds`` (by point timestamps)
+are expired from a heap so a tourist who stopped sending updates cannot keep
+the flag raised.
+"""
+from __future__ import annotations
+
+import heapq
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from feature_engineering import haversine_km
+
+KM_PER_DEG_LAT = 111.32
+
+
+@lru_cache(maxsize=65536)
+def _cell_geometry(i: int, j: int, cell_deg: float) -> Tuple[float, float, float]:
+    """Centre and an upper bound on the centre-to-any-point distance of grid cell (i, j)."""
+    lat0, lon0 = i * cell_deg, j * cell_deg
+    clat, clon = lat0 + cell_deg / 2, lon0 + cell_deg / 2
+    probes = [
+        (lat0, lon0), (lat0, lon0 + cell_deg), (lat0 + cell_deg, lon0), (lat0 + cell_deg, lon0 + cell_deg),
+        (lat0, clon), (lat0 + cell_deg, clon), (clat, lon0), (clat, lon0 + cell_deg),
+    ]
+    radius = max(haversine_km(clat, clon, la, lo) for la, lo in probes)
+    # small safety margin so the bounds stay conservative under rounding
+    return clat, clon, radius * 1.001 + 1e-9
+
+
+class GroupSeparation:
+    """Last positions of one group's members plus a running count of far pairs."""
+
+    __slots__ = ("threshold_km", "stale_seconds", "cell_deg", "far_pairs", "_members", "_cells", "_heap", "_seq")
+
+    def __init__(self, threshold_km: float = 10.0, stale_seconds: Optional[float] = None) -> None:
+        self.threshold_km = float(threshold_km)
+        self.stale_seconds = float(stale_seconds) if stale_seconds else None
+        # cells about half the threshold across, so near cells are usually provably near
+        self.cell_deg = self.threshold_km / KM_PER_DEG_LAT / 2
+        self.far_pairs = 0
+        # user_id -> (lat, lon, ts, cell, seq)
+        self._members: Dict[object, Tuple[float, float, float, Tuple[int, int], int]] = {}
+        # cell -> {user_id: (lat, lon)}
+        self._cells: Dict[Tuple[int, int], Dict[object, Tuple[float, float]]] = {}
+        self._heap: List[Tuple[float, int, object]] = []
+        self._seq = 0
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    @property
+    def separated(self) -> bool:
+        return self.far_pairs > 0
+
+    def _cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(lat // self.cell_deg), int(lon // self.cell_deg)
+
+    def _far_count(self, lat: float, lon: float) -> int:
+        """Members currently in the grid farther than the threshold from (lat, lon)."""
+        limit = self.threshold_km
+        far = 0
+        for (i, j), members in self._cells.items():
+            clat, clon, radius = _cell_geometry(i, j, self.cell_deg)
+            d = haversine_km(lat, lon, clat, clon)
+            if d - radius > limit:
+                far += len(members)
+            elif d + radius > limit:
+                for mlat, mlon in members.values():
+                    if haversine_km(lat, lon, mlat, mlon) > limit:
+                        far += 1
+        return far
+
+    def _remove(self, user_id: object) -> None:
+        lat, lon, _ts, cell, _seq = self._members.pop(user_id)
+        members = self._cells[cell]
+        del members[user_id]
+        if not members:
+            del self._cells[cell]
+        self.far_pairs -= self._far_count(lat, lon)
+
+    def expire(self, now: float) -> int:
+        """Drop members whose last report is more than ``stale_seconds`` before ``now``."""
+        if self.stale_seconds is None:
+            return 0
+        cutoff = now - self.stale_seconds
+        dropped = 0
+        while self._heap and self._heap[0][0] < cutoff:
+            _ts, seq, user_id = heapq.heappop(self._heap)
+            member = self._members.get(user_id)
+            if member is not None and member[4] == seq:  # otherwise superseded by a newer report
+                self._remove(user_id)
+                dropped += 1
+        return dropped
+
+    def update(self, user_id: object, lat: float, lon: float, ts: float) -> bool:
+        """Record a member's position at epoch ``ts``; returns whether any pair is too far apart."""
+        self.expire(ts)
+        if user_id in self._members:
+            self._remove(user_id)
+        lat, lon, ts = float(lat), float(lon), float(ts)
+        self.far_pairs += self._far_count(lat, lon)
+        cell = self._cell_of(lat, lon)
+        self._cells.setdefault(cell, {})[user_id] = (lat, lon)
+        self._seq += 1
+        self._members[user_id] = (lat, lon, ts, cell, self._seq)
+        if self.stale_seconds is not None:
+            heapq.heappush(self._heap, (ts, self._seq, user_id))
+            if len(self._heap) > 4 * len(self._members) + 16:
+                self._compact_heap()
+        return self.far_pairs > 0
+
+    def _compact_heap(self) -> None:
+        self._heap = [(m[2], m[4], uid) for uid, m in self._members.items()]
+        heapq.heapify(self._heap)
+
+    def positions(self) -> List[Tuple[float, float]]:
+        return [(m[0], m[1]) for m in self._members.values()]
+
+
+__all__ = ["GroupSeparation"]
@@ -0,0 +1,654 @@
+"""Array-backed hotspot grid with O(1) neighbourhood queries.
+
+Incident reports are aggregated per grid cell (``count``, ``severity_sum``,
+``max_severity``). Cells are stored as parallel arrays sorted by a packed
+int64 cell key instead of a dict of dicts keyed by ``"lat|lon"`` strings.
+
+For lookups the grid also keeps summed-area tables of ``count`` and
+``severity_sum`` over the occupied rows and columns (coordinate-compressed,
+so a sparse grid spanning a whole country stays small). The totals of any
+``(2r+1) x (2r+1)`` neighbourhood are then four table reads after two
+binary searches, independent of the radius. Grids whose table would exceed
+``max_table_cells`` fall back to per-cell searches on the sorted keys.
+
+The binary on-disk format (``save``/``load``) is a small JSON header followed
+by 64-byte aligned arrays, which are memory-mapped on load so the service
+starts without parsing anything per cell.
+
+:class:`LiveHotspotGrid` wraps a grid so new incident reports can be folded in
+while it keeps serving queries, with optional time decay. :class:`HotspotPyramid`
+stacks 2x coarser levels of a grid for heatmap tiles at any zoom.
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from array_file import read_arrays, write_arrays
+
+DEFAULT_GRID_SIZE = 0.02  # ~2.2km at the equator
+DEFAULT_MAX_TABLE_CELLS = 16_000_000
+
+MAGIC = b"HSGRID01"
+_LAT_KEY_OFFSET = 1 << 29
+_LON_KEY_OFFSET = 1 << 31
+
+
+def grid_scale(grid_size: float) -> int:
+    return max(1, int(round(1.0 / max(grid_size, 1e-6))))
+
+
+def pack_cells(lat_idx, lon_idx) -> np.ndarray:
+    """Pack grid cell indices into sortable int64 keys."""
+    return (np.asarray(lat_idx, dtype=np.int64) + _LAT_KEY_OFFSET) * (1 << 32) + (
+        np.asarray(lon_idx, dtype=np.int64) + _LON_KEY_OFFSET
+    )
+
+
+def unpack_cells(keys) -> Tuple[np.ndarray, np.ndarray]:
+    keys = np.asarray(keys, dtype=np.int64)
+    return (keys >> 32) - _LAT_KEY_OFFSET, (keys & 0xFFFFFFFF) - _LON_KEY_OFFSET
+
+
+def _summed_area(ri: np.ndarray, ci: np.ndarray, values: np.ndarray, shape: Tuple[int, int], dtype) -> np.ndarray:
+    table = np.zeros((shape[0] + 1, shape[1] + 1), dtype=dtype)
+    np.add.at(table, (ri + 1, ci + 1), values)
+    np.cumsum(table, axis=0, out=table)
+    np.cumsum(table, axis=1, out=table)
+    return table
+
+
+class HotspotGrid:
+    """Per-cell incident aggregates plus summed-area tables for neighbourhood totals."""
+
+    def __init__(
+        self,
+        grid_size: float,
+        keys: Sequence[int],
+        count: Sequence[int],
+        severity_sum: Sequence[float],
+        max_severity: Sequence[float],
+        max_table_cells: int = DEFAULT_MAX_TABLE_CELLS,
+        tables: Optional[Dict[str, np.ndarray]] = None,
+        as_of: Optional[float] = None,
+    ) -> None:
+        self.grid_size = float(grid_size)
+        self.scale = grid_scale(self.grid_size)
+        self.max_table_cells = int(max_table_cells)
+        # POSIX time the (possibly decayed) counts refer to; None for undated training grids
+        self.as_of = float(as_of) if as_of is not None else None
+        keys = np.asarray(keys, dtype=np.int64)
+        count = np.asarray(count)
+        # counts are report totals, or decay-weighted (float) totals for live grids
+        count = count.astype(np.float64 if count.dtype.kind == "f" else np.int64, copy=False)
+        severity_sum = np.asarray(severity_sum, dtype=np.float64)
+        max_severity = np.asarray(max_severity, dtype=np.float64)
+        if len(keys) and np.any(keys[1:] <= keys[:-1]):
+            order = np.argsort(keys, kind="stable")
+            keys, count, severity_sum, max_severity = keys[order], count[order], severity_sum[order], max_severity[order]
+            if np.any(keys[1:] == keys[:-1]):
+                raise ValueError("duplicate hotspot cells")
+        self.keys = keys
+        self.count = count
+        self.severity_sum = severity_sum
+        self.max_severity = max_severity
+        self._eps = 1e-9 if count.dtype.kind == "f" else 0
+        if tables is None:
+            tables = self._build_tables()
+        self.rows = tables.get("rows")
+        self.cols = tables.get("cols")
+        self.sat_count = tables.get("sat_count")
+        self.sat_severity = tables.get("sat_severity")
+        self._row_list = self.rows.tolist() if self.rows is not None else None
+        self._col_list = self.cols.tolist() if self.cols is not None else None
+
+    # ------------------------------------------------------------------
+    # construction
+    # ------------------------------------------------------------------
+    @classmethod
+    def from_points(
+        cls,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        severities: Sequence[float],
+        grid_size: float = DEFAULT_GRID_SIZE,
+        **kwargs,
+    ) -> "HotspotGrid":
+        """Aggregate incident points into cells."""
+        scale = grid_scale(grid_size)
+        lat_idx = np.rint(np.asarray(lats, dtype=float) * scale).astype(np.int64)
+        lon_idx = np.rint(np.asarray(lons, dtype=float) * scale).astype(np.int64)
+        sev = np.asarray(severities, dtype=np.float64)
+        keys, inverse = np.unique(pack_cells(lat_idx, lon_idx), return_inverse=True)
+        count = np.bincount(inverse, minlength=len(keys)).astype(np.int64)
+        # np.add.at keeps the per-cell input order of the original row-by-row loop
+        severity_sum = np.zeros(len(keys))
+        np.add.at(severity_sum, inverse, sev)
+        max_severity = np.zeros(len(keys))
+        np.maximum.at(max_severity, inverse, sev)
+        return cls(grid_size, keys, count, severity_sum, max_severity, **kwargs)
+
+    @classmethod
+    def from_index(cls, index: Dict[str, object], **kwargs) -> "HotspotGrid":
+        """Build from the legacy ``{"grid_size", "scale", "cells": {"lat|lon": {...}}}`` dict."""
+        cells = list((index.get("cells") or {}).values())
+        return cls(
+            float(index.get("grid_size", DEFAULT_GRID_SIZE)),
+            pack_cells(
+                [int(c.get("lat_idx", 0)) for c in cells],
+                [int(c.get("lon_idx", 0)) for c in cells],
+            ),
+            [int(c.get("count", 0)) for c in cells],
+            [float(c.get("severity_sum", 0.0)) for c in cells],
+            [float(c.get("max_severity", 0.0)) for c in cells],
+            **kwargs,
+        )
+
+    def to_index(self) -> Dict[str, object]:
+        """The legacy dict form (as written to ``hotspot_index.json``)."""
+        lat_idx, lon_idx = unpack_cells(self.keys)
+        cells = {}
+        for li, lj, c, s, m in zip(
+            lat_idx.tolist(), lon_idx.tolist(), self.count.tolist(),
+            self.severity_sum.tolist(), self.max_severity.tolist(),
+        ):
+            cells[f"{li}|{lj}"] = {
+                "lat_idx": li, "lon_idx": lj, "count": c, "severity_sum": s, "max_severity": m,
+            }
+        return {"grid_size": self.grid_size, "scale": self.scale, "cells": cells}
+
+    def _build_tables(self) -> Dict[str, np.ndarray]:
+        positive = self.count > 0
+        lat_idx, lon_idx = unpack_cells(self.keys[positive])
+        rows = np.unique(lat_idx)
+        cols = np.unique(lon_idx)
+        if (len(rows) + 1) * (len(cols) + 1) > self.max_table_cells:
+            return {}
+        ri = np.searchsorted(rows, lat_idx)
+        ci = np.searchsorted(cols, lon_idx)
+        shape = (len(rows), len(cols))
+        return {
+            "rows": rows,
+            "cols": cols,
+            "sat_count": _summed_area(ri, ci, self.count[positive], shape, self.count.dtype),
+            "sat_severity": _summed_area(ri, ci, self.severity_sum[positive], shape, np.float64),
+        }
+
+    # ------------------------------------------------------------------
+    # queries
+    # ------------------------------------------------------------------
+    @property
+    def n_cells(self) -> int:
+        return int(len(self.keys))
+
+    @property
+    def total_count(self) -> int:
+        return int(self.count.sum())
+
+    def cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return int(round(lat * self.scale)), int(round(lon * self.scale))
+
+    def totals(self, lat: float, lon: float, radius_cells: int = 1) -> Tuple[float, float]:
+        """(severity_sum, count) over the cells within ``radius_cells`` of (lat, lon)."""
+        if self._row_list is None:
+            sev, count = self.totals_array([lat], [lon], radius_cells)
+            return float(sev[0]), count[0].item()
+        li, lj = self.cell_of(lat, lon)
+        r0 = bisect_left(self._row_list, li - radius_cells)
+        r1 = bisect_right(self._row_list, li + radius_cells)
+        c0 = bisect_left(self._col_list, lj - radius_cells)
+        c1 = bisect_right(self._col_list, lj + radius_cells)
+        if r0 >= r1 or c0 >= c1:
+            return 0.0, 0
+        S = self.sat_count
+        count = S.item(r1, c1) - S.item(r0, c1) - S.item(r1, c0) + S.item(r0, c0)
+        if count <= self._eps:
+            return 0.0, 0
+        V = self.sat_severity
+        severity = V.item(r1, c1) - V.item(r0, c1) - V.item(r1, c0) + V.item(r0, c0)
+        return severity, count
+
+    def stats(self, lat: float, lon: float, radius_cells: int = 1) -> Tuple[float, float]:
+        """(average severity, report count) over the cells within ``radius_cells`` of (lat, lon)."""
+        severity, count = self.totals(lat, lon, radius_cells)
+        if count <= self._eps:
+            return 0.0, 0
+        return severity / count, count
+
+    def totals_array(self, lats, lons, radius_cells: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorised :meth:`totals` returning (severity_sum, count) arrays."""
+        n = len(lats)
+        if n == 0 or not self.n_cells:
+            return np.zeros(n), np.zeros(n, dtype=self.count.dtype)
+        lat_idx = np.rint(np.asarray(lats, dtype=float) * self.scale).astype(np.int64)
+        lon_idx = np.rint(np.asarray(lons, dtype=float) * self.scale).astype(np.int64)
+        if self.rows is not None:
+            return self.rect_totals_array(
+                lat_idx - radius_cells, lat_idx + radius_cells, lon_idx - radius_cells, lon_idx + radius_cells
+            )
+        else:
+            positive = self.count > 0
+            keys, counts, sev = self.keys[positive], self.count[positive], self.severity_sum[positive]
+            total_count = np.zeros(n, dtype=self.count.dtype)
+            total_sev = np.zeros(n)
+            for dlat in range(-radius_cells, radius_cells + 1):
+                for dlon in range(-radius_cells, radius_cells + 1):
+                    q = pack_cells(lat_idx + dlat, lon_idx + dlon)
+                    pos = np.minimum(np.searchsorted(keys, q), len(keys) - 1)
+                    hit = keys[pos] == q
+                    total_count += np.where(hit, counts[pos], 0)
+                    total_sev += np.where(hit, sev[pos], 0.0)
+        empty = total_count <= self._eps
+        return np.where(empty, 0.0, total_sev), np.where(empty, 0, total_count)
+
+    def rect_totals_array(self, lat0, lat1, lon0, lon1) -> Tuple[np.ndarray, np.ndarray]:
+        """(severity_sum, count) over the cell index rectangles ``[lat0, lat1] x [lon0, lon1]`` (inclusive)."""
+        lat0, lat1, lon0, lon1 = (np.asarray(a, dtype=np.int64) for a in (lat0, lat1, lon0, lon1))
+        n = len(lat0)
+        if n == 0 or not self.n_cells:
+            return np.zeros(n), np.zeros(n, dtype=self.count.dtype)
+        if self.rows is not None:
+            r0 = np.searchsorted(self.rows, lat0, side="left")
+            r1 = np.maximum(np.searchsorted(self.rows, lat1, side="right"), r0)
+            c0 = np.searchsorted(self.cols, lon0, side="left")
+            c1 = np.maximum(np.searchsorted(self.cols, lon1, side="right"), c0)
+            S, V = self.sat_count, self.sat_severity
+            total_count = S[r1, c1] - S[r0, c1] - S[r1, c0] + S[r0, c0]
+            total_sev = V[r1, c1] - V[r0, c1] - V[r1, c0] + V[r0, c0]
+        else:
+            # no table: mask the occupied cells per rectangle
+            lat_idx, lon_idx = unpack_cells(self.keys)
+            total_count = np.zeros(n, dtype=self.count.dtype)
+            total_sev = np.zeros(n)
+            for q in range(n):
+                inside = (lat_idx >= lat0[q]) & (lat_idx <= lat1[q]) & (lon_idx >= lon0[q]) & (lon_idx <= lon1[q])
+                total_count[q] = self.count[inside].sum()
+                total_sev[q] = self.severity_sum[inside].sum()
+        empty = total_count <= self._eps
+        return np.where(empty, 0.0, total_sev), np.where(empty, 0, total_count)
+
+    def coarsen(self, shift: int = 1) -> "HotspotGrid":
+        """Aggregate ``2**shift x 2**shift`` blocks of cells into one (cell index ``i`` becomes ``i >> shift``)."""
+        lat_idx, lon_idx = unpack_cells(self.keys)
+        keys, inverse = np.unique(pack_cells(lat_idx >> shift, lon_idx >> shift), return_inverse=True)
+        count = np.zeros(len(keys), dtype=self.count.dtype)
+        severity_sum = np.zeros(len(keys))
+        max_severity = np.zeros(len(keys))
+        np.add.at(count, inverse, self.count)
+        np.add.at(severity_sum, inverse, self.severity_sum)
+        np.maximum.at(max_severity, inverse, self.max_severity)
+        return HotspotGrid(
+            self.grid_size * (1 << shift), keys, count, severity_sum, max_severity,
+            max_table_cells=self.max_table_cells, as_of=self.as_of,
+        )
+
+    def stats_array(self, lats, lons, radius_cells: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorised :meth:`stats` returning (average severity, count) arrays."""
+        total_sev, total_count = self.totals_array(lats, lons, radius_cells)
+        avg = np.divide(total_sev, total_count, out=np.zeros(len(total_sev)), where=total_count > 0)
+        return avg, total_count
+
+    @classmethod
+    def combine(
+        cls,
+        grids: Sequence["HotspotGrid"],
+        weights: Optional[Sequence[float]] = None,
+        min_count: float = 0.0,
+        **kwargs,
+    ) -> "HotspotGrid":
+        """Merge grids of the same cell size, scaling each grid's count/severity by its weight.
+
+        Cells whose merged count is at most ``min_count`` are dropped.
+        """
+        if not grids:
+            raise ValueError("no grids to combine")
+        weights = list(weights) if weights is not None else [1] * len(grids)
+        keys, inverse = np.unique(np.concatenate([g.keys for g in grids]), return_inverse=True)
+        weighted = any(w != 1 for w in weights) or any(g.count.dtype.kind == "f" for g in grids)
+        count = np.zeros(len(keys), dtype=np.float64 if weighted else np.int64)
+        severity_sum = np.zeros(len(keys))
+        max_severity = np.zeros(len(keys))
+        start = 0
+        for g, w in zip(grids, weights):
+            idx = inverse[start:start + g.n_cells]
+            start += g.n_cells
+            np.add.at(count, idx, g.count * w if w != 1 else g.count)
+            np.add.at(severity_sum, idx, g.severity_sum * w if w != 1 else g.severity_sum)
+            np.maximum.at(max_severity, idx, g.max_severity)
+        keep = count > min_count
+        return cls(
+            grids[0].grid_size, keys[keep], count[keep], severity_sum[keep], max_severity[keep], **kwargs
+        )
+
+    # ------------------------------------------------------------------
+    # binary format
+    # ------------------------------------------------------------------
+    def _arrays(self) -> Dict[str, np.ndarray]:
+        arrays = {
+            "keys": self.keys,
+            "count": self.count,
+            "severity_sum": self.severity_sum,
+            "max_severity": self.max_severity,
+        }
+        if self.rows is not None:
+            arrays.update(rows=self.rows, cols=self.cols, sat_count=self.sat_count, sat_severity=self.sat_severity)
+        return arrays
+
+    def save(self, path: str) -> None:
+        """Write the binary format atomically (temp file + rename)."""
+        write_arrays(
+            path,
+            MAGIC,
+            {"version": 1, "grid_size": self.grid_size, "scale": self.scale, "as_of": self.as_of},
+            self._arrays(),
+        )
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "HotspotGrid":
+        """Read the binary format; arrays are memory-mapped read-only unless ``mmap`` is false."""
+        header, arrays = read_arrays(path, MAGIC, mmap=mmap, kind="hotspot grid")
+        tables = {k: arrays[k] for k in ("rows", "cols", "sat_count", "sat_severity") if k in arrays}
+        return cls(
+            header["grid_size"],
+            arrays["keys"],
+            arrays["count"],
+            arrays["severity_sum"],
+            arrays["max_severity"],
+            tables=tables,
+            as_of=header.get("as_of"),
+        )
+
+
+
+def tile_bounds(z: int, x: int, y: int) -> Tuple[float, float, float, float]:
+    """(south, west, north, east) of web-mercator tile ``z/x/y`` in degrees."""
+    n = 1 << z
+    return _tile_lat(y + 1, n), x / n * 360.0 - 180.0, _tile_lat(y, n), (x + 1) / n * 360.0 - 180.0
+
+
+def _tile_lat(y: float, n: int) -> float:
+    return float(np.degrees(np.arctan(np.sinh(np.pi * (1.0 - 2.0 * y / n)))))
+
+
+class HotspotPyramid:
+    """Levels of a hotspot grid, each aggregating ``2 x 2`` cells of the level below.
+
+    Level ``k`` cell ``i`` covers base cells ``i * 2**k`` to ``i * 2**k + 2**k - 1``
+    along each axis. A heatmap tile uses the coarsest level whose cells are
+    no larger than one tile bin, so every bin is a single summed-area-table
+    query whatever the zoom, and coarse levels keep their tables small even
+    when the base grid is too large for one.
+    """
+
+    def __init__(self, base: HotspotGrid, max_levels: int = 16) -> None:
+        self.levels: List[HotspotGrid] = [base]
+        while len(self.levels) < max(1, int(max_levels)) and self.levels[-1].n_cells > 1:
+            self.levels.append(self.levels[-1].coarsen(1))
+        self.base_cell_deg = 1.0 / base.scale
+
+    def level_for(self, cell_deg: float) -> int:
+        """Coarsest level whose cells are at most ``cell_deg`` wide (0 if even the base is wider)."""
+        level = 0
+        while level + 1 < len(self.levels) and self.base_cell_deg * (2 << level) <= cell_deg:
+            level += 1
+        # levels without a summed-area table are only used when nothing finer has one
+        while self.levels[level].rows is None and level + 1 < len(self.levels):
+            level += 1
+        return level
+
+    def _bin_ranges(self, edges: np.ndarray, level: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Level cell index range of each bin: the cells whose centre falls in the bin,
+        or the cell under the bin centre when the bin is narrower than a cell."""
+        scale = 1.0 / self.base_cell_deg
+        m = 1 << level
+        offset = (m - 1) / 2.0
+        lo, hi = np.minimum(edges[:-1], edges[1:]), np.maximum(edges[:-1], edges[1:])
+        first = np.ceil((lo * scale - offset) / m).astype(np.int64)
+        last = np.ceil((hi * scale - offset) / m).astype(np.int64) - 1
+        centre = np.rint((lo + hi) / 2.0 * scale).astype(np.int64) >> level
+        narrow = last < first
+        return np.where(narrow, centre, first), np.where(narrow, centre, last)
+
+    def tile(self, z: int, x: int, y: int, size: int = 64, count_scale: float = 1.0) -> Dict[str, object]:
+        """Report count and average severity per bin of a ``size x size`` heatmap tile (rows north to south)."""
+        south, west, north, east = tile_bounds(z, x, y)
+        n = 1 << z
+        lat_edges = np.array([_tile_lat(y + r / size, n) for r in range(size + 1)])
+        lon_edges = np.linspace(west, east, size + 1)
+        bin_deg = min((east - west) / size, float(np.min(np.abs(np.diff(lat_edges)))))
+        level = self.level_for(bin_deg)
+        lat0, lat1 = self._bin_ranges(lat_edges, level)
+        lon0, lon1 = self._bin_ranges(lon_edges, level)
+        rows = np.repeat(np.arange(size), size)
+        cols = np.tile(np.arange(size), size)
+        severity, count = self.levels[level].rect_totals_array(lat0[rows], lat1[rows], lon0[cols], lon1[cols])
+        avg = np.divide(severity, count, out=np.zeros(len(count)), where=count > 0)
+        count = count.reshape(size, size) * count_scale
+        return {
+            "z": z,
+            "x": x,
+            "y": y,
+            "bounds": {"south": south, "west": west, "north": north, "east": east},
+            "size": size,
+            "level": level,
+            "cell_deg": self.base_cell_deg * (1 << level),
+            "max_count": float(count.max()) if count.size else 0.0,
+            "count": np.round(count, 6).tolist(),
+            "severity": np.round(avg.reshape(size, size), 6).tolist(),
+        }
+
+
+class LiveHotspotGrid:
+    """A :class:`HotspotGrid` that new incident reports are folded into while it serves queries.
+
+    New reports go into a small overlay grid (rebuilt copy-on-write on each
+    :meth:`add`) that is summed with the base grid at query time; readers take
+    a single ``(base, overlay, t0)`` snapshot and never lock. Once the overlay
+    exceeds ``compact_cells`` cells, or on :meth:`snapshot`, it is merged into
+    a new base grid.
+
+    With ``half_life_seconds`` every report's weight halves per half-life.
+    All cells decay at the same rate, so weights are kept relative to the
+    reference time ``t0`` and the decay is a single factor applied to the
+    queried count (average severities are unaffected). Compaction folds the
+    factor into the stored counts, moves ``t0`` to now and drops cells whose
+    weight has faded below ``min_weight``.
+    """
+
+    def __init__(
+        self,
+        base: HotspotGrid,
+        half_life_seconds: Optional[float] = None,
+        compact_cells: int = 1024,
+        min_weight: float = 1e-3,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        self.grid_size = base.grid_size
+        self.scale = base.scale
+        self.half_life = float(half_life_seconds) if half_life_seconds and half_life_seconds > 0 else None
+        self.compact_cells = max(1, int(compact_cells))
+        self.min_weight = float(min_weight)
+        self._clock = clock
+        t0 = base.as_of if base.as_of is not None else clock()
+        self._state: Tuple[HotspotGrid, HotspotGrid, float] = (base, self._empty(), t0)
+        # cell key -> [count, severity_sum, max_severity] of reports since the last compaction
+        self._pending: Dict[int, List[float]] = {}
+        self._write_lock = threading.Lock()
+        self._snapshot_lock = threading.Lock()
+        self._pyramid_lock = threading.Lock()
+        self._pyramid: Optional[Tuple[tuple, HotspotPyramid]] = None
+        self.version = 0
+        self.saved_version = 0
+        self.added = 0
+        self.compactions = 0
+
+    def _empty(self) -> HotspotGrid:
+        return HotspotGrid(self.grid_size, [], [], [], [])
+
+    @property
+    def base(self) -> HotspotGrid:
+        return self._state[0]
+
+    @property
+    def n_cells(self) -> int:
+        base, overlay, _ = self._state
+        return base.n_cells + overlay.n_cells
+
+    def _decay(self, t0: float) -> float:
+        if self.half_life is None:
+            return 1.0
+        return 2.0 ** ((t0 - self._clock()) / self.half_life)
+
+    def stats(self, lat: float, lon: float, radius_cells: int = 1) -> Tuple[float, float]:
+        """(average severity, report count) like :meth:`HotspotGrid.stats`, including new reports."""
+        base, overlay, t0 = self._state
+        severity, count = base.totals(lat, lon, radius_cells)
+        if overlay.n_cells:
+            s2, c2 = overlay.totals(lat, lon, radius_cells)
+            severity, count = severity + s2, count + c2
+        if count <= 0:
+            return 0.0, 0
+        avg = severity / count
+        if self.half_life is not None:
+            count = count * self._decay(t0)
+        return avg, count
+
+    def stats_array(self, lats, lons, radius_cells: int = 1) -> Tuple[np.ndarray, np.ndarray]:
+        base, overlay, t0 = self._state
+        severity, count = base.totals_array(lats, lons, radius_cells)
+        if overlay.n_cells:
+            s2, c2 = overlay.totals_array(lats, lons, radius_cells)
+            severity, count = severity + s2, count + c2
+        avg = np.divide(severity, count, out=np.zeros(len(severity)), where=count > 0)
+        if self.half_life is not None:
+            count = count * self._decay(t0)
+        return avg, count
+
+    def add(
+        self,
+        lats: Sequence[float],
+        lons: Sequence[float],
+        severities: Sequence[float],
+        timestamps: Optional[Sequence[float]] = None,
+    ) -> int:
+        """Fold incident reports (POSIX ``timestamps``, default now) into the grid."""
+        lats = np.asarray(lats, dtype=float)
+        lons = np.asarray(lons, dtype=float)
+        sev = np.asarray(severities, dtype=float)
+        if not (len(lats) == len(lons) == len(sev)):
+            raise ValueError("lats, lons and severities must have the same length")
+        if not len(lats):
+            return 0
+        keys = pack_cells(np.rint(lats * self.scale).astype(np.int64), np.rint(lons * self.scale).astype(np.int64))
+        compact = False
+        with self._write_lock:
+            base, _overlay, t0 = self._state
+            if self.half_life is not None:
+                now = self._clock()
+                ts = np.full(len(sev), now) if timestamps is None else np.asarray(timestamps, dtype=float)
+                weights = np.exp2((ts - t0) / self.half_life)
+            else:
+                weights = np.ones(len(sev), dtype=np.int64)
+            for key, w, s in zip(keys.tolist(), weights.tolist(), sev.tolist()):
+                cell = self._pending.get(key)
+                if cell is None:
+                    self._pending[key] = [w, s * w, s]
+                else:
+                    cell[0] += w
+                    cell[1] += s * w
+                    if s > cell[2]:
+                        cell[2] = s
+            overlay = HotspotGrid(
+                self.grid_size,
+                list(self._pending.keys()),
+                [c[0] for c in self._pending.values()],
+                [c[1] for c in self._pending.values()],
+                [c[2] for c in self._pending.values()],
+            )
+            self._state = (base, overlay, t0)
+            self.version += 1
+            self.added += len(sev)
+            compact = overlay.n_cells > self.compact_cells or (
+                self.half_life is not None and self._clock() - t0 > 32 * self.half_life
+            )
+        if compact:
+            self.compact()
+        return int(len(sev))
+
+    def compact(self) -> HotspotGrid:
+        """Merge the overlay (and any accumulated decay) into a new base grid."""
+        with self._write_lock:
+            base, overlay, t0 = self._state
+            if self.half_life is None:
+                if not overlay.n_cells:
+                    return base
+                merged = HotspotGrid.combine([base, overlay], as_of=base.as_of)
+                t_new = t0
+            else:
+                t_new = self._clock()
+                factor = 2.0 ** ((t0 - t_new) / self.half_life)
+                merged = HotspotGrid.combine(
+                    [base, overlay], weights=[factor, factor], min_count=self.min_weight, as_of=t_new
+                )
+            self._pending = {}
+            self._state = (merged, self._empty(), t_new)
+            self.compactions += 1
+            return merged
+
+    def snapshot(self, path: str) -> bool:
+        """Compact and write the binary grid if anything changed since the last snapshot."""
+        with self._snapshot_lock:
+            version = self.version
+            if version == self.saved_version:
+                return False
+            grid = self.compact()
+            grid.save(path)
+            self.saved_version = version
+            return True
+
+    def pyramid(self) -> Tuple[HotspotPyramid, float]:
+        """Pyramid over the current grid (rebuilt when reports arrive) and the decay factor for its counts."""
+        state = self._state
+        base, overlay, t0 = state
+        with self._pyramid_lock:
+            cached = self._pyramid
+            if cached is None or cached[0] is not state:
+                grid = HotspotGrid.combine([base, overlay]) if overlay.n_cells else base
+                cached = (state, HotspotPyramid(grid))
+                self._pyramid = cached
+        return cached[1], self._decay(t0)
+
+    def tile(self, z: int, x: int, y: int, size: int = 64) -> Dict[str, object]:
+        pyramid, factor = self.pyramid()
+        return pyramid.tile(z, x, y, size=size, count_scale=factor)
+
+    def info(self) -> Dict[str, object]:
+        base, overlay, t0 = self._state
+        return {
+            "cells": base.n_cells,
+            "overlay_cells": overlay.n_cells,
+            "incidents_added": self.added,
+            "half_life_seconds": self.half_life,
+            "decay_factor": self._decay(t0),
+            "compactions": self.compactions,
+            "version": self.version,
+            "saved_version": self.saved_version,
+        }
+
+
+__all__ = [
+    "DEFAULT_GRID_SIZE",
+    "HotspotGrid",
+    "HotspotPyramid",
+    "LiveHotspotGrid",
+    "grid_scale",
+    "pack_cells",
+    "tile_bounds",
+    "unpack_cells",
+]
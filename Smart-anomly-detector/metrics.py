@@ -0,0 +1,224 @@
+"""Hot-path instrumentation and a Prometheus text-format ``/metrics`` export.
+
+The service times each scoring stage (``with metrics.stage("features"):``),
+counts raised flags and buckets the final risk score. When metrics are
+disabled (``METRICS_ENABLED=0``, the default) ``stage`` returns one shared
+no-op context manager and every ``observe``/``inc`` returns on its first
+line, so the instrumented code pays a method call per stage and nothing else.
+
+Gauges (session and group counts, queue depths) are not tracked on the hot
+path at all: callbacks registered with :meth:`Metrics.gauge` are evaluated
+only when ``/metrics`` is scraped.
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+# seconds; scoring stages range from a few microseconds (zone lookup) to a second (SHAP on a big window)
+STAGE_BUCKETS = (
+    0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+    0.5, 1.0, 2.5,
+)
+RISK_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0)
+
+Labels = Tuple[Tuple[str, str], ...]
+GaugeValue = Union[float, Dict[Labels, float]]
+
+
+class Histogram:
+    """Cumulative-bucket histogram (Prometheus semantics: ``le`` upper bounds plus +Inf)."""
+
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets: Sequence[float]) -> None:
+        self.buckets = tuple(float(b) for b in buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> List[int]:
+        out, running = [], 0
+        for c in self.counts:
+            running += c
+            out.append(running)
+        return out
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+class _StageTimer:
+    __slots__ = ("metrics", "name", "t0")
+
+    def __init__(self, metrics: "Metrics", name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.metrics.observe("detector_stage_seconds", time.perf_counter() - self.t0, stage=self.name)
+        return False
+
+
+def _labels(labels: Dict[str, object]) -> Labels:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _fmt_labels(labels: Labels, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join('{}="{}"'.format(k, v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+                    for k, v in pairs)
+    return "{" + body + "}"
+
+
+def _fmt_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Counters, histograms and scrape-time gauges for one process."""
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = bool(enabled)
+        self._lock = threading.Lock()
+        self._help: Dict[str, Tuple[str, str]] = {}
+        self._buckets: Dict[str, Sequence[float]] = {}
+        self._counters: Dict[str, Dict[Labels, float]] = {}
+        self._histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self._gauges: Dict[str, Callable[[], GaugeValue]] = {}
+        self.describe_histogram("detector_stage_seconds", "Time spent in each scoring stage per call", STAGE_BUCKETS)
+
+    # -- registration -----------------------------------------------------
+    def describe_counter(self, name: str, help_text: str) -> None:
+        self._help[name] = ("counter", help_text)
+
+    def describe_histogram(self, name: str, help_text: str, buckets: Sequence[float]) -> None:
+        self._help[name] = ("histogram", help_text)
+        self._buckets[name] = tuple(buckets)
+
+    def gauge(self, name: str, help_text: str, fn: Callable[[], GaugeValue]) -> None:
+        """Register a gauge computed at scrape time; ``fn`` returns a number or {labels: number}."""
+        self._help[name] = ("gauge", help_text)
+        self._gauges[name] = fn
+
+    # -- hot path ---------------------------------------------------------
+    def stage(self, name: str):
+        """Context manager timing one stage into ``detector_stage_seconds{stage=name}``."""
+        if not self.enabled:
+            return _NULL_TIMER
+        return _StageTimer(self, name)
+
+    def inc(self, name: str, value: float = 1, **labels: object) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: object) -> None:
+        if not self.enabled:
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets.get(name, STAGE_BUCKETS))
+            hist.observe(value)
+
+    def observe_many(self, name: str, values: Sequence[float], **labels: object) -> None:
+        if not self.enabled or not len(values):
+            return
+        key = _labels(labels)
+        with self._lock:
+            series = self._histograms.setdefault(name, {})
+            hist = series.get(key)
+            if hist is None:
+                hist = series[key] = Histogram(self._buckets.get(name, STAGE_BUCKETS))
+            for v in values:
+                hist.observe(v)
+
+    # -- export -----------------------------------------------------------
+    def reset(self) -> None:
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)."""
+        with self._lock:
+            counters = {n: dict(s) for n, s in self._counters.items()}
+            histograms = {
+                n: {k: (h.buckets, h.cumulative(), h.sum, h.count) for k, h in s.items()}
+                for n, s in self._histograms.items()
+            }
+        gauges = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                value = fn()
+            except Exception:
+                continue
+            if value is not None:
+                gauges[name] = value if isinstance(value, dict) else {(): value}
+
+        lines: List[str] = []
+
+        def header(name: str, kind: str) -> None:
+            help_text = self._help.get(name, (kind, name))[1]
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted(counters):
+            header(name, "counter")
+            for labels, value in sorted(counters[name].items()):
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(value)}")
+        for name in sorted(histograms):
+            header(name, "histogram")
+            for labels, (buckets, cumulative, total, count) in sorted(histograms[name].items()):
+                for le, c in zip(list(buckets) + [float("inf")], cumulative):
+                    lines.append(f"{name}_bucket{_fmt_labels(labels, ('le', _fmt_value(le)))} {c}")
+                lines.append(f"{name}_sum{_fmt_labels(labels)} {_fmt_value(total)}")
+                lines.append(f"{name}_count{_fmt_labels(labels)} {count}")
+        for name in sorted(gauges):
+            header(name, "gauge")
+            for labels, value in sorted(gauges[name].items()):
+                lines.append(f"{name}{_fmt_labels(labels)} {_fmt_value(float(value))}")
+        return "\n".join(lines) + "\n"
+
+
+def _env_enabled() -> bool:
+    return os.getenv("METRICS_ENABLED", "0").strip().lower() in ("1", "true", "yes", "on")
+
+
+# process-wide registry shared by app.py and database.py
+metrics = Metrics(enabled=_env_enabled())
+
+
+__all__ = ["Histogram", "Metrics", "RISK_BUCKETS", "STAGE_BUCKETS", "metrics"]
@@ -0,0 +1,176 @@
+"""Memory-mapped bundle of the serving model artifacts.
+
+Unpickling the 300-tree IsolationForest (and importing sklearn to do it),
+then flattening it into :class:`scoring.CompiledIsolationForest`, is a large
+part of the service's cold start. The bundle stores what scoring actually
+uses, already compiled, in one :mod:`array_file` container:
+
+* the StandardScaler's ``mean_`` / ``scale_`` (applied by :class:`ArrayScaler`),
+* the compiled forest's node arrays,
+* the DBSCAN core samples and ``eps``,
+* the feature column order,
+
+so loading is a header parse plus one ``mmap``. The sklearn estimators are
+still needed for SHAP (and as the fallback when there is no bundle) and are
+unpickled only then. The header records a digest of each pickle it was built
+from; a bundle whose pickles have since changed is ignored.
+
+``train_model.py`` writes the bundle next to the pickles; for existing model
+directories run ``python model_store.py [model_dir]``.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import sys
+from typing import Dict, List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+from array_file import read_arrays, write_arrays
+from scoring import CompiledIsolationForest, CoreSampleIndex
+
+MAGIC = b"MDLBND01"
+BUNDLE_FILE = "model_bundle.bin"
+SOURCE_FILES = ("scaler.pkl", "isolation_forest.pkl", "dbscan.pkl", "feature_cols.pkl")
+_FOREST_ARRAYS = ("feature", "threshold", "left", "right", "leaf_value", "roots")
+
+
+class ArrayScaler:
+    """``StandardScaler.transform`` from the fitted ``mean_`` / ``scale_`` arrays (same arithmetic)."""
+
+    __slots__ = ("mean_", "scale_", "n_features_in_")
+
+    def __init__(self, mean: Optional[np.ndarray], scale: Optional[np.ndarray], n_features: int) -> None:
+        self.mean_ = mean
+        self.scale_ = scale
+        self.n_features_in_ = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, scaler) -> "ArrayScaler":
+        return cls(getattr(scaler, "mean_", None), getattr(scaler, "scale_", None), scaler.n_features_in_)
+
+    def transform(self, X) -> np.ndarray:
+        X = np.array(X, dtype=np.float64)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"expected a 2D array with {self.n_features_in_} features, got shape {X.shape}")
+        if self.mean_ is not None:
+            X -= self.mean_
+        if self.scale_ is not None:
+            X /= self.scale_
+        return X
+
+
+class ModelBundle(NamedTuple):
+    scaler: ArrayScaler
+    compiled_iso: CompiledIsolationForest
+    core_index: Optional[CoreSampleIndex]
+    feature_cols: List[str]
+    header: Dict[str, object]
+
+
+def file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def source_digests(model_dir: str) -> Dict[str, str]:
+    return {
+        name: file_digest(os.path.join(model_dir, name))
+        for name in SOURCE_FILES
+        if os.path.exists(os.path.join(model_dir, name))
+    }
+
+
+def save_model_bundle(
+    path: str,
+    scaler,
+    compiled_iso: CompiledIsolationForest,
+    dbscan,
+    feature_cols: Sequence[str],
+    sources: Optional[Dict[str, str]] = None,
+) -> None:
+    """Write the bundle for a fitted scaler, compiled forest and DBSCAN model."""
+    arrays = {name: getattr(compiled_iso, name) for name in _FOREST_ARRAYS}
+    if getattr(scaler, "mean_", None) is not None:
+        arrays["scaler_mean"] = np.asarray(scaler.mean_, dtype=np.float64)
+    if getattr(scaler, "scale_", None) is not None:
+        arrays["scaler_scale"] = np.asarray(scaler.scale_, dtype=np.float64)
+    core = getattr(dbscan, "components_", None)
+    if core is not None and len(core):
+        arrays["core_samples"] = np.asarray(core, dtype=np.float64)
+    header = {
+        "version": 1,
+        "feature_cols": list(feature_cols),
+        "n_features": int(scaler.n_features_in_),
+        "forest": {
+            "max_depth": compiled_iso.max_depth,
+            "offset": compiled_iso.offset,
+            "denominator": compiled_iso.denominator,
+            "n_features": compiled_iso.n_features,
+        },
+        "dbscan_eps": float(dbscan.eps) if getattr(dbscan, "eps", None) is not None else None,
+        "sources": dict(sources or {}),
+    }
+    write_arrays(path, MAGIC, header, arrays)
+
+
+def load_model_bundle(path: str, mmap: bool = True) -> ModelBundle:
+    header, arrays = read_arrays(path, MAGIC, mmap=mmap, kind="model bundle")
+    forest = header["forest"]
+    compiled = CompiledIsolationForest(
+        *(arrays[name] for name in _FOREST_ARRAYS),
+        max_depth=forest["max_depth"],
+        offset=forest["offset"],
+        denominator=forest["denominator"],
+        n_features=forest["n_features"],
+    )
+    scaler = ArrayScaler(arrays.get("scaler_mean"), arrays.get("scaler_scale"), header["n_features"])
+    core_index = None
+    if "core_samples" in arrays and header.get("dbscan_eps") is not None:
+        core_index = CoreSampleIndex(arrays["core_samples"], header["dbscan_eps"])
+    return ModelBundle(scaler, compiled, core_index, list(header["feature_cols"]), header)
+
+
+def bundle_is_current(header: Dict[str, object], model_dir: str) -> bool:
+    """True unless a pickle the bundle was built from has changed since."""
+    for name, digest in (header.get("sources") or {}).items():
+        path = os.path.join(model_dir, name)
+        if os.path.exists(path) and file_digest(path) != digest:
+            return False
+    return True
+
+
+def build_bundle(model_dir: str) -> str:
+    """Compile the pickles in ``model_dir`` into ``model_dir/model_bundle.bin``."""
+    import joblib
+
+    scaler = joblib.load(os.path.join(model_dir, "scaler.pkl"))
+    iso = joblib.load(os.path.join(model_dir, "isolation_forest.pkl"))
+    dbs = joblib.load(os.path.join(model_dir, "dbscan.pkl"))
+    feature_cols = joblib.load(os.path.join(model_dir, "feature_cols.pkl"))
+    path = os.path.join(model_dir, BUNDLE_FILE)
+    save_model_bundle(
+        path, scaler, CompiledIsolationForest.from_sklearn(iso), dbs, feature_cols, sources=source_digests(model_dir)
+    )
+    return path
+
+
+__all__ = [
+    "ArrayScaler",
+    "BUNDLE_FILE",
+    "ModelBundle",
+    "bundle_is_current",
+    "build_bundle",
+    "load_model_bundle",
+    "save_model_bundle",
+    "source_digests",
+]
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else os.path.join(os.path.dirname(os.path.abspath(__file__)), "model")
+    print(f"✅ Model bundle written: {build_bundle(target)}")
@@ -0,0 +1,505 @@
+"""Append-optimised binary store for ingested GPS points.
+
+Points are written as fixed-width little-endian records (``POINT_DTYPE``,
+32 bytes each) into per-day partitions, and within a day into one file per
+session shard::
+
+    data/points/2025-09-04/shard-007.bin
+
+Every point of a session lands in the same shard number, and an in-memory
+session index records where each session's points sit, so reading one
+session touches only its own records instead of all history. Appends are
+buffered in memory and flushed in bulk; readers see buffered points too.
+Several worker processes may append to the same files: each flush holds an
+exclusive ``flock`` on the file while it indexes foreign appends and writes.
+"""
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+try:
+    import fcntl
+except ImportError:  # Windows: single-process deployments only
+    fcntl = None
+
+POINT_DTYPE = np.dtype(
+    [("session_id", "<i8"), ("lat", "<f8"), ("lon", "<f8"), ("ts", "<f8")]
+)
+FORMAT_VERSION = 1
+DEFAULT_SHARDS = 16
+META_FILE = "_meta.json"
+
+
+def parse_timestamps(values: pd.Series) -> pd.Series:
+    """Parse each value on its own to a UTC timestamp (naive = UTC); unparseable values become NaT.
+
+    A single inferred format would turn every row that differs from the first
+    one (fractional seconds, an offset, a space instead of ``T``) into NaT, so
+    ISO 8601 is parsed per element and anything else falls back to per-row
+    ``mixed`` parsing.
+    """
+    parsed = pd.to_datetime(values, errors="coerce", utc=True, format="ISO8601")
+    bad = parsed.isna() & values.notna()
+    if bad.any():
+        parsed[bad] = pd.to_datetime(values[bad], errors="coerce", utc=True, format="mixed")
+    return parsed
+
+
+def to_epoch_seconds(timestamps: Sequence[object]) -> np.ndarray:
+    """Parse timestamps (ISO strings or datetimes, naive = UTC) to POSIX seconds.
+
+    Raises ValueError naming the rows that cannot be parsed.
+    """
+    parsed = parse_timestamps(pd.Series(list(timestamps), dtype=object))
+    bad = np.flatnonzero(parsed.isna().to_numpy())
+    if len(bad):
+        rows = ", ".join(str(i) for i in bad[:10]) + (", ..." if len(bad) > 10 else "")
+        raise ValueError(f"invalid timestamp in GPS points (rows {rows})")
+    return parsed.to_numpy(dtype="datetime64[ns]").astype(np.int64) / 1e9
+
+
+def records_to_frame(records: np.ndarray) -> pd.DataFrame:
+    """Convert ``POINT_DTYPE`` records to a session_id/lat/lon/timestamp frame."""
+    ts = pd.to_datetime(records["ts"], unit="s", utc=True).tz_localize(None)
+    return pd.DataFrame(
+        {
+            "session_id": records["session_id"].astype(np.int64),
+            "lat": records["lat"],
+            "lon": records["lon"],
+            "timestamp": ts,
+        }
+    )
+
+
+def load_legacy_csv(path: str) -> pd.DataFrame:
+    """Read a legacy gps_logs.csv/gps_data.csv (with or without a header row)."""
+    empty = records_to_frame(np.empty(0, dtype=POINT_DTYPE))
+    if not os.path.exists(path):
+        return empty
+    df = pd.read_csv(path)
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    if "session_id" not in df.columns:
+        if len(df.columns) != 4:
+            return empty
+        df = pd.read_csv(path, header=None, names=["session_id", "lat", "lon", "timestamp"])
+    df = df.dropna(subset=["session_id", "lat", "lon", "timestamp"]).copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    df = df.dropna(subset=["timestamp"])
+    df["session_id"] = pd.to_numeric(df["session_id"], errors="coerce")
+    df = df.dropna(subset=["session_id"])
+    return pd.DataFrame(
+        {
+            "session_id": df["session_id"].astype(np.int64),
+            "lat": df["lat"].astype(float),
+            "lon": df["lon"].astype(float),
+            "timestamp": df["timestamp"],
+        }
+    ).reset_index(drop=True)
+
+
+class SessionIndex:
+    """Maps session_id to its record positions in each store file.
+
+    Positions are added as chunks are flushed, so a session lookup reads
+    exactly its own records (via memory-mapping) without scanning a shard.
+    The index remembers how many records of each file it has seen; after a
+    restart it can be loaded from a snapshot and only the records appended
+    since then are scanned.
+
+    With ``max_sessions`` the least recently used sessions are dropped once
+    the cap is exceeded. From then on the index is no longer ``complete``:
+    only sessions it still holds are extended, and :meth:`positions` returns
+    None for the others so the store rebuilds them from the shard files.
+    """
+
+    def __init__(self, max_sessions: Optional[int] = None) -> None:
+        self._positions: "OrderedDict[int, Dict[str, List[np.ndarray]]]" = OrderedDict()
+        self._counts: Dict[str, int] = {}
+        self.max_sessions = max_sessions
+        self.complete = True
+
+    def __len__(self) -> int:
+        return len(self._positions)
+
+    def __contains__(self, session_id: int) -> bool:
+        return int(session_id) in self._positions
+
+    def session_ids(self) -> List[int]:
+        return list(self._positions)
+
+    def add_chunk(self, relpath: str, start: int, session_ids: np.ndarray) -> None:
+        """Register records ``start .. start+len(session_ids)`` of ``relpath``."""
+        if not len(session_ids):
+            return
+        order = np.argsort(session_ids, kind="stable")
+        uniq, first = np.unique(session_ids[order], return_index=True)
+        for sid, idx in zip(uniq.tolist(), np.split(order, first[1:])):
+            files = self._positions.get(sid)
+            if files is None:
+                if not self.complete:
+                    continue  # dropped earlier: rebuilt from the files when looked up
+                files = self._positions[sid] = {}
+            else:
+                self._positions.move_to_end(sid)
+            files.setdefault(relpath, []).append(idx.astype(np.int64) + start)
+        self._counts[relpath] = max(self._counts.get(relpath, 0), start + len(session_ids))
+        self._trim()
+
+    def add_session(self, session_id: int, positions: Dict[str, np.ndarray]) -> None:
+        """Register the positions of one session rebuilt from a scan of the store files."""
+        sid = int(session_id)
+        self._positions[sid] = {relpath: [pos] for relpath, pos in positions.items() if len(pos)}
+        self._positions.move_to_end(sid)
+        self._trim()
+
+    def _trim(self) -> None:
+        if self.max_sessions is None:
+            return
+        while len(self._positions) > self.max_sessions:
+            self._positions.popitem(last=False)
+            self.complete = False
+
+    def counts(self) -> Dict[str, int]:
+        """Records seen per file."""
+        return dict(self._counts)
+
+    def catch_up(self, root: str, relpath: str) -> int:
+        """Index records appended to ``relpath`` since it was last seen; returns rows indexed."""
+        path = os.path.join(root, relpath)
+        n = os.path.getsize(path) // POINT_DTYPE.itemsize if os.path.exists(path) else 0
+        have = self._counts.get(relpath, 0)
+        if n < have:  # file was truncated or replaced: forget it and rescan
+            self._drop_file(relpath)
+            have = 0
+        if n == have:
+            return 0
+        recs = np.memmap(path, dtype=POINT_DTYPE, mode="r", shape=(n,))
+        self.add_chunk(relpath, have, np.array(recs["session_id"][have:n]))
+        return n - have
+
+    def _drop_file(self, relpath: str) -> None:
+        self._counts.pop(relpath, None)
+        for files in self._positions.values():
+            files.pop(relpath, None)
+
+    def positions(self, session_id: int) -> Optional[Dict[str, np.ndarray]]:
+        """Record positions of one session per file (chunks are merged on read).
+
+        Returns None if the session is not held by an incomplete index.
+        """
+        sid = int(session_id)
+        files = self._positions.get(sid)
+        if files is None:
+            return {} if self.complete else None
+        self._positions.move_to_end(sid)
+        out = {}
+        for relpath, chunks in files.items():
+            if len(chunks) > 1:
+                chunks[:] = [np.concatenate(chunks)]
+            out[relpath] = chunks[0]
+        return out
+
+    def save(self, path: str) -> None:
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as fh:
+            pickle.dump(
+                {
+                    "version": FORMAT_VERSION,
+                    "counts": self._counts,
+                    "positions": self._positions,
+                    "complete": self.complete,
+                },
+                fh,
+            )
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: str, max_sessions: Optional[int] = None) -> "SessionIndex":
+        index = cls(max_sessions)
+        try:
+            with open(path, "rb") as fh:
+                raw = pickle.load(fh)
+            if raw.get("version") == FORMAT_VERSION:
+                index._counts = dict(raw["counts"])
+                index._positions = OrderedDict(raw["positions"])
+                index.complete = bool(raw.get("complete", True))
+        except Exception:
+            return cls(max_sessions)
+        index._trim()
+        return index
+
+
+class PointStore:
+    """Day-partitioned, session-sharded binary GPS point store with a buffered writer.
+
+    A :class:`SessionIndex` is kept up to date as chunks are flushed, so
+    ``read_session`` touches only the requested session's records. With
+    ``index_path`` the index is snapshotted by ``save_index`` and reloaded
+    at startup, scanning only data written after the snapshot. Bulk writers
+    and scanners that never look up single sessions can pass
+    ``indexed=False`` to skip the index (and its per-point memory), and
+    long-running writers can bound it with ``max_indexed_sessions``.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        n_shards: Optional[int] = None,
+        flush_rows: int = 1000,
+        flush_seconds: float = 1.0,
+        index_path: Optional[str] = None,
+        indexed: bool = True,
+        max_indexed_sessions: Optional[int] = None,
+    ) -> None:
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        self.n_shards = self._load_or_init_meta(n_shards or DEFAULT_SHARDS)
+        self.flush_rows = max(1, int(flush_rows))
+        self.flush_seconds = float(flush_seconds)
+        self._lock = threading.RLock()
+        self._pending: List[np.ndarray] = []
+        self._pending_rows = 0
+        self._oldest_pending: Optional[float] = None
+        self.index_path = index_path
+        self.index: Optional[SessionIndex] = None
+        if indexed:
+            if index_path and os.path.exists(index_path):
+                self.index = SessionIndex.load(index_path, max_indexed_sessions)
+            else:
+                self.index = SessionIndex(max_indexed_sessions)
+            for path in self.shard_files():
+                self.index.catch_up(self.root, os.path.relpath(path, self.root))
+
+    def _load_or_init_meta(self, n_shards: int) -> int:
+        path = os.path.join(self.root, META_FILE)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as fh:
+                meta = json.load(fh)
+            if int(meta.get("version", 0)) != FORMAT_VERSION:
+                raise RuntimeError(f"unsupported point store version in {path}")
+            # the shard count is fixed once data exists; sessions must not move shards
+            return int(meta["n_shards"])
+        with open(path, "w", encoding="utf-8") as fh:
+            json.dump({"version": FORMAT_VERSION, "n_shards": int(n_shards), "dtype": POINT_DTYPE.descr}, fh)
+        return int(n_shards)
+
+    # ------------------------------------------------------------------
+    # writing
+    # ------------------------------------------------------------------
+    def shard_of(self, session_id: int) -> int:
+        return int(session_id) % self.n_shards
+
+    def append(
+        self,
+        session_ids: Sequence[int],
+        lats: Sequence[float],
+        lons: Sequence[float],
+        timestamps: Sequence[object],
+    ) -> np.ndarray:
+        """Buffer points for writing; flushes when the size/age threshold is reached.
+
+        Raises ValueError if any timestamp cannot be parsed (nothing is buffered).
+        Returns the buffered records.
+        """
+        records = np.empty(len(session_ids), dtype=POINT_DTYPE)
+        records["session_id"] = np.asarray(session_ids, dtype=np.int64)
+        records["lat"] = np.asarray(lats, dtype=float)
+        records["lon"] = np.asarray(lons, dtype=float)
+        records["ts"] = to_epoch_seconds(timestamps)
+        self.append_records(records)
+        return records
+
+    def append_records(self, records: np.ndarray) -> None:
+        if not len(records):
+            return
+        with self._lock:
+            self._pending.append(np.asarray(records, dtype=POINT_DTYPE))
+            self._pending_rows += len(records)
+            if self._oldest_pending is None:
+                self._oldest_pending = time.monotonic()
+            if self._pending_rows >= self.flush_rows:
+                self.flush()
+
+    def flush_if_due(self) -> int:
+        with self._lock:
+            if self._oldest_pending is not None and time.monotonic() - self._oldest_pending >= self.flush_seconds:
+                return self.flush()
+        return 0
+
+    def flush(self) -> int:
+        """Write all buffered points to their partition files; returns rows written."""
+        with self._lock:
+            if not self._pending:
+                return 0
+            records = np.concatenate(self._pending)
+            self._pending = []
+            self._pending_rows = 0
+            self._oldest_pending = None
+            for path, chunk in self._partition(records):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                relpath = os.path.relpath(path, self.root)
+                with open(path, "ab") as fh:
+                    # other worker processes append to the same files: hold the file lock from
+                    # indexing their appends until our records are written, so positions are exact
+                    if fcntl is not None:
+                        fcntl.flock(fh.fileno(), fcntl.LOCK_EX)
+                    if self.index is not None:
+                        self.index.catch_up(self.root, relpath)
+                    fh.seek(0, os.SEEK_END)
+                    start = fh.tell() // POINT_DTYPE.itemsize
+                    fh.write(chunk.tobytes())
+                    fh.flush()
+                    if self.index is not None:
+                        self.index.add_chunk(relpath, start, chunk["session_id"])
+            return len(records)
+
+    def save_index(self) -> None:
+        """Snapshot the session index to ``index_path`` (no-op without one)."""
+        if self.index_path and self.index is not None:
+            with self._lock:
+                self.index.save(self.index_path)
+
+    def _partition(self, records: np.ndarray) -> Iterator[Tuple[str, np.ndarray]]:
+        days = (records["ts"] // 86400).astype(np.int64)
+        shards = records["session_id"] % self.n_shards
+        keys = days * self.n_shards + shards
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        bounds = np.flatnonzero(np.diff(keys)) + 1
+        for chunk_idx in np.split(order, bounds):
+            day = int(days[chunk_idx[0]])
+            shard = int(shards[chunk_idx[0]])
+            yield self._path(day, shard), records[chunk_idx]
+
+    def _path(self, day: int, shard: int) -> str:
+        day_name = datetime.fromtimestamp(day * 86400, tz=timezone.utc).strftime("%Y-%m-%d")
+        return os.path.join(self.root, day_name, f"shard-{shard:03d}.bin")
+
+    # ------------------------------------------------------------------
+    # reading
+    # ------------------------------------------------------------------
+    def _day_dirs(self) -> List[str]:
+        return sorted(
+            os.path.join(self.root, d)
+            for d in os.listdir(self.root)
+            if os.path.isdir(os.path.join(self.root, d))
+        )
+
+    def shard_files(self, shard: Optional[int] = None) -> List[str]:
+        files = []
+        for day_dir in self._day_dirs():
+            if shard is None:
+                files.extend(
+                    os.path.join(day_dir, f) for f in sorted(os.listdir(day_dir)) if f.endswith(".bin")
+                )
+            else:
+                path = os.path.join(day_dir, f"shard-{shard:03d}.bin")
+                if os.path.exists(path):
+                    files.append(path)
+        return files
+
+    @staticmethod
+    def read_file(path: str) -> np.ndarray:
+        return np.fromfile(path, dtype=POINT_DTYPE)
+
+    def _pending_records(self) -> np.ndarray:
+        with self._lock:
+            if not self._pending:
+                return np.empty(0, dtype=POINT_DTYPE)
+            return np.concatenate(self._pending)
+
+    def read_session_records(self, session_id: int) -> np.ndarray:
+        """All records of one session (stored + buffered), ordered by timestamp."""
+        sid = int(session_id)
+        if self.index is None:
+            raise RuntimeError("point store was opened without a session index")
+        parts = []
+        with self._lock:
+            positions = self.index.positions(sid)
+            seen = self.index.counts() if positions is None else None
+        if positions is None:
+            positions = self._rebuild_positions(sid, seen)
+        for relpath, pos in positions.items():
+            path = os.path.join(self.root, relpath)
+            recs = np.memmap(path, dtype=POINT_DTYPE, mode="r", shape=(int(pos.max()) + 1,))
+            got = np.array(recs[pos])
+            parts.append(got[got["session_id"] == sid])  # never mix in another session's points
+        pending = self._pending_records()
+        parts.append(pending[pending["session_id"] == sid])
+        records = np.concatenate(parts) if parts else np.empty(0, dtype=POINT_DTYPE)
+        return records[np.argsort(records["ts"], kind="stable")]
+
+    def _scan_positions(self, sid: int, since: Dict[str, int], upto: Dict[str, int]) -> Dict[str, np.ndarray]:
+        """Positions of ``sid`` between the ``since`` and ``upto`` record counts of its shard's files."""
+        shard_file = f"shard-{self.shard_of(sid):03d}.bin"
+        out = {}
+        for relpath, n in upto.items():
+            lo = since.get(relpath, 0)
+            if os.path.basename(relpath) != shard_file or n <= lo:
+                continue
+            recs = np.memmap(os.path.join(self.root, relpath), dtype=POINT_DTYPE, mode="r", shape=(n,))
+            pos = np.flatnonzero(recs["session_id"][lo:n] == sid)
+            if len(pos):
+                out[relpath] = pos.astype(np.int64) + lo
+        return out
+
+    def _rebuild_positions(self, sid: int, seen: Dict[str, int]) -> Dict[str, np.ndarray]:
+        # scan the shard outside the lock, then the few records flushed meanwhile under it
+        positions = self._scan_positions(sid, {}, seen)
+        with self._lock:
+            now = self.index.counts()
+            if any(now.get(relpath, 0) < n for relpath, n in seen.items()):
+                positions, seen = {}, {}  # a file was truncated or replaced: rescan it all
+            for relpath, pos in self._scan_positions(sid, seen, now).items():
+                positions[relpath] = np.concatenate([positions[relpath], pos]) if relpath in positions else pos
+            self.index.add_session(sid, positions)
+        return positions
+
+    def read_session(self, session_id: int) -> pd.DataFrame:
+        return records_to_frame(self.read_session_records(session_id))
+
+    def iter_records(self, chunk_rows: int = 1_000_000) -> Iterator[np.ndarray]:
+        """Stream every stored record (then the buffer) in bounded chunks."""
+        for path in self.shard_files():
+            recs = np.memmap(path, dtype=POINT_DTYPE, mode="r") if os.path.getsize(path) else None
+            if recs is None:
+                continue
+            for start in range(0, len(recs), chunk_rows):
+                yield np.array(recs[start : start + chunk_rows])
+        pending = self._pending_records()
+        if len(pending):
+            yield pending
+
+    def read_all(self) -> pd.DataFrame:
+        chunks = list(self.iter_records())
+        if not chunks:
+            return records_to_frame(np.empty(0, dtype=POINT_DTYPE))
+        return records_to_frame(np.concatenate(chunks))
+
+    def import_frame(self, df: pd.DataFrame) -> int:
+        """Append a session_id/lat/lon/timestamp frame (e.g. a legacy CSV) and flush."""
+        if df is None or df.empty:
+            return 0
+        self.append(df["session_id"].tolist(), df["lat"].tolist(), df["lon"].tolist(), df["timestamp"].tolist())
+        return self.flush()
+
+
+__all__ = [
+    "POINT_DTYPE",
+    "PointStore",
+    "SessionIndex",
+    "load_legacy_csv",
+    "records_to_frame",
+    "parse_timestamps",
+    "to_epoch_seconds",
+]
@@ -0,0 +1,276 @@
+"""On-demand sampling profiler with per-endpoint attribution.
+
+``POST /admin/profile/start`` starts a daemon thread that wakes every
+``interval`` seconds, reads every thread's current Python stack with
+``sys._current_frames()`` and counts it. Stacks are folded in the format
+flamegraph.pl / speedscope / inferno read (``root;frame;frame count``), rooted
+at the endpoint the thread was working for:
+
+* worker threads (scoring lanes, the io pool) are attributed through the
+  request that submitted their task: :class:`ProfilerMiddleware` tags each
+  request with its route and :meth:`SamplingProfiler.bind`, installed as the
+  pools' ``task_hook``, carries the tag to the thread that runs the task;
+* the event-loop thread is attributed by finding an endpoint function on the
+  sampled stack;
+* everything else (the DB writer, background tasks) is rooted at
+  ``<thread name>``.
+
+A run can be restricted to one session: only samples of threads working on a
+request for that session are kept. Idle threads (blocked in a queue, a
+condition or the selector) are skipped unless asked for.
+
+When no run is active nothing is sampled, the middleware passes requests
+straight through after one attribute check and ``bind`` returns the task
+unchanged.
+"""
+from __future__ import annotations
+
+import contextvars
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, FrozenSet, Iterable, List, NamedTuple, Optional
+
+_IDLE_LEAVES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),  # concurrent.futures worker blocked on its work queue
+}
+
+
+class RequestTag(NamedTuple):
+    endpoint: str
+    sessions: Optional[FrozenSet[int]] = None
+
+
+_request_tag: "contextvars.ContextVar[Optional[RequestTag]]" = contextvars.ContextVar(
+    "profiler_request_tag", default=None
+)
+
+
+def _frame_label(code) -> str:
+    return f"{os.path.basename(code.co_filename)}:{code.co_name}".replace(";", ",").replace(" ", "_")
+
+
+class SamplingProfiler:
+    """Process-wide stack sampler; one run at a time."""
+
+    def __init__(self, max_depth: int = 128) -> None:
+        self.max_depth = int(max_depth)
+        self.active = False
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._threads: Dict[int, RequestTag] = {}  # thread ident -> tag of the task it is running
+        self._endpoint_codes: Dict[object, str] = {}
+        self._stacks: Counter = Counter()
+        self._run: Dict[str, object] = {}
+
+    # -- attribution ------------------------------------------------------
+    def set_endpoints(self, codes: Dict[object, str]) -> None:
+        """Code objects of endpoint functions -> endpoint label (for event-loop samples)."""
+        self._endpoint_codes = dict(codes)
+
+    def note_sessions(self, session_ids: Iterable[int]) -> None:
+        """Record which sessions the current request works on (only while a run is active)."""
+        if not self.active:
+            return
+        tag = _request_tag.get()
+        if tag is not None:
+            _request_tag.set(tag._replace(sessions=frozenset(int(s) for s in session_ids)))
+
+    def bind(self, fn: Callable) -> Callable:
+        """Wrap ``fn`` so samples of the thread that runs it are attributed to the current request."""
+        if not self.active:
+            return fn
+        tag = _request_tag.get()
+        if tag is None:
+            return fn
+        threads = self._threads
+
+        def attributed(*args, **kwargs):
+            ident = threading.get_ident()
+            previous = threads.get(ident)
+            threads[ident] = tag
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                if previous is None:
+                    threads.pop(ident, None)
+                else:
+                    threads[ident] = previous
+        return attributed
+
+    # -- control ----------------------------------------------------------
+    def start(
+        self,
+        seconds: float,
+        interval: float = 0.005,
+        session_id: Optional[int] = None,
+        include_idle: bool = False,
+    ) -> Dict[str, object]:
+        with self._lock:
+            if self.active:
+                raise RuntimeError("a profiling run is already active")
+            self._stacks = Counter()
+            self._threads.clear()
+            self._stop.clear()
+            self._run = {
+                "started_at": time.time(),
+                "seconds": float(seconds),
+                "interval": float(interval),
+                "session_id": session_id,
+                "include_idle": bool(include_idle),
+                "samples": 0,
+                "ticks": 0,
+                "overhead_seconds": 0.0,
+                "stopped_at": None,
+            }
+            self.active = True
+            self._thread = threading.Thread(target=self._sample_loop, name="sampling-profiler", daemon=True)
+            self._thread.start()
+        return self.status()
+
+    def stop(self) -> Dict[str, object]:
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+        return self.status()
+
+    def _finish(self) -> None:
+        with self._lock:
+            self.active = False
+            self._run["stopped_at"] = time.time()
+            self._threads.clear()
+
+    # -- sampling ---------------------------------------------------------
+    def _sample_loop(self) -> None:
+        run = self._run
+        deadline = time.monotonic() + run["seconds"]
+        interval = run["interval"]
+        try:
+            while not self._stop.wait(interval) and time.monotonic() < deadline:
+                t0 = time.perf_counter()
+                self._sample(run)
+                run["overhead_seconds"] += time.perf_counter() - t0
+                run["ticks"] += 1
+        finally:
+            self._finish()
+
+    def _sample(self, run: Dict[str, object]) -> None:
+        me = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        session_id = run["session_id"]
+        include_idle = run["include_idle"]
+        threads = self._threads
+        endpoints = self._endpoint_codes
+        taken = []
+        for ident, frame in sys._current_frames().items():
+            if ident == me:
+                continue
+            leaf = frame.f_code
+            if not include_idle and (os.path.basename(leaf.co_filename), leaf.co_name) in _IDLE_LEAVES:
+                continue
+            tag = threads.get(ident)
+            labels: List[str] = []
+            root = None
+            f = frame
+            while f is not None and len(labels) < self.max_depth:
+                code = f.f_code
+                labels.append(_frame_label(code))
+                if root is None and tag is None:
+                    root = endpoints.get(code)
+                f = f.f_back
+            if tag is not None:
+                if session_id is not None and (tag.sessions is None or session_id not in tag.sessions):
+                    continue
+                root = tag.endpoint
+            elif session_id is not None:
+                continue  # session runs only keep samples that can be tied to the session
+            elif root is None:
+                root = f"<{names.get(ident, ident)}>"
+            labels.append(root)
+            labels.reverse()
+            taken.append(";".join(labels))
+        with self._lock:
+            self._stacks.update(taken)
+            run["samples"] += len(taken)
+
+    # -- results ----------------------------------------------------------
+    def folded(self) -> str:
+        """Folded stacks (``root;frame;...;leaf count``), most frequent first."""
+        with self._lock:
+            items = self._stacks.most_common()
+        return "".join(f"{stack} {count}\n" for stack, count in items)
+
+    def status(self, top: int = 15) -> Dict[str, object]:
+        with self._lock:
+            run = dict(self._run)
+            stacks = list(self._stacks.items())
+            active = self.active
+        by_endpoint: Counter = Counter()
+        by_leaf: Counter = Counter()
+        for stack, count in stacks:
+            parts = stack.split(";")
+            by_endpoint[parts[0]] += count
+            by_leaf[parts[-1]] += count
+        total = sum(by_endpoint.values())
+        if run.get("overhead_seconds") is not None:
+            run["overhead_seconds"] = round(run["overhead_seconds"], 6)
+        return {
+            "active": active,
+            "run": run or None,
+            "samples": total,
+            "distinct_stacks": len(stacks),
+            "endpoints": {k: {"samples": v, "share": round(v / total, 4)} for k, v in by_endpoint.most_common()},
+            "top_frames": [{"frame": k, "samples": v} for k, v in by_leaf.most_common(top)],
+        }
+
+
+class ProfilerMiddleware:
+    """ASGI middleware tagging each HTTP request with its route while a profiling run is active."""
+
+    def __init__(self, app, profiler: SamplingProfiler, routes_source=None) -> None:
+        self.app = app
+        self.profiler = profiler
+        self.routes_source = routes_source
+
+    def _endpoint(self, scope) -> str:
+        from starlette.routing import Match
+        routes = getattr(self.routes_source, "routes", None) or []
+        for route in routes:
+            match, _child = route.matches(scope)
+            if match == Match.FULL:
+                return f"{scope.get('method', '')} {getattr(route, 'path', scope.get('path'))}"
+        return f"{scope.get('method', '')} {scope.get('path')}"
+
+    async def __call__(self, scope, receive, send):
+        if not self.profiler.active or scope.get("type") != "http":
+            return await self.app(scope, receive, send)
+        token = _request_tag.set(RequestTag(self._endpoint(scope)))
+        try:
+            return await self.app(scope, receive, send)
+        finally:
+            _request_tag.reset(token)
+
+
+def endpoint_codes(app) -> Dict[object, str]:
+    """Endpoint function code objects -> ``"METHOD /path"`` labels for a FastAPI/Starlette app."""
+    out = {}
+    for route in getattr(app, "routes", []):
+        endpoint = getattr(route, "endpoint", None)
+        code = getattr(endpoint, "__code__", None)
+        if code is not None:
+            methods = ",".join(sorted(getattr(route, "methods", None) or []))
+            out[code] = f"{methods} {route.path}".strip()
+    return out
+
+
+profiler = SamplingProfiler()
+
+
+__all__ = ["ProfilerMiddleware", "RequestTag", "SamplingProfiler", "endpoint_codes", "profiler"]
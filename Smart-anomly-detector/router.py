@@ -0,0 +1,155 @@
+"""
+Session-affinity router for running several detector workers.
+
+Each worker is a normal `app:app` process (own port, or own host) started with
+SESSION_STATE_BACKEND=sqlite (same SESSION_STATE_PATH on one host) so group and
+dynamic-zone state is shared. The router sends every request for a session to
+the same worker, so that worker applies the session's points in order:
+
+    DETECTOR_UPSTREAMS=http://127.0.0.1:8001,http://127.0.0.1:8002 \
+        uvicorn router:app --port 8000
+
+ - /predict, /ingest, /predict/live/{session_id}: routed by session_id
+ - /predict/window, /ingest/batch: split per worker, results merged in input order
+ - zone changes and incident reports are broadcast to every worker; other requests go to the first one
+"""
+import asyncio
+import os
+from typing import Dict, List
+
+import httpx
+from fastapi import FastAPI, HTTPException, Request, Response
+from fastapi.responses import JSONResponse
+
+from session_state import affinity_shard
+
+UPSTREAMS = [u.strip().rstrip("/") for u in os.getenv("DETECTOR_UPSTREAMS", "").split(",") if u.strip()]
+try:
+    UPSTREAM_TIMEOUT = float(os.getenv("DETECTOR_UPSTREAM_TIMEOUT", "30"))
+except Exception:
+    UPSTREAM_TIMEOUT = 30.0
+
+app = FastAPI(title="Smart Anomaly Detector router")
+client = httpx.AsyncClient(timeout=UPSTREAM_TIMEOUT)
+
+
+def upstream_for(session_id: int) -> str:
+    if not UPSTREAMS:
+        raise HTTPException(status_code=503, detail="DETECTOR_UPSTREAMS is not configured")
+    return UPSTREAMS[affinity_shard(session_id, len(UPSTREAMS))]
+
+
+def _relay(r: httpx.Response) -> Response:
+    return Response(content=r.content, status_code=r.status_code, media_type=r.headers.get("content-type"))
+
+
+def _session_id(payload) -> int:
+    try:
+        return int(payload["session_id"])
+    except Exception:
+        raise HTTPException(status_code=422, detail="session_id is required")
+
+
+def _split(points: List[dict]) -> Dict[str, List[int]]:
+    by_upstream: Dict[str, List[int]] = {}
+    for i, p in enumerate(points):
+        by_upstream.setdefault(upstream_for(_session_id(p)), []).append(i)
+    return by_upstream
+
+
+@app.post("/predict")
+@app.post("/ingest")
+async def route_point(request: Request):
+    payload = await request.json()
+    url = upstream_for(_session_id(payload)) + request.url.path
+    return _relay(await client.post(url, json=payload, params=request.query_params))
+
+
+@app.get("/predict/live/{session_id}")
+async def route_live(session_id: int):
+    return _relay(await client.get(f"{upstream_for(session_id)}/predict/live/{session_id}"))
+
+
+@app.post("/predict/window")
+async def route_window(request: Request):
+    points = await request.json()
+    if not isinstance(points, list):
+        raise HTTPException(status_code=422, detail="expected a list of points")
+    groups = _split(points)
+    responses = await asyncio.gather(*(
+        client.post(f"{up}/predict/window", json=[points[i] for i in idx]) for up, idx in groups.items()
+    ))
+    results = [None] * len(points)
+    for (up, idx), r in zip(groups.items(), responses):
+        if r.status_code != 200:
+            return _relay(r)
+        for i, out in zip(idx, r.json()["results"]):
+            results[i] = out
+    return JSONResponse(content={"results": results})
+
+
+@app.post("/ingest/batch")
+async def route_batch(request: Request):
+    body = await request.json()
+    points = body.get("points") if isinstance(body, dict) else None
+    if not isinstance(points, list):
+        raise HTTPException(status_code=422, detail="expected {'points': [...]}")
+    groups = _split(points)
+    responses = await asyncio.gather(*(
+        client.post(f"{up}/ingest/batch", json={"points": [points[i] for i in idx]}, params=request.query_params)
+        for up, idx in groups.items()
+    ))
+    ingested = 0
+    results = [None] * len(points)
+    scored = False
+    for (up, idx), r in zip(groups.items(), responses):
+        if r.status_code != 200:
+            return _relay(r)
+        data = r.json()
+        ingested += int(data.get("ingested", 0))
+        if "results" in data:
+            scored = True
+            for i, out in zip(idx, data["results"]):
+                results[i] = out
+    out = {"status": "ok", "ingested": ingested}
+    if scored:
+        out["results"] = results
+    return JSONResponse(content=out)
+
+
+@app.post("/zones")
+@app.post("/zones/dynamic")
+@app.post("/zones/reload")
+@app.post("/hotspots/incidents")
+async def broadcast(request: Request):
+    # every worker keeps its own zone index and hotspot grid, so changes go to all of them
+    if not UPSTREAMS:
+        raise HTTPException(status_code=503, detail="DETECTOR_UPSTREAMS is not configured")
+    body = await request.body()
+    headers = {"content-type": request.headers.get("content-type", "application/json")}
+    responses = await asyncio.gather(*(
+        client.post(up + request.url.path, content=body, headers=headers) for up in UPSTREAMS
+    ))
+    for r in responses:
+        if r.status_code != 200:
+            return _relay(r)
+    return _relay(responses[0])
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def passthrough(path: str, request: Request):
+    if not UPSTREAMS:
+        raise HTTPException(status_code=503, detail="DETECTOR_UPSTREAMS is not configured")
+    r = await client.request(
+        request.method,
+        f"{UPSTREAMS[0]}/{path}",
+        params=request.query_params,
+        content=await request.body(),
+        headers={"content-type": request.headers.get("content-type", "application/json")},
+    )
+    return _relay(r)
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    await client.aclose()
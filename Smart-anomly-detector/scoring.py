@@ -0,0 +1,219 @@
+"""Fast model scoring primitives for the Smart Anomaly Detector service.
+
+The fitted scikit-learn estimators are compiled once at startup into flat
+NumPy arrays so that the request path can score a single row or a whole batch
+without sklearn's per-call validation and per-tree Python dispatch.
+"""
+from __future__ import annotations
+
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def _average_path_length(n_samples: np.ndarray) -> np.ndarray:
+    """Expected path length of an unsuccessful BST search (iForest ``c(n)``)."""
+    n = np.asarray(n_samples, dtype=float)
+    out = np.zeros_like(n)
+    out[n == 2] = 1.0
+    big = n > 2
+    out[big] = 2.0 * (np.log(n[big] - 1.0) + np.euler_gamma) - 2.0 * (n[big] - 1.0) / n[big]
+    return out
+
+
+class CompiledIsolationForest:
+    """Array-backed copy of a fitted ``sklearn.ensemble.IsolationForest``.
+
+    All trees are flattened into shared node arrays (feature, threshold,
+    left/right child, leaf path length). Scoring walks every tree for every
+    row simultaneously, one tree level per NumPy step, so a row or a batch is
+    scored in a single pass. ``decision_function`` matches sklearn to
+    floating-point tolerance, and the anomaly flag is derived from the same
+    decision score (``decision < 0``) instead of a second ``predict`` pass.
+    """
+
+    __slots__ = (
+        "feature",
+        "threshold",
+        "left",
+        "right",
+        "leaf_value",
+        "roots",
+        "max_depth",
+        "offset",
+        "denominator",
+        "n_features",
+    )
+
+    def __init__(
+        self,
+        feature: np.ndarray,
+        threshold: np.ndarray,
+        left: np.ndarray,
+        right: np.ndarray,
+        leaf_value: np.ndarray,
+        roots: np.ndarray,
+        max_depth: int,
+        offset: float,
+        denominator: float,
+        n_features: int,
+    ) -> None:
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.leaf_value = leaf_value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.offset = float(offset)
+        self.denominator = float(denominator)
+        self.n_features = int(n_features)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledIsolationForest":
+        """Flatten the fitted trees of ``model`` into contiguous node arrays."""
+        n_features = int(model.n_features_in_)
+        subsample_features = getattr(model, "_max_features", n_features) != n_features
+        features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+        max_depth = 0
+        base = 0
+        for est, est_features in zip(model.estimators_, model.estimators_features_):
+            tree = est.tree_
+            n_nodes = int(tree.node_count)
+            children_left = tree.children_left.astype(np.int64)
+            children_right = tree.children_right.astype(np.int64)
+            is_leaf = children_left == -1
+
+            depth = np.zeros(n_nodes, dtype=np.int64)
+            for node in range(n_nodes):  # children always have larger ids than parents
+                if not is_leaf[node]:
+                    depth[children_left[node]] = depth[node] + 1
+                    depth[children_right[node]] = depth[node] + 1
+            max_depth = max(max_depth, int(depth.max()))
+
+            local = np.arange(n_nodes, dtype=np.int64)
+            feat = tree.feature.astype(np.int64)
+            if subsample_features:
+                feat = np.where(is_leaf, 0, np.asarray(est_features, dtype=np.int64)[np.maximum(feat, 0)])
+            # leaves point at themselves so extra iterations are no-ops
+            features.append(np.where(is_leaf, 0, feat))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            lefts.append(np.where(is_leaf, local, children_left) + base)
+            rights.append(np.where(is_leaf, local, children_right) + base)
+            # nodes on the path (depth + 1) + c(n_leaf) - 1, as in sklearn
+            leaf_val = depth + _average_path_length(tree.n_node_samples)
+            values.append(np.where(is_leaf, leaf_val, 0.0))
+            roots.append(base)
+            base += n_nodes
+
+        max_samples = getattr(model, "max_samples_", getattr(model, "_max_samples", 256))
+        denominator = len(model.estimators_) * float(_average_path_length(np.array([max_samples]))[0])
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            leaf_value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int64),
+            max_depth=max_depth,
+            offset=float(model.offset_),
+            denominator=denominator,
+            n_features=n_features,
+        )
+
+    def score_samples(self, X: np.ndarray) -> np.ndarray:
+        """Equivalent of ``IsolationForest.score_samples`` (lower = more abnormal)."""
+        # sklearn trees compare float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X[None, :]
+        rows = np.arange(X.shape[0])[None, :]
+        nodes = np.repeat(self.roots[:, None], X.shape[0], axis=1)
+        for _ in range(self.max_depth):
+            go_left = X[rows, self.feature[nodes]] <= self.threshold[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+        depths = self.leaf_value[nodes].sum(axis=0)
+        if self.denominator == 0:
+            return -np.ones(X.shape[0])
+        return -(2.0 ** (-depths / self.denominator))
+
+    def decision_function(self, X: np.ndarray) -> np.ndarray:
+        """Equivalent of ``IsolationForest.decision_function``."""
+        return self.score_samples(X) - self.offset
+
+    def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (decision_scores, anomaly_flags) from one pass over the forest."""
+        decision = self.decision_function(X)
+        return decision, (decision < 0).astype(int)
+
+
+class CoreSampleIndex:
+    """Nearest-neighbour index over the DBSCAN core samples (``components_``).
+
+    A point is DBSCAN noise at inference time when no core sample lies within
+    ``eps``. The KD-tree answers that with a pruned nearest-neighbour search
+    instead of a brute force distance to every core sample, for single rows
+    and batches alike. The search (rather than a radius count) is what the
+    service needs, because it reports the distance as ``cluster_distance``.
+    Up to ``brute_force_max`` core samples a plain NumPy scan is as fast and
+    avoids importing sklearn at startup; it accumulates the squared
+    differences feature by feature, in the KD-tree's order, so the distances
+    are identical.
+    """
+
+    __slots__ = ("tree", "eps", "n_core", "core")
+
+    BRUTE_FORCE_MAX = 4096
+    _BRUTE_CHUNK_CELLS = 1 << 20  # rows x core samples per block of the scan
+
+    def __init__(
+        self, components: np.ndarray, eps: float, leaf_size: int = 40, brute_force_max: Optional[int] = None
+    ) -> None:
+        components = np.asarray(components, dtype=float)
+        limit = self.BRUTE_FORCE_MAX if brute_force_max is None else int(brute_force_max)
+        self.eps = float(eps)
+        self.n_core = int(len(components))
+        if self.n_core <= limit:
+            self.tree = None
+            self.core = np.ascontiguousarray(components.T)  # (features, cores): one row per feature
+        else:
+            from sklearn.neighbors import KDTree
+
+            self.tree = KDTree(components, leaf_size=leaf_size)
+            self.core = None
+
+    @classmethod
+    def from_dbscan(cls, model) -> Optional["CoreSampleIndex"]:
+        core = getattr(model, "components_", None)
+        eps = getattr(model, "eps", None)
+        if core is None or eps is None or not len(core):
+            return None
+        return cls(core, eps)
+
+    def _brute_nearest(self, X: np.ndarray) -> np.ndarray:
+        X = np.asarray(X, dtype=float)
+        out = np.empty(len(X))
+        step = max(1, self._BRUTE_CHUNK_CELLS // max(1, self.n_core))
+        for start in range(0, len(X), step):
+            block = X[start : start + step]
+            rdist = np.zeros((len(block), self.n_core))
+            for j in range(self.core.shape[0]):
+                diff = block[:, j : j + 1] - self.core[j]
+                rdist += diff * diff
+            out[start : start + step] = np.sqrt(rdist.min(axis=1))
+        return out
+
+    def nearest(self, X: np.ndarray) -> np.ndarray:
+        """Distance from each row of ``X`` to its closest core sample."""
+        if self.tree is None:
+            return self._brute_nearest(np.atleast_2d(X))
+        dist, _ = self.tree.query(np.atleast_2d(X), k=1)
+        return dist[:, 0]
+
+    def score(self, X: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Return (nearest core distances, cluster noise flags)."""
+        dist = self.nearest(X)
+        return dist, (dist > self.eps).astype(int)
+
+
+__all__ = ["CompiledIsolationForest", "CoreSampleIndex"]
@@ -0,0 +1,459 @@
+"""Pluggable session state backends for the Smart Anomaly Detector service.
+
+Scoring a point reads and updates three kinds of state: the session's rolling
+feature window plus its last-seen time, the last known location of every
+member of a group, and the set of dynamic zones. Keeping them in
+process-local dicts ties a session to one worker process, so this module
+puts them behind a small store interface:
+
+* :class:`InProcessSessionStore` keeps live objects in dicts (single worker,
+  no serialisation cost).
+* :class:`SqliteSessionStore` keeps them in a SQLite database in WAL mode,
+  shared by every worker process on the host. Session windows are pickled
+  whole, so a restored window yields bit-identical features and scores.
+
+Requests for one session should still be routed to one worker
+(:func:`affinity_shard`, used by ``router.py``) so its points are applied in
+order; group and zone state is shared no matter which worker scores it.
+"""
+from __future__ import annotations
+
+import json
+import os
+import pickle
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from group_separation import GroupSeparation
+
+
+
+def affinity_shard(session_id: int, n_shards: int) -> int:
+    """Stable session -> shard mapping shared by the router and the workers."""
+    return zlib.crc32(str(int(session_id)).encode("ascii")) % max(1, int(n_shards))
+
+
+class SessionRecord:
+    """Mutable per-session state handed out by :meth:`session`."""
+
+    __slots__ = ("features", "last_seen", "touched")
+
+    def __init__(self, features, last_seen: Optional[datetime] = None) -> None:
+        self.features = features
+        self.last_seen = last_seen
+        self.touched = 0.0  # wall-clock time of the last access, for idle eviction
+
+
+class InProcessSessionStore:
+    """Session, group and zone state in this process's memory.
+
+    Sessions and groups are kept in access order. Entries idle for longer
+    than ``ttl_seconds`` are dropped by :meth:`evict_idle`, and the least
+    recently used session is dropped as soon as more than ``max_sessions``
+    are held, so memory is bounded by the active population rather than by
+    every tourist ever served.
+    """
+
+    kind = "memory"
+
+    def __init__(
+        self,
+        factory: Callable[[], object],
+        ttl_seconds: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        group_factory: Callable[[], GroupSeparation] = GroupSeparation,
+    ) -> None:
+        self._factory = factory
+        self._group_factory = group_factory
+        self.ttl_seconds = float(ttl_seconds) if ttl_seconds else None
+        self.max_sessions = int(max_sessions) if max_sessions else None
+        self._sessions: "OrderedDict[int, SessionRecord]" = OrderedDict()
+        self._groups: "OrderedDict[int, GroupSeparation]" = OrderedDict()
+        self._group_touched: Dict[int, float] = {}
+        # lanes share the LRU order and groups span sessions, so both need a lock
+        self._lock = threading.Lock()
+        self._group_lock = threading.Lock()
+        self._evicted_idle = 0
+        self._evicted_lru = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    @contextmanager
+    def session(self, session_id: int) -> Iterator[SessionRecord]:
+        """Yield the session's record; changes are live (no write-back needed)."""
+        now = time.time()
+        with self._lock:
+            rec = self._sessions.get(session_id)
+            if rec is None:
+                rec = self._sessions[session_id] = SessionRecord(self._factory())
+                if self.max_sessions is not None:
+                    while len(self._sessions) > self.max_sessions:
+                        self._sessions.popitem(last=False)
+                        self._evicted_lru += 1
+            else:
+                self._sessions.move_to_end(session_id)
+            rec.touched = now
+        yield rec
+
+    def peek(self, session_id: int) -> Optional[SessionRecord]:
+        return self._sessions.get(session_id)
+
+    def update_group(self, group_id: int, user_id: int, lat: float, lon: float, ts: float) -> bool:
+        """Record a member's position (epoch ``ts``); True when two members are too far apart."""
+        with self._group_lock:
+            group = self._groups.get(group_id)
+            if group is None:
+                group = self._groups[group_id] = self._group_factory()
+            else:
+                self._groups.move_to_end(group_id)
+            self._group_touched[group_id] = time.time()
+            return group.update(user_id, lat, lon, ts)
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Drop sessions and groups not touched for ``ttl_seconds``; returns sessions dropped."""
+        if self.ttl_seconds is None:
+            return 0
+        cutoff = (time.time() if now is None else now) - self.ttl_seconds
+        dropped = 0
+        with self._lock:
+            while self._sessions:
+                sid, rec = next(iter(self._sessions.items()))
+                if rec.touched > cutoff:
+                    break
+                del self._sessions[sid]
+                dropped += 1
+            self._evicted_idle += dropped
+        with self._group_lock:
+            while self._groups:
+                gid = next(iter(self._groups))
+                if self._group_touched.get(gid, 0.0) > cutoff:
+                    break
+                del self._groups[gid]
+                self._group_touched.pop(gid, None)
+        return dropped
+
+    def counts(self) -> Dict[str, int]:
+        """Sessions and groups held (O(1); for scrape-time gauges)."""
+        return {"sessions": len(self._sessions), "groups": len(self._groups)}
+
+    def nbytes(self) -> int:
+        """Approximate bytes held by session windows and group member tables."""
+        with self._lock:
+            records = list(self._sessions.values())
+        size = sys.getsizeof(self._sessions) + len(records) * 120  # record object + dict entry
+        size += sum(rec.features.nbytes() for rec in records)
+        with self._group_lock:
+            # per member: entries in the member, cell and heap tables
+            size += sys.getsizeof(self._groups) + sum(300 + len(g) * 400 for g in self._groups.values())
+        return size
+
+    # dynamic zones are held by the process's own registry; nothing to share
+    def publish_zone(self, zone_id: object, payload: Dict[str, object]) -> int:
+        return 0
+
+    def zones_version(self) -> int:
+        return 0
+
+    def zone_versions(self) -> Dict[object, int]:
+        return {}
+
+    def zone_payloads(self, zone_ids: Optional[Sequence[object]] = None) -> List[Tuple[object, Dict[str, object]]]:
+        return []
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.kind,
+            "sessions": len(self._sessions),
+            "groups": len(self._groups),
+            "bytes": self.nbytes(),
+            "ttl_seconds": self.ttl_seconds,
+            "max_sessions": self.max_sessions,
+            "evicted_idle": self._evicted_idle,
+            "evicted_lru": self._evicted_lru,
+        }
+
+    def close(self) -> None:
+        pass
+
+
+class SqliteSessionStore:
+    """Session, group and zone state in a SQLite file shared by worker processes.
+
+    Each thread uses its own connection. Session windows are stored as
+    pickles keyed by ``session_id``; :meth:`session` loads the record and
+    writes it back when the block exits without an exception, inside one
+    ``BEGIN IMMEDIATE`` transaction so two workers handling the same session
+    (router failover, no router) apply their points one after the other
+    instead of overwriting each other's window. Group updates
+    run in one ``BEGIN IMMEDIATE`` transaction so concurrent workers always
+    see each other's members (the group's :class:`GroupSeparation` is stored
+    pickled, one row per group). Dynamic zones are stored as their creation
+    payload with a version counter that workers poll to refresh their index.
+    Rows carry a ``touched`` time; :meth:`evict_idle` deletes idle sessions
+    and groups and trims sessions to ``max_sessions`` (oldest first). Session
+    and group row counts are kept in ``meta``, updated in the same
+    transaction as every insert and delete, so :meth:`counts` never scans.
+    """
+
+    kind = "sqlite"
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS sessions ("
+        " session_id INTEGER PRIMARY KEY, state BLOB NOT NULL, touched REAL NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS groups ("
+        " group_id INTEGER PRIMARY KEY, state BLOB NOT NULL, touched REAL NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS dynamic_zones ("
+        " zone_id TEXT PRIMARY KEY, payload TEXT NOT NULL, expires_at REAL, version INTEGER NOT NULL DEFAULT 0)",
+        "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)",
+    )
+
+    def __init__(
+        self,
+        path: str,
+        factory: Callable[[], object],
+        hotspot_index: Optional[Dict[str, object]] = None,
+        timeout: float = 30.0,
+        ttl_seconds: Optional[float] = None,
+        max_sessions: Optional[int] = None,
+        group_factory: Callable[[], GroupSeparation] = GroupSeparation,
+    ) -> None:
+        self.path = path
+        self._group_factory = group_factory
+        self.timeout = float(timeout)
+        self.ttl_seconds = float(ttl_seconds) if ttl_seconds else None
+        self.max_sessions = int(max_sessions) if max_sessions else None
+        self._evicted_idle = 0
+        self._evicted_lru = 0
+        self._factory = factory
+        self._hotspot_index = hotspot_index
+        self._local = threading.local()
+        parent = os.path.dirname(os.path.abspath(path))
+        os.makedirs(parent, exist_ok=True)
+        conn = self._conn()
+        with conn:
+            for stmt in self._SCHEMA:
+                conn.execute(stmt)
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(sessions)")}
+            if "touched" not in columns:  # databases created before idle eviction
+                conn.execute("ALTER TABLE sessions ADD COLUMN touched REAL NOT NULL DEFAULT 0")
+            columns = {row[1] for row in conn.execute("PRAGMA table_info(dynamic_zones)")}
+            if "version" not in columns:  # databases created before zones were synced by version
+                conn.execute("ALTER TABLE dynamic_zones ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+            conn.execute("DROP TABLE IF EXISTS group_members")  # superseded by the groups table
+            conn.execute("CREATE INDEX IF NOT EXISTS sessions_touched ON sessions (touched)")
+            conn.execute("CREATE INDEX IF NOT EXISTS groups_touched ON groups (touched)")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('zones_version', 0)")
+            # running row counts, seeded once for databases created before they existed
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT 'sessions', COUNT(*) FROM sessions")
+            conn.execute("INSERT OR IGNORE INTO meta (key, value) SELECT 'groups', COUNT(*) FROM groups")
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def __len__(self) -> int:
+        return self.counts()["sessions"]
+
+    def _load(self, session_id: int) -> Optional[SessionRecord]:
+        row = self._conn().execute(
+            "SELECT state FROM sessions WHERE session_id = ?", (int(session_id),)
+        ).fetchone()
+        if row is None:
+            return None
+        features, last_seen = pickle.loads(row[0])
+        features.hotspot_index = self._hotspot_index
+        return SessionRecord(features, last_seen)
+
+    @contextmanager
+    def session(self, session_id: int) -> Iterator[SessionRecord]:
+        """Yield the session's record and persist it when the block succeeds."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rec = self._load(session_id)
+            created = rec is None
+            if created:
+                rec = SessionRecord(self._factory())
+            yield rec
+            if created:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'sessions'")
+            blob = pickle.dumps((rec.features, rec.last_seen), protocol=pickle.HIGHEST_PROTOCOL)
+            conn.execute(
+                "INSERT INTO sessions (session_id, state, touched) VALUES (?, ?, ?)"
+                " ON CONFLICT(session_id) DO UPDATE SET state = excluded.state, touched = excluded.touched",
+                (int(session_id), blob, time.time()),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def peek(self, session_id: int) -> Optional[SessionRecord]:
+        return self._load(session_id)
+
+    def update_group(self, group_id: int, user_id: int, lat: float, lon: float, ts: float) -> bool:
+        """Record a member's position (epoch ``ts``); True when two members are too far apart."""
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT state FROM groups WHERE group_id = ?", (int(group_id),)).fetchone()
+            group = pickle.loads(row[0]) if row else self._group_factory()
+            if row is None:
+                conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'groups'")
+            separated = group.update(user_id, lat, lon, ts)
+            conn.execute(
+                "INSERT INTO groups (group_id, state, touched) VALUES (?, ?, ?)"
+                " ON CONFLICT(group_id) DO UPDATE SET state = excluded.state, touched = excluded.touched",
+                (int(group_id), pickle.dumps(group, protocol=pickle.HIGHEST_PROTOCOL), time.time()),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return separated
+
+    def publish_zone(self, zone_id: object, payload: Dict[str, object]) -> int:
+        """Store a dynamic zone's creation payload, bump the zones version and return it."""
+        expires_at = datetime.fromisoformat(payload["expires_at"]).timestamp()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute("DELETE FROM dynamic_zones WHERE expires_at <= ?", (datetime.now().timestamp(),))
+            conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'zones_version'")
+            version = int(conn.execute("SELECT value FROM meta WHERE key = 'zones_version'").fetchone()[0])
+            conn.execute(
+                "INSERT INTO dynamic_zones (zone_id, payload, expires_at, version) VALUES (?, ?, ?, ?)"
+                " ON CONFLICT(zone_id) DO UPDATE SET"
+                " payload = excluded.payload, expires_at = excluded.expires_at, version = excluded.version",
+                (json.dumps(zone_id), json.dumps(payload), expires_at, version),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return version
+
+    def zones_version(self) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'zones_version'").fetchone()
+        return int(row[0]) if row else 0
+
+    def zone_versions(self) -> Dict[object, int]:
+        """zone_id -> version it was last published at, without reading the payloads."""
+        rows = self._conn().execute("SELECT zone_id, version FROM dynamic_zones").fetchall()
+        return {json.loads(zid): int(version) for zid, version in rows}
+
+    def zone_payloads(self, zone_ids: Optional[Sequence[object]] = None) -> List[Tuple[object, Dict[str, object]]]:
+        """Published payloads (of ``zone_ids`` only, if given) in publication order."""
+        conn = self._conn()
+        if zone_ids is None:
+            rows = conn.execute("SELECT zone_id, payload FROM dynamic_zones ORDER BY rowid").fetchall()
+        else:
+            keys = [json.dumps(zid) for zid in zone_ids]
+            rows = []
+            for i in range(0, len(keys), 500):  # stay under SQLite's bound-parameter limit
+                chunk = keys[i : i + 500]
+                rows.extend(conn.execute(
+                    f"SELECT rowid, zone_id, payload FROM dynamic_zones WHERE zone_id IN ({','.join('?' * len(chunk))})",
+                    chunk,
+                ).fetchall())
+            rows = [row[1:] for row in sorted(rows)]
+        return [(json.loads(zid), json.loads(payload)) for zid, payload in rows]
+
+    def evict_idle(self, now: Optional[float] = None) -> int:
+        """Delete idle sessions/group members and trim to ``max_sessions``; returns sessions dropped."""
+        conn = self._conn()
+        idle = lru = groups = 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if self.ttl_seconds is not None:
+                cutoff = (time.time() if now is None else now) - self.ttl_seconds
+                idle = conn.execute("DELETE FROM sessions WHERE touched <= ?", (cutoff,)).rowcount
+                groups = conn.execute("DELETE FROM groups WHERE touched <= ?", (cutoff,)).rowcount
+            if self.max_sessions is not None:
+                lru = conn.execute(
+                    "DELETE FROM sessions WHERE session_id IN"
+                    " (SELECT session_id FROM sessions ORDER BY touched DESC LIMIT -1 OFFSET ?)",
+                    (self.max_sessions,),
+                ).rowcount
+            conn.execute("UPDATE meta SET value = value - ? WHERE key = 'sessions'", (idle + lru,))
+            conn.execute("UPDATE meta SET value = value - ? WHERE key = 'groups'", (groups,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._evicted_idle += idle
+        self._evicted_lru += lru
+        return idle + lru
+
+    def counts(self) -> Dict[str, int]:
+        """Sessions and groups held, from the running counts in ``meta`` (no table scan)."""
+        rows = self._conn().execute("SELECT key, value FROM meta WHERE key IN ('sessions', 'groups')").fetchall()
+        out = {"sessions": 0, "groups": 0}
+        out.update((k, int(v)) for k, v in rows)
+        return out
+
+    def nbytes(self) -> int:
+        """Bytes of pickled session state held in the database."""
+        row = self._conn().execute("SELECT COALESCE(SUM(LENGTH(state)), 0) FROM sessions").fetchone()
+        return int(row[0])
+
+    def stats(self) -> Dict[str, object]:
+        return {
+            "backend": self.kind,
+            "path": self.path,
+            **self.counts(),
+            "bytes": self.nbytes(),
+            "ttl_seconds": self.ttl_seconds,
+            "max_sessions": self.max_sessions,
+            "evicted_idle": self._evicted_idle,
+            "evicted_lru": self._evicted_lru,
+        }
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def make_session_store(
+    backend: str,
+    factory: Callable[[], object],
+    path: Optional[str] = None,
+    hotspot_index: Optional[Dict[str, object]] = None,
+    ttl_seconds: Optional[float] = None,
+    max_sessions: Optional[int] = None,
+    group_factory: Callable[[], GroupSeparation] = GroupSeparation,
+):
+    """Build the store named by ``backend`` (``memory`` or ``sqlite``)."""
+    backend = (backend or "memory").strip().lower()
+    limits = dict(ttl_seconds=ttl_seconds, max_sessions=max_sessions, group_factory=group_factory)
+    if backend in ("memory", "inprocess", "local"):
+        return InProcessSessionStore(factory, **limits)
+    if backend == "sqlite":
+        if not path:
+            raise ValueError("the sqlite session store needs a path")
+        return SqliteSessionStore(path, factory, hotspot_index=hotspot_index, **limits)
+    raise ValueError(f"unknown session state backend: {backend!r}")
+
+
+__all__ = [
+    "InProcessSessionStore",
+    "SessionRecord",
+    "SqliteSessionStore",
+    "affinity_shard",
+    "make_session_store",
+]
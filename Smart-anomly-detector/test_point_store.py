@@ -0,0 +1,57 @@
+"""Regression tests for GPS point timestamp parsing (run with ``python -m pytest``)."""
+from datetime import datetime, timezone
+
+import numpy as np
+import pytest
+
+from point_store import PointStore, to_epoch_seconds
+
+EPOCH_10AM = datetime(2025, 9, 7, 10, 0, tzinfo=timezone.utc).timestamp()
+
+
+def test_mixed_iso_formats_in_one_batch():
+    stamps = [
+        "2025-09-07T10:00:00",
+        "2025-09-07T10:00:00.5",
+        "2025-09-07T15:30:00+05:30",
+        "2025-09-07 10:00:00",
+        "2025-09-07T10:00:00Z",
+        datetime(2025, 9, 7, 10, 0),
+    ]
+    expected = [EPOCH_10AM, EPOCH_10AM + 0.5] + [EPOCH_10AM] * 4
+    assert to_epoch_seconds(stamps).tolist() == expected
+
+
+def test_non_iso_row_next_to_iso_rows():
+    assert to_epoch_seconds(["2025-09-07T10:00:00", "09/07/2025 10:00"]).tolist() == [EPOCH_10AM] * 2
+
+
+def test_only_unparseable_rows_are_reported():
+    with pytest.raises(ValueError, match=r"rows 1\b"):
+        to_epoch_seconds(["2025-09-07T10:00:00", "not a time", "2025-09-07 10:00:00"])
+
+
+def test_append_mixed_batch(tmp_path):
+    store = PointStore(str(tmp_path / "points"), n_shards=2)
+    store.append([1, 1, 1], [28.6, 28.61, 28.62], [77.2, 77.21, 77.22],
+                 ["2025-09-07T10:00:00", "2025-09-07T10:00:00.5", "2025-09-07T15:31:00+05:30"])
+    store.flush()
+    records = store.read_session_records(1)
+    assert np.allclose(records["ts"], [EPOCH_10AM, EPOCH_10AM + 0.5, EPOCH_10AM + 60])
+
+
+def test_capped_index_rebuilds_dropped_sessions(tmp_path):
+    store = PointStore(str(tmp_path / "points"), n_shards=2, max_indexed_sessions=2)
+    for batch in range(3):
+        sids = [1, 2, 3, 4, 5]
+        store.append(sids, [28.6] * 5, [77.2] * 5, [f"2025-09-07T10:00:0{batch}"] * 5)
+        store.flush()
+        assert len(store.index) <= 2
+    assert not store.index.complete
+    for sid in [1, 2, 3, 4, 5, 1]:
+        records = store.read_session_records(sid)
+        assert len(records) == 3 and (records["session_id"] == sid).all()
+    store.append([1, 5], [28.6] * 2, [77.2] * 2, ["2025-09-07T10:00:09"] * 2)
+    store.flush()
+    assert len(store.read_session_records(1)) == 4
+    assert len(store.read_session_records(5)) == 4
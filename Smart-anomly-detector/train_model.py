@@ -6,9 +6,15 @@ ML detector) and a DBSCAN density model used for secondary scoring. All model
 artifacts, metadata, and the hotspot index are saved to the model/ directory.
 """
 
+import glob
 import json
 import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
 from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
 
 import joblib
 import numpy as np
@@ -20,17 +26,60 @@ from sklearn.preprocessing import StandardScaler
 from feature_engineering import (
     DEFAULT_GRID_SIZE,
     build_hotspot_index,
-    compute_session_features,
-    load_points_from_dataframe,
+    compute_session_features_batch,
+    load_hotspot_index,
     save_hotspot_index,
 )
+from point_store import POINT_DTYPE, PointStore, parse_timestamps, records_to_frame
+from model_store import BUNDLE_FILE, save_model_bundle, source_digests
+from scoring import CompiledIsolationForest, CoreSampleIndex
 
 BASE_DIR = os.path.dirname(__file__)
 DATA_DIR = os.path.join(BASE_DIR, "data")
 MODEL_DIR = os.path.join(BASE_DIR, "model")
 HOTSPOT_PATH = os.path.join(MODEL_DIR, "hotspot_index.json")
+HOTSPOT_GRID_PATH = os.path.join(MODEL_DIR, "hotspot_index.bin")
 os.makedirs(MODEL_DIR, exist_ok=True)
 
+# GPS points are staged into a session-sharded point store, then features are
+# computed one shard at a time on a process pool, so peak memory is about
+# TRAIN_WORKERS shards rather than the whole history.
+STAGE_DIR = os.getenv("TRAIN_STAGE_DIR", os.path.join(DATA_DIR, ".train_stage"))
+try:
+    TRAIN_CHUNK_ROWS = max(1000, int(os.getenv("TRAIN_CHUNK_ROWS", "1000000")))
+    TRAIN_SHARDS = max(1, int(os.getenv("TRAIN_SHARDS", "64")))
+    TRAIN_WORKERS = max(1, int(os.getenv("TRAIN_WORKERS", str(os.cpu_count() or 1))))
+except Exception:
+    TRAIN_CHUNK_ROWS, TRAIN_SHARDS, TRAIN_WORKERS = 1_000_000, 64, os.cpu_count() or 1
+
+FEATURE_COLS = [
+    "session_id",
+    "avg_speed",
+    "max_speed",
+    "std_speed",
+    "total_distance",
+    "route_deviation_ratio",
+    "isolated_stops",
+    "night_fraction",
+    "location_entropy",
+    "hour",
+    "day_of_week",
+    "time_since_last",
+    "crime_rate_local",
+    "event_density_local",
+]
+
+TIMINGS: Dict[str, float] = {}
+
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage; durations end up in model_metadata.json."""
+    t0 = time.perf_counter()
+    yield
+    TIMINGS[name] = round(time.perf_counter() - t0, 3)
+    print(f"   ⏱️  {name}: {TIMINGS[name]:.2f}s")
+
 
 def _normalise_gps_df(df: pd.DataFrame) -> pd.DataFrame:
     """Ensure a GPS dataframe has the expected schema."""
@@ -50,29 +99,121 @@ def _normalise_gps_df(df: pd.DataFrame) -> pd.DataFrame:
     df["session_id"] = df["session_id"].astype(int)
     df["lat"] = df["lat"].astype(float)
     df["lon"] = df["lon"].astype(float)
-    df["timestamp"] = pd.to_datetime(df["timestamp"], errors="coerce")
+    # naive timestamps are taken as UTC, the same convention as the service's store
+    df["timestamp"] = parse_timestamps(df["timestamp"])
     df = df.dropna(subset=["timestamp"])
     return df[required]
 
 
-def load_gps_sessions() -> pd.DataFrame:
-    frames = []
-    logs_path = os.path.join(DATA_DIR, "gps_logs.csv")
-    data_path = os.path.join(DATA_DIR, "gps_data.csv")
-
-    if os.path.exists(logs_path):
-        df_logs = pd.read_csv(logs_path)
-        frames.append(_normalise_gps_df(df_logs))
-    if os.path.exists(data_path):
-        df_data = pd.read_csv(data_path)
-        frames.append(_normalise_gps_df(df_data))
+def _frame_to_records(df: pd.DataFrame) -> np.ndarray:
+    records = np.empty(len(df), dtype=POINT_DTYPE)
+    if records.size == 0:
+        return records
+    records["session_id"] = df["session_id"].to_numpy(dtype=np.int64)
+    records["lat"] = df["lat"].to_numpy(dtype=float)
+    records["lon"] = df["lon"].to_numpy(dtype=float)
+    ns = df["timestamp"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    records["ts"] = ns / 1e9
+    return records
+
+
+def iter_gps_chunks(chunk_rows: int = TRAIN_CHUNK_ROWS) -> Iterator[Tuple[str, np.ndarray]]:
+    """Stream (source, records) chunks from the GPS CSVs and the service's point store."""
+    for name in ("gps_logs.csv", "gps_data.csv"):
+        path = os.path.join(DATA_DIR, name)
+        if not os.path.exists(path):
+            continue
+        for chunk in pd.read_csv(path, chunksize=chunk_rows):
+            yield name, _frame_to_records(_normalise_gps_df(chunk))
+    points_dir = os.path.join(DATA_DIR, "points")
+    if os.path.isdir(points_dir):
+        # points ingested by the service since the CSVs were exported
+        for records in PointStore(points_dir, indexed=False).iter_records(chunk_rows):
+            yield "points", records
+
+
+def stage_gps_points(stage_dir: str = STAGE_DIR, n_shards: int = TRAIN_SHARDS) -> int:
+    """Copy every GPS source into a fresh session-sharded store under ``stage_dir``."""
+    shutil.rmtree(stage_dir, ignore_errors=True)
+    store = PointStore(stage_dir, n_shards=n_shards, flush_rows=TRAIN_CHUNK_ROWS, indexed=False)
+    staged = 0
+    reported = 0
+    last_source = None
+    for source, records in iter_gps_chunks():
+        if last_source is not None and source != last_source:
+            print(f"   {last_source}: {staged:,} points staged")
+            reported = staged
+        store.append_records(records)
+        staged += len(records)
+        last_source = source
+        if staged - reported >= TRAIN_CHUNK_ROWS:
+            print(f"   {source}: {staged:,} points staged")
+            reported = staged
+    if last_source is not None and staged != reported:
+        print(f"   {last_source}: {staged:,} points staged")
+    store.flush()
+    return staged
+
+
+_worker_hotspot_index = None
+
+
+def _init_feature_worker(hotspot_path: Optional[str]) -> None:
+    global _worker_hotspot_index
+    # the binary grid is memory-mapped, so every worker shares the same pages
+    _worker_hotspot_index = load_hotspot_index(hotspot_path) if hotspot_path else None
+
+
+def shard_features(stage_dir: str, shard: int) -> Tuple[int, int, np.ndarray]:
+    """Features of every session in one staged shard: (shard, points, float64 matrix).
+
+    Matrix columns follow ``FEATURE_COLS`` (session_id first).
+    """
+    files = sorted(glob.glob(os.path.join(stage_dir, "*", f"shard-{shard:03d}.bin")))
+    if not files:
+        return shard, 0, np.empty((0, len(FEATURE_COLS)))
+    df = records_to_frame(np.concatenate([PointStore.read_file(f) for f in files]))
+    # a session lives in exactly one shard, so duplicates across sources meet here
+    df = df.drop_duplicates(subset=["session_id", "timestamp", "lat", "lon"])
+    feats = compute_session_features_batch(df, hotspot_index=_worker_hotspot_index).fillna(0.0)
+    return shard, len(df), feats[FEATURE_COLS].to_numpy(dtype=np.float64)
+
+
+def compute_features_sharded(
+    stage_dir: str, n_shards: int, hotspot_path: Optional[str], workers: int = TRAIN_WORKERS
+) -> Tuple[np.ndarray, int]:
+    """Run :func:`shard_features` over all shards; returns (matrix sorted by session_id, points)."""
+    parts: List[np.ndarray] = []
+    points = 0
+    done = 0
+    t0 = time.perf_counter()
+
+    def _collect(result) -> None:
+        nonlocal points, done
+        shard, n_points, matrix = result
+        parts.append(matrix)
+        points += n_points
+        done += 1
+        if done == n_shards or done % max(1, n_shards // 10) == 0:
+            print(
+                f"   shards {done}/{n_shards} · {points:,} points · "
+                f"{sum(len(p) for p in parts):,} sessions · {time.perf_counter() - t0:.1f}s"
+            )
 
-    if not frames:
-        raise RuntimeError("No GPS CSVs found in data/. Provide gps_logs.csv or gps_data.csv.")
+    if workers <= 1:
+        _init_feature_worker(hotspot_path)
+        for shard in range(n_shards):
+            _collect(shard_features(stage_dir, shard))
+    else:
+        with ProcessPoolExecutor(
+            max_workers=workers, initializer=_init_feature_worker, initargs=(hotspot_path,)
+        ) as pool:
+            futures = [pool.submit(shard_features, stage_dir, shard) for shard in range(n_shards)]
+            for fut in as_completed(futures):
+                _collect(fut.result())
 
-    merged = pd.concat(frames, ignore_index=True)
-    merged = merged.drop_duplicates(subset=["session_id", "timestamp", "lat", "lon"])
-    return merged
+    matrix = np.concatenate(parts) if parts else np.empty((0, len(FEATURE_COLS)))
+    return matrix[np.argsort(matrix[:, 0], kind="stable")], points
 
 
 def load_reviews() -> pd.DataFrame:
@@ -91,98 +232,99 @@ def load_reviews() -> pd.DataFrame:
 
 
 def main():
-    print("📦 Loading GPS sessions …")
-    gps_df = load_gps_sessions()
-    session_points = load_points_from_dataframe(gps_df)
-    if not session_points:
-        raise RuntimeError("No session data available after preprocessing.")
-
-    print("📊 Loaded", len(session_points), "sessions (", len(gps_df), "points )")
+    print("📦 Staging GPS points …")
+    with stage("stage_points"):
+        staged = stage_gps_points()
+    if not staged:
+        raise RuntimeError("No GPS data found in data/. Provide gps_logs.csv, gps_data.csv or data/points.")
 
     print("🛰️ Building hotspot index …")
-    reviews_df = load_reviews()
-    hotspot_index = None
-    if not reviews_df.empty:
-        grid_size = float(os.getenv("HOTSPOT_GRID_SIZE", DEFAULT_GRID_SIZE))
-        hotspot_index = build_hotspot_index(reviews_df, grid_size=grid_size)
-        save_hotspot_index(hotspot_index, HOTSPOT_PATH)
-        print(
-            "   Hotspot grid size:", grid_size,
-            "| cells:", len(hotspot_index.get("cells", {})),
-        )
-    else:
+    with stage("hotspot_index"):
+        reviews_df = load_reviews()
         hotspot_index = None
-        if os.path.exists(HOTSPOT_PATH):
-            os.remove(HOTSPOT_PATH)
-        print("   No incident reviews found; hotspot features disabled.")
-
-    print("🧮 Engineering features …")
-    feature_rows = []
-    for session_id, points in session_points.items():
-        feats = compute_session_features(points, session_id=session_id, hotspot_index=hotspot_index)
-        feature_rows.append(feats)
-
-    features_df = pd.DataFrame(feature_rows).fillna(0.0)
-    if features_df.empty:
-        raise RuntimeError("Feature dataframe is empty. Check input data quality.")
-
-    feature_cols = [
-        "session_id",
-        "avg_speed",
-        "max_speed",
-        "std_speed",
-        "total_distance",
-        "route_deviation_ratio",
-        "isolated_stops",
-        "night_fraction",
-        "location_entropy",
-        "hour",
-        "day_of_week",
-        "time_since_last",
-        "crime_rate_local",
-        "event_density_local",
-    ]
-    missing_cols = [c for c in feature_cols if c not in features_df.columns]
-    if missing_cols:
-        raise RuntimeError(f"Missing engineered feature columns: {missing_cols}")
-
-    X = features_df[feature_cols].copy()
-    X.pop("session_id")
-
-    scaler = StandardScaler()
-    Xs = scaler.fit_transform(X.values)
-
-    n_sessions = len(features_df)
+        if not reviews_df.empty:
+            grid_size = float(os.getenv("HOTSPOT_GRID_SIZE", DEFAULT_GRID_SIZE))
+            hotspot_index = build_hotspot_index(reviews_df, grid_size=grid_size)
+            save_hotspot_index(hotspot_index, HOTSPOT_PATH)
+            save_hotspot_index(hotspot_index, HOTSPOT_GRID_PATH)
+            print(
+                "   Hotspot grid size:", grid_size,
+                "| cells:", hotspot_index.n_cells,
+            )
+        else:
+            hotspot_index = None
+            for path in (HOTSPOT_PATH, HOTSPOT_GRID_PATH):
+                if os.path.exists(path):
+                    os.remove(path)
+            print("   No incident reviews found; hotspot features disabled.")
+
+    print(f"🧮 Engineering features ({TRAIN_SHARDS} shards, {TRAIN_WORKERS} workers) …")
+    with stage("features"):
+        features, gps_points = compute_features_sharded(
+            STAGE_DIR, TRAIN_SHARDS, HOTSPOT_GRID_PATH if hotspot_index is not None else None
+        )
+    if not len(features):
+        raise RuntimeError("Feature matrix is empty. Check input data quality.")
+    if not os.getenv("TRAIN_KEEP_STAGE"):
+        shutil.rmtree(STAGE_DIR, ignore_errors=True)
+
+    print("📊 Loaded", len(features), "sessions (", gps_points, "points )")
+    feature_cols = list(FEATURE_COLS)
+    X = features[:, 1:]
+
+    print("🌲 Fitting models …")
+    with stage("scaler"):
+        scaler = StandardScaler()
+        Xs = scaler.fit_transform(X)
+
+    n_sessions = len(features)
     base_contamination = float(os.getenv("IFOREST_CONTAMINATION", "0.05"))
     contamination = max(0.01, min(0.2, base_contamination))
     if contamination * n_sessions < 1:
         contamination = max(0.01, min(0.2, 2.0 / max(n_sessions, 10)))
 
-    iso = IsolationForest(
-        n_estimators=300,
-        contamination=contamination,
-        random_state=42,
-        bootstrap=False,
-        max_samples="auto",
-    )
-    iso.fit(Xs)
+    with stage("isolation_forest"):
+        iso = IsolationForest(
+            n_estimators=300,
+            contamination=contamination,
+            random_state=42,
+            bootstrap=False,
+            max_samples="auto",
+        )
+        iso.fit(Xs)
 
     eps = float(os.getenv("DBSCAN_EPS", "2.5"))
     min_samples = int(os.getenv("DBSCAN_MIN_SAMPLES", "3"))
-    dbs = DBSCAN(eps=eps, min_samples=min_samples)
-    dbs.fit(Xs)
+    with stage("dbscan"):
+        dbs = DBSCAN(eps=eps, min_samples=min_samples)
+        dbs.fit(Xs)
 
     print("💾 Saving artifacts …")
     joblib.dump(scaler, os.path.join(MODEL_DIR, "scaler.pkl"))
     joblib.dump(iso, os.path.join(MODEL_DIR, "isolation_forest.pkl"))
     joblib.dump(dbs, os.path.join(MODEL_DIR, "dbscan.pkl"))
+    core_index = CoreSampleIndex.from_dbscan(dbs)
+    core_index_path = os.path.join(MODEL_DIR, "dbscan_index.pkl")
+    if core_index is not None:
+        joblib.dump(core_index, core_index_path)
+    elif os.path.exists(core_index_path):
+        os.remove(core_index_path)
     joblib.dump(feature_cols, os.path.join(MODEL_DIR, "feature_cols.pkl"))
+    # compiled, memory-mapped copy the service loads instead of unpickling (see model_store.py)
+    save_model_bundle(
+        os.path.join(MODEL_DIR, BUNDLE_FILE),
+        scaler,
+        CompiledIsolationForest.from_sklearn(iso),
+        dbs,
+        feature_cols,
+        sources=source_digests(MODEL_DIR),
+    )
 
     decision_scores = iso.decision_function(Xs)
     metadata = {
         "trained_at": datetime.now(timezone.utc).isoformat(),
         "n_sessions": int(n_sessions),
-        "gps_points": int(len(gps_df)),
+        "gps_points": int(gps_points),
         "feature_cols": feature_cols,
         "iforest": {
             "contamination": float(contamination),
@@ -199,8 +341,14 @@ def main():
         },
         "hotspot": {
             "enabled": bool(hotspot_index),
-            "grid_size": float(hotspot_index.get("grid_size")) if hotspot_index else None,
-            "cells": int(len(hotspot_index.get("cells", {}))) if hotspot_index else 0,
+            "grid_size": float(hotspot_index.grid_size) if hotspot_index else None,
+            "cells": int(hotspot_index.n_cells) if hotspot_index else 0,
+        },
+        "training": {
+            "shards": TRAIN_SHARDS,
+            "workers": TRAIN_WORKERS,
+            "chunk_rows": TRAIN_CHUNK_ROWS,
+            "timings_seconds": dict(TIMINGS),
         },
     }
     with open(os.path.join(MODEL_DIR, "model_metadata.json"), "w", encoding="utf-8") as fh:
@@ -0,0 +1,138 @@
+"""Bounded, session-sharded execution lanes for the request hot path.
+
+Scoring mutates per-session state (feature windows, inactivity timers), so
+the points of one session must be processed in arrival order. Each lane is a
+single worker thread with its own FIFO queue and a session always maps to
+the same lane, which gives per-session ordering without a lock per session
+while different sessions are scored in parallel. The NumPy/sklearn kernels
+used for scoring release the GIL for their heavy loops.
+
+A global cap on queued + running tasks provides admission control: when it
+is reached :class:`Overloaded` is raised immediately instead of letting the
+backlog (and latency) grow without bound; the API maps it to HTTP 429.
+"""
+from __future__ import annotations
+
+import asyncio
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+
+
+class Overloaded(RuntimeError):
+    """Raised when a pool is at its admission limit."""
+
+
+class _AdmissionControlled:
+    """Shared admission counter and submit/run plumbing for the pools below."""
+
+    def __init__(self, workers: int, max_pending: int, name: str) -> None:
+        self.workers = max(1, int(workers))
+        self.max_pending = max(1, int(max_pending))
+        self.name = name
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._rejected = 0
+        self._completed = 0
+        # optional fn -> fn wrapper applied on the submitting thread (e.g. profiler attribution)
+        self.task_hook: Optional[Callable[[Callable], Callable]] = None
+
+    def _admit(self, n: int = 1, force: bool = False) -> None:
+        with self._lock:
+            if not force and self._pending + n > self.max_pending:
+                self._rejected += n
+                raise Overloaded(f"{self.name} pool saturated ({self._pending} tasks pending)")
+            self._pending += n
+
+    def _release(self, _fut: Future) -> None:
+        with self._lock:
+            self._pending -= 1
+            self._completed += 1
+
+    def _executor_for(self, key: Optional[Hashable]) -> ThreadPoolExecutor:
+        raise NotImplementedError
+
+    def _submit_admitted(self, fn: Callable, args: tuple, kwargs: dict, key: Optional[Hashable]) -> Future:
+        if self.task_hook is not None:
+            fn = self.task_hook(fn)
+        try:
+            fut = self._executor_for(key).submit(fn, *args, **kwargs)
+        except Exception:
+            with self._lock:
+                self._pending -= 1
+            raise
+        fut.add_done_callback(self._release)
+        return fut
+
+    def submit(
+        self, fn: Callable, *args, key: Optional[Hashable] = None, force: bool = False, **kwargs
+    ) -> Future:
+        """Queue ``fn(*args, **kwargs)``; raises :class:`Overloaded` at the admission limit.
+
+        ``force`` bypasses the limit for continuations of already-admitted work.
+        """
+        self._admit(force=force)
+        return self._submit_admitted(fn, args, kwargs, key)
+
+    def submit_many(self, calls: Sequence[Tuple[Callable, tuple, Optional[Hashable]]]) -> List[Future]:
+        """Admit ``(fn, args, key)`` calls all-or-nothing, then queue them in order."""
+        self._admit(len(calls))
+        return [self._submit_admitted(fn, args, {}, key) for fn, args, key in calls]
+
+    async def run(
+        self, fn: Callable, *args, key: Optional[Hashable] = None, force: bool = False, **kwargs
+    ):
+        """Await ``fn`` on the pool from the event loop."""
+        return await asyncio.wrap_future(self.submit(fn, *args, key=key, force=force, **kwargs))
+
+    def stats(self) -> Dict[str, object]:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "completed": self._completed,
+                "rejected": self._rejected,
+            }
+
+
+class BoundedExecutor(_AdmissionControlled):
+    """Thread pool with a cap on queued + running tasks (no ordering guarantees)."""
+
+    def __init__(self, workers: int, max_pending: int, name: str = "worker") -> None:
+        super().__init__(workers, max_pending, name)
+        self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix=name)
+
+    def _executor_for(self, key: Optional[Hashable]) -> ThreadPoolExecutor:
+        return self._pool
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._pool.shutdown(wait=wait)
+
+
+class ShardedExecutor(_AdmissionControlled):
+    """One single-threaded lane per worker; tasks with the same key run in submission order."""
+
+    def __init__(self, workers: int, max_pending: int, name: str = "lane") -> None:
+        super().__init__(workers, max_pending, name)
+        self._lanes: List[ThreadPoolExecutor] = [
+            ThreadPoolExecutor(max_workers=1, thread_name_prefix=f"{name}-{i}") for i in range(self.workers)
+        ]
+        self._rr = 0
+
+    def lane_of(self, key: Optional[Hashable]) -> int:
+        """Lane index for ``key``; keyless tasks are spread round-robin."""
+        if key is None:
+            self._rr = (self._rr + 1) % self.workers
+            return self._rr
+        return hash(key) % self.workers
+
+    def _executor_for(self, key: Optional[Hashable]) -> ThreadPoolExecutor:
+        return self._lanes[self.lane_of(key)]
+
+    def shutdown(self, wait: bool = True) -> None:
+        for lane in self._lanes:
+            lane.shutdown(wait=wait)
+
+
+__all__ = ["BoundedExecutor", "Overloaded", "ShardedExecutor"]
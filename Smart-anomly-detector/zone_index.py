@@ -0,0 +1,342 @@
+"""Spatial index over static and dynamic geofence zones.
+
+Zone lookups run for every GPS point, so instead of scanning every polygon the
+service keeps an STRtree per zone set. A query first filters by bounding box
+in the tree and then evaluates a single ``intersects`` predicate, which for a
+point is the same as ``covers`` (interior or boundary). Dynamic zones win over
+static ones and, within a set, the earliest zone in insertion order wins, the
+same precedence as the original linear scan.
+"""
+from __future__ import annotations
+
+import heapq
+import itertools
+import threading
+import time
+from datetime import datetime
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from shapely.strtree import STRtree
+
+from feature_engineering import haversine_km_array
+
+
+def parse_zone_geometry(geojson: Dict[str, object]):
+    """Parse a GeoJSON geometry, repairing invalid rings so predicates never raise."""
+    geom = shape(geojson)
+    if geom.is_empty:
+        raise ValueError("empty geometry")
+    if not geom.is_valid:
+        geom = shapely.make_valid(geom)
+    return geom
+
+
+def _zone_meta(zone: Dict[str, object], zone_id: object, dynamic: bool) -> Dict[str, object]:
+    return {
+        "zone_id": zone_id,
+        "name": zone.get("name"),
+        "risk_level": zone.get("risk_level"),
+        "dynamic": dynamic,
+    }
+
+
+class _ZoneTree:
+    """Immutable STRtree over one zone set, with metadata aligned to tree indices.
+
+    ``expires`` optionally holds a POSIX expiry per zone so lookups can skip
+    zones that expired since the tree was built.
+    """
+
+    __slots__ = ("meta", "geoms", "tree", "expires")
+
+    def __init__(
+        self,
+        entries: Sequence[Tuple[Dict[str, object], object]],
+        expires: Optional[Sequence[float]] = None,
+    ) -> None:
+        self.meta = [m for m, _ in entries]
+        self.geoms = [g for _, g in entries]
+        self.tree = STRtree(self.geoms) if self.geoms else None
+        self.expires = np.asarray(expires, dtype=float) if expires is not None else None
+
+    def __len__(self) -> int:
+        return len(self.geoms)
+
+    def first_hits(self, points: np.ndarray, now: Optional[float] = None) -> np.ndarray:
+        """Index of the first live zone covering each point, or -1."""
+        hits = np.full(len(points), -1, dtype=np.int64)
+        if self.tree is None or not len(points):
+            return hits
+        pairs = self.tree.query(points, predicate="intersects")
+        if pairs.size and self.expires is not None:
+            now = time.time() if now is None else now
+            pairs = pairs[:, self.expires[pairs[1]] > now]
+        if pairs.size:
+            best = np.full(len(points), len(self.geoms), dtype=np.int64)
+            np.minimum.at(best, pairs[0], pairs[1])
+            found = best < len(self.geoms)
+            hits[found] = best[found]
+        return hits
+
+
+_KM_PER_DEG = 6371.0 * np.pi / 180.0
+
+
+class ZoneEdgeIndex:
+    """Nearest-edge distance from a point to a set of zone polygons.
+
+    Every ring edge is stored as a segment and indexed by its bounding box in
+    an STRtree. A query with a distance cap only looks at the segments whose
+    boxes intersect the cap's lat/lon window (so "no zone within N km" is
+    answered without computing any distance), then locates the closest
+    point on each candidate segment in a local equirectangular
+    projection centred on the query point, reporting the great-circle distance
+    to it. Unlike a vertex scan this is the distance to the polygon boundary.
+    """
+
+    __slots__ = ("lat1", "lon1", "lat2", "lon2", "tree")
+
+    def __init__(self, geoms: Sequence[object]) -> None:
+        segs = []
+        for geom in geoms:
+            boundary = shapely.get_coordinates(shapely.boundary(geom), return_index=True)
+            coords, ring_ids = boundary
+            if len(coords) < 2:
+                continue
+            same_ring = ring_ids[1:] == ring_ids[:-1]
+            segs.append(np.column_stack((coords[:-1], coords[1:]))[same_ring])
+        seg = np.concatenate(segs) if segs else np.zeros((0, 4))
+        # columns: lon1, lat1, lon2, lat2
+        self.lon1, self.lat1, self.lon2, self.lat2 = (seg[:, i].copy() for i in range(4))
+        if len(seg):
+            boxes = shapely.box(
+                np.minimum(self.lon1, self.lon2),
+                np.minimum(self.lat1, self.lat2),
+                np.maximum(self.lon1, self.lon2),
+                np.maximum(self.lat1, self.lat2),
+            )
+            self.tree = STRtree(boxes)
+        else:
+            self.tree = None
+
+    def __len__(self) -> int:
+        return len(self.lat1)
+
+    def nearest_within(self, lat: float, lon: float, max_km: float) -> Optional[float]:
+        """Distance in km to the closest edge, or None when none lies within ``max_km``."""
+        if self.tree is None:
+            return None
+        cos_lat = max(np.cos(np.radians(lat)), 1e-6)
+        dlat = max_km / _KM_PER_DEG
+        dlon = min(180.0, max_km / (_KM_PER_DEG * cos_lat))
+        cand = self.tree.query(shapely.box(lon - dlon, lat - dlat, lon + dlon, lat + dlat))
+        if not len(cand):
+            return None
+        # local equirectangular projection (km) centred on the query point
+        ax = (self.lon1[cand] - lon) * _KM_PER_DEG * cos_lat
+        ay = (self.lat1[cand] - lat) * _KM_PER_DEG
+        bx = (self.lon2[cand] - lon) * _KM_PER_DEG * cos_lat
+        by = (self.lat2[cand] - lat) * _KM_PER_DEG
+        ex, ey = bx - ax, by - ay
+        length_sq = ex * ex + ey * ey
+        t = np.divide(-(ax * ex + ay * ey), length_sq, out=np.zeros_like(ax), where=length_sq > 0)
+        t = np.clip(t, 0.0, 1.0)
+        # great-circle distance to each candidate's closest point keeps long ranges honest
+        near_lat = self.lat1[cand] + t * (self.lat2[cand] - self.lat1[cand])
+        near_lon = self.lon1[cand] + t * (self.lon2[cand] - self.lon1[cand])
+        dist = float(np.min(haversine_km_array(lat, lon, near_lat, near_lon)))
+        return dist if dist <= max_km else None
+
+    def distance_km(self, lat: float, lon: float, max_km: float = 20000.0) -> float:
+        """Distance to the closest edge, widening the search window geometrically."""
+        radius = 10.0
+        while True:
+            d = self.nearest_within(lat, lon, min(radius, max_km))
+            if d is not None:
+                return d
+            if radius >= max_km or self.tree is None:
+                return 9999.0
+            radius *= 4.0
+
+
+class ZoneIndex:
+    """STRtree-backed zone lookup covering static and dynamic zones.
+
+    Static and dynamic zones live in separate trees so that creating or
+    expiring a dynamic zone only rebuilds the (small) dynamic tree, while a
+    static upload or reload rebuilds only the static one.
+    """
+
+    def __init__(self) -> None:
+        self._static = _ZoneTree([])
+        self._dynamic = _ZoneTree([])
+        self.static_edges = ZoneEdgeIndex([])
+
+    @property
+    def static_count(self) -> int:
+        return len(self._static)
+
+    @property
+    def dynamic_count(self) -> int:
+        return len(self._dynamic)
+
+    def set_static(self, zones: Iterable[Dict[str, object]]) -> int:
+        """Rebuild the static tree from zone dicts; invalid geometries are skipped."""
+        entries = []
+        for z in zones:
+            try:
+                geom = parse_zone_geometry(z["geojson"])
+            except Exception as e:
+                print(f"[zones] Skipping invalid zone {z.get('zone_id')}: {e}")
+                continue
+            entries.append((_zone_meta(z, z.get("zone_id"), False), geom))
+        self._static = _ZoneTree(entries)
+        self.static_edges = ZoneEdgeIndex([g for _, g in entries])
+        return len(entries)
+
+    def set_dynamic(self, zones: Iterable[Tuple[object, Dict[str, object]]]) -> int:
+        """Rebuild the dynamic tree from ``(zone_id, zone)`` pairs.
+
+        ``zone`` may carry a pre-parsed ``geometry``; otherwise its ``geojson``
+        is parsed here. Zones with an ``expires_at`` datetime are ignored by
+        lookups from that instant on, even before the tree is rebuilt.
+        """
+        entries = []
+        expires = []
+        for zid, zd in zones:
+            geom = zd.get("geometry")
+            if geom is None:
+                try:
+                    geom = parse_zone_geometry(zd["geojson"])
+                except Exception:
+                    continue
+            entries.append((_zone_meta(zd, zid, True), geom))
+            exp = zd.get("expires_at")
+            expires.append(exp.timestamp() if isinstance(exp, datetime) else np.inf)
+        self._dynamic = _ZoneTree(entries, expires)
+        return len(entries)
+
+    def lookup(
+        self, lat: float, lon: float, now: Optional[float] = None
+    ) -> Optional[Dict[str, object]]:
+        """Return zone metadata if the point lies inside or on the boundary of any zone."""
+        return self.lookup_many([lat], [lon], now=now)[0]
+
+    def lookup_many(
+        self, lats: Sequence[float], lons: Sequence[float], now: Optional[float] = None
+    ) -> List[Optional[Dict[str, object]]]:
+        """Vectorised :meth:`lookup` for many points in one tree query per zone set."""
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        out: List[Optional[Dict[str, object]]] = [None] * len(points)
+        dynamic_hits = self._dynamic.first_hits(points, now=now)
+        pending = np.flatnonzero(dynamic_hits < 0)
+        for i in np.flatnonzero(dynamic_hits >= 0):
+            out[i] = dict(self._dynamic.meta[dynamic_hits[i]])
+        if len(pending):
+            static_hits = self._static.first_hits(points[pending])
+            for i, hit in zip(pending, static_hits):
+                if hit >= 0:
+                    out[i] = dict(self._static.meta[hit])
+        return out
+
+
+class DynamicZoneRegistry:
+    """Ephemeral zones with geometry parsed once and expiries kept in a heap.
+
+    ``add`` parses, validates and prepares the GeoJSON up front so lookups
+    never touch raw GeoJSON. Expiries are kept in a min-heap keyed by
+    ``expires_at``; ``pop_expired`` removes due zones in O(log n) each instead
+    of scanning every zone. Re-adding an existing ``zone_id`` replaces it in
+    place (insertion order is preserved) and leaves a stale heap entry that
+    is skipped when popped.
+
+    Thread-safe: zones are created on the request threadpool while the event
+    loop expires and syncs them, so every mutation and snapshot holds a lock.
+    """
+
+    def __init__(self) -> None:
+        self._zones: Dict[object, Dict[str, object]] = {}
+        self._heap: List[Tuple[float, int, object]] = []
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._zones)
+
+    def __contains__(self, zone_id: object) -> bool:
+        return zone_id in self._zones
+
+    def __iter__(self) -> Iterator[object]:
+        with self._lock:
+            return iter(list(self._zones))
+
+    def items(self) -> List[Tuple[object, Dict[str, object]]]:
+        """Snapshot of (zone_id, entry) pairs in insertion order."""
+        with self._lock:
+            return list(self._zones.items())
+
+    def get(self, zone_id: object) -> Optional[Dict[str, object]]:
+        return self._zones.get(zone_id)
+
+    def add(
+        self,
+        zone_id: object,
+        geojson: Dict[str, object],
+        expires_at: datetime,
+        name: Optional[str] = None,
+        risk_level: Optional[str] = None,
+    ) -> Dict[str, object]:
+        """Parse and register a zone; raises ValueError for unusable geometry."""
+        try:
+            geom = parse_zone_geometry(geojson)
+        except Exception as e:
+            raise ValueError(f"invalid zone geometry: {e}") from e
+        shapely.prepare(geom)
+        entry = {
+            "zone_id": zone_id,
+            "name": name or zone_id,
+            "geojson": geojson,
+            "geometry": geom,
+            "risk_level": risk_level,
+            "expires_at": expires_at,
+        }
+        with self._lock:
+            seq = entry["_seq"] = next(self._seq)
+            self._zones[zone_id] = entry
+            heapq.heappush(self._heap, (expires_at.timestamp(), seq, zone_id))
+        return entry
+
+    def remove(self, zone_id: object) -> bool:
+        """Drop a zone before its expiry (its heap entry is skipped when popped)."""
+        with self._lock:
+            return self._zones.pop(zone_id, None) is not None
+
+    def pop_expired(self, now: datetime) -> List[object]:
+        """Remove and return the ids of zones whose expiry is at or before ``now``."""
+        removed = []
+        cutoff = now.timestamp()
+        with self._lock:
+            while self._heap and self._heap[0][0] <= cutoff:
+                _, seq, zone_id = heapq.heappop(self._heap)
+                entry = self._zones.get(zone_id)
+                if entry is not None and entry["_seq"] == seq:
+                    del self._zones[zone_id]
+                    removed.append(zone_id)
+        return removed
+
+    def next_expiry(self) -> Optional[float]:
+        """POSIX timestamp of the earliest pending expiry, if any."""
+        with self._lock:
+            while self._heap:
+                _, seq, zone_id = self._heap[0]
+                entry = self._zones.get(zone_id)
+                if entry is not None and entry["_seq"] == seq:
+                    return self._heap[0][0]
+                heapq.heappop(self._heap)
+        return None
+
+
+__all__ = ["DynamicZoneRegistry", "ZoneEdgeIndex", "ZoneIndex", "parse_zone_geometry"]